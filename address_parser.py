@@ -0,0 +1,126 @@
+"""
+Розбір адреси території на частини: вулиця, будинок, під'їзд, діапазон квартир.
+
+Назви територій мають вигляд "вул. 24 Серпня 1 - 2 під. кв. 37-72",
+"пров. Ключний 7 - 5 під.  кв. 179-216", "вул. Яблунева 1 - (корп.2) 1 під. кв. 1-34"
+або "вул. Бандери (непарні), Євгена Коновальця (парні)". Для кількох вулиць
+береться перша; те, що не вдалося розібрати, лишається None.
+"""
+import re
+from typing import Dict, Optional, Tuple
+
+# Колонки territories, у які записуються частини адреси (у цьому порядку)
+ADDRESS_COLUMNS = ('street', 'street_key', 'building', 'entrance', 'apt_from', 'apt_to')
+
+# Тип вулиці: варіант написання -> скорочення для відображення
+STREET_TYPES = {
+    'вулиця': 'вул.', 'вул': 'вул.',
+    'провулок': 'пров.', 'пров': 'пров.',
+    'проспект': 'просп.', 'просп': 'просп.',
+    'бульвар': 'бульв.', 'бульв': 'бульв.',
+    'площа': 'пл.', 'пл': 'пл.',
+}
+_TYPE_PATTERN = '|'.join(sorted(STREET_TYPES, key=len, reverse=True))
+_LEADING_TYPE = re.compile(rf'^\s*({_TYPE_PATTERN})\b\s*\.?\s*', re.IGNORECASE)
+_TRAILING_TYPE = re.compile(rf'\s+({_TYPE_PATTERN})\s*\.?\s*$', re.IGNORECASE)
+_APOSTROPHES = re.compile("['’ʼ]")
+
+# Вулиця (може починатися з числа: "24 Серпня"), далі номер будинку з літерою
+_STREET_BUILDING = re.compile(r'^(?P<street>[^,()]+?)\s+(?P<number>\d+)\s*(?P<letter>[^\W\d_])?(?=[\s,()-]|$)')
+_STREET_ONLY = re.compile(r'^(?P<street>[^,()\s][^,()]*)')
+_CORPUS = re.compile(r'корп\w*\s*\.?\s*(\d+)', re.IGNORECASE)
+_ENTRANCE = re.compile(r"(\d+)\s*(?:-?\s*й\s*)?під(?:\.|'?їзд\b(?!ів))", re.IGNORECASE)
+_APARTMENTS = (
+    # "кв. 1-36", "кв.  1-27а", "кв. 50"
+    re.compile(r'кв\w*\s*\.?\s*(\d+)\s*[^\W\d_]?(?:\s*-\s*(\d+))?', re.IGNORECASE),
+    # "1-24 кв."
+    re.compile(r'(\d+)\s*-\s*(\d+)\s*[^\W\d_]?\s*кв', re.IGNORECASE),
+)
+
+
+def _clean(text: str) -> str:
+    return ' '.join(_APOSTROPHES.sub("'", text or '').split())
+
+
+def normalize_street(name: str) -> str:
+    """Ключ вулиці для пошуку й групування: без типу, регістру, апострофів і зайвих пробілів"""
+    name = _LEADING_TYPE.sub('', _clean(name))
+    name = _TRAILING_TYPE.sub('', name)
+    return ' '.join(_APOSTROPHES.sub('', name).casefold().split())
+
+
+def normalize_building(number: str, letter: Optional[str] = None, corpus: Optional[str] = None) -> str:
+    """Номер будинку: '7а' -> '7А', корпус - через '/': '1/2'"""
+    building = f"{int(number)}{(letter or '').upper()}"
+    return f"{building}/{int(corpus)}" if corpus else building
+
+
+def _split_street(street: str) -> Tuple[str, Optional[str]]:
+    """('Ключний', 'пров.') з 'Ключний пров.' чи 'пров. Ключний'"""
+    street = street.strip(' -.')
+    for pattern in (_LEADING_TYPE, _TRAILING_TYPE):
+        match = pattern.search(street)
+        if match:
+            return pattern.sub('', street).strip(' -.'), STREET_TYPES[match.group(1).lower()]
+    return street, None
+
+
+def parse_address(text: str, strict: bool = False) -> Dict[str, Optional[object]]:
+    """
+    Частини адреси з назви території чи запиту користувача:
+    {'street', 'street_key', 'building', 'entrance', 'apt_from', 'apt_to'}.
+    street - назва для відображення ("вул. Симоненка"), street_key - normalize_street.
+    Одна квартира ("кв. 50") дає apt_from == apt_to. strict - адресою вважається
+    лише текст з типом вулиці ("вул.", "пров." ...), як у назвах територій;
+    у запитах користувача тип можна не писати.
+    """
+    result = dict.fromkeys(ADDRESS_COLUMNS)
+    if not isinstance(text, str):
+        return result
+    text = _clean(text)
+    type_match = _LEADING_TYPE.match(text)
+    if not text or (not type_match and not text[0].isalnum()):
+        return result
+    rest = text[type_match.end():] if type_match else text
+
+    match = _STREET_BUILDING.match(rest)
+    if match:
+        corpus = _CORPUS.search(rest, match.end())
+        result['building'] = normalize_building(match.group('number'), match.group('letter'),
+                                                corpus.group(1) if corpus else None)
+        tail = rest[match.end():]
+    else:
+        match = _STREET_ONLY.match(rest)
+        if not match:
+            return result
+        tail = ''
+
+    name, street_type = _split_street(match.group('street'))
+    if type_match:
+        street_type = STREET_TYPES[type_match.group(1).lower()]
+    if not name or (strict and not street_type):
+        return dict.fromkeys(ADDRESS_COLUMNS)
+    result['street'] = f"{street_type} {name}" if street_type else name
+    result['street_key'] = normalize_street(name)
+
+    if tail:
+        entrance = _ENTRANCE.search(tail)
+        if entrance:
+            result['entrance'] = int(entrance.group(1))
+        for pattern in _APARTMENTS:
+            apartments = pattern.search(tail)
+            if apartments:
+                first = int(apartments.group(1))
+                last = int(apartments.group(2)) if apartments.group(2) else first
+                result['apt_from'], result['apt_to'] = min(first, last), max(first, last)
+                break
+    return result
+
+
+def address_values(text: str) -> Tuple:
+    """Значення ADDRESS_COLUMNS для INSERT/UPDATE; нерозібрана адреса має street_key ''"""
+    parts = parse_address(text, strict=True)
+    if parts['street_key'] is None:
+        # '' замість NULL: NULL означає "ще не розібрано" (див. SQLiteDB)
+        parts['street_key'] = ''
+    return tuple(parts[column] for column in ADDRESS_COLUMNS)
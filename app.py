@@ -1,20 +1,45 @@
-from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, jsonify
+from dotenv import load_dotenv
+
+# Load environment variables (до імпорту модулів, які читають налаштування)
+load_dotenv()
+
+import startup_profile
+startup_profile.install_import_timer()
+
+from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, jsonify, Response, stream_with_context, g
 import os
+import json
 from datetime import datetime, timedelta
 import hashlib
-from dotenv import load_dotenv
+from werkzeug.security import safe_join
 import logging
+import threading
+import time
 from db_factory import DBFactory
-from backup_manager import backup_important_data, restore_from_backup
-import shutil
-
-# Load environment variables
-load_dotenv()
+from sqlite_db import SQLiteDB, TERRITORY_FIELDS
+from backup_manager import restore_from_backup, backup_jobs, get_backup_dir
+from sheets_outbox import OutboxWorker
+from image_index import ImageIndex
+from image_pipeline import DerivativeStore, is_jpeg
+from fragment_cache import FragmentCache
+from territory_pack import build_pack, pack_diff
+from compression import compress_response, send_precompressed
+import asset_sync
+import request_profile
+import metrics
 
 app = Flask(__name__, static_folder='static')
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 app.permanent_session_lifetime = timedelta(minutes=20)  # Встановлюємо час життя сесії 20 хвилин
 
+# Статика віддається з готовими .br/.gz копіями (python compression.py static під час збірки)
+def send_static_precompressed(filename):
+    with request_profile.timer('fs'):
+        return send_precompressed(app.static_folder, filename, request.accept_encodings,
+                                  max_age=app.get_send_file_max_age(filename))
+
+app.view_functions['static'] = send_static_precompressed
+
 # Додаємо конфігурацію для базового URL
 app.config['BASE_URL'] = os.environ.get('BASE_URL', 'https://territoryapp-production.up.railway.app')
 
@@ -28,27 +53,104 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Замінюємо створення db на використання фабрики
-db = DBFactory.get_db()
+# Профілювання запитів (REQUEST_PROFILE=true): Server-Timing і звіт /debug/perf.
+# wait_for_events - це очікування нових подій у потоці SSE, а не робота бази
+request_profile.instrument(SQLiteDB, 'db', exclude=('wait_for_events',))
+request_profile.instrument(ImageIndex, 'fs', names=('get', 'images', 'refresh', 'digest'))
+request_profile.instrument_templates(app.jinja_env)
+# Метрики /metrics: тривалість і кількість викликів бази (очікування подій SSE не рахуємо)
+metrics.instrument(SQLiteDB, metrics.DB_DURATION, metrics.DB_ERRORS, exclude=('wait_for_events',))
+
+# База відкривається ліниво: звірка файлу бази та схема - у фоновій ініціалізації
+db = DBFactory.get_db(lazy=True)
+
+# Зміни в Google таблицю відправляються фоновим обробником черги, а не в запиті
+outbox_worker = OutboxWorker(db)
 
 # Налаштування шляхів для завантаження
 UPLOAD_FOLDER = os.path.join(os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', 'data'), 'uploads')
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Копіюємо існуючі фотографії при першому запуску
-static_territories = 'static/uploads/territories'
-if os.path.exists(static_territories):
-    for filename in os.listdir(static_territories):
-        src = os.path.join(static_territories, filename)
-        dst = os.path.join(UPLOAD_FOLDER, filename)
-        if os.path.isfile(src) and not os.path.exists(dst):
-            os.makedirs(os.path.dirname(dst), exist_ok=True)
-            shutil.copy2(src, dst)
-            print(f"Скопійовано фото: {filename}")
-
+static_territories = asset_sync.STATIC_TERRITORIES
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Індекс фотографій: спочатку Volume, потім static
+image_index = ImageIndex([
+    (UPLOAD_FOLDER, '/uploads'),
+    (static_territories, '/static/uploads/territories')
+])
+
+# Зменшені копії фото (thumb/card/full) створюються у фоні пулом процесів
+derivatives = DerivativeStore(os.path.join(UPLOAD_FOLDER, 'derivatives'), image_index.digest)
+
+def background_init():
+    """
+    Ініціалізація, яка не потрібна для першої відповіді: звірка файлу бази,
+    запуск синхронізації з Google Sheets, синхронізація та індексація фото.
+    """
+    try:
+        with startup_profile.phase('db: звірка файлу та схема'):
+            db.resolve()
+        if os.environ.get('SHEETS_SYNC_ENABLED', 'True').lower() == 'true':
+            outbox_worker.start()
+        # Фото зі static копіюються у Volume командою asset_sync.py; тут лише
+        # перевіряємо манифест і за потреби синхронізуємо
+        with startup_profile.phase('asset sync'):
+            if not asset_sync.is_up_to_date(static_territories, UPLOAD_FOLDER):
+                asset_sync.sync_assets(static_territories, UPLOAD_FOLDER)
+        with startup_profile.phase('image index'):
+            image_index.preload_digests(asset_sync.manifest_digests(UPLOAD_FOLDER))
+            images = image_index.images()
+        derivatives.build(images)
+    except Exception as e:
+        logger.error(f"Помилка фонової ініціалізації: {str(e)}")
+    startup_profile.report('Фонова ініціалізація')
+
+def schedule_startup_backup():
+    """Резервна копія при старті - у фоні із затримкою, щоб не гальмувати запуск"""
+    if os.environ.get('STARTUP_BACKUP', 'True').lower() != 'true':
+        return
+    # Через backup_jobs: не перетинається з бекапом, запущеним вручну чи за розкладом
+    timer = threading.Timer(float(os.environ.get('STARTUP_BACKUP_DELAY', '60')), backup_jobs.start)
+    timer.daemon = True
+    timer.start()
+
+def periodic_backups(interval):
+    """Інкрементальні резервні копії кожні interval секунд"""
+    while True:
+        time.sleep(interval)
+        backup_jobs.start(mode='incremental')
+
+def periodic_optimize(interval):
+    """Періодичний PRAGMA optimize для довгоживучого процесу"""
+    while True:
+        time.sleep(interval)
+        try:
+            db.optimize()
+        except Exception as e:
+            logger.error(f"Помилка PRAGMA optimize: {str(e)}")
+
+def schedule_periodic_jobs():
+    interval = float(os.environ.get('BACKUP_INTERVAL', '0'))
+    if interval > 0:
+        threading.Thread(target=periodic_backups, args=(interval,), name='periodic-backups', daemon=True).start()
+    optimize_interval = float(os.environ.get('SQLITE_OPTIMIZE_INTERVAL', str(6 * 3600)))
+    if optimize_interval > 0:
+        threading.Thread(target=periodic_optimize, args=(optimize_interval,), name='sqlite-optimize', daemon=True).start()
+
+# python app.py з FLASK_DEBUG запускає reloader: батьківський процес Werkzeug
+# лише стежить за файлами і перезапускає дочірній, який і обслуговує запити
+FLASK_DEBUG = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
+RELOADER_PARENT = __name__ == '__main__' and FLASK_DEBUG and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+if not RELOADER_PARENT:
+    # Фонові потоки - лише в процесі, що обслуговує запити, інакше з reloader'ом
+    # працювали б два обробники черги і дублювались би бекапи
+    threading.Thread(target=background_init, name='background-init', daemon=True).start()
+    schedule_startup_backup()
+    schedule_periodic_jobs()
+
 # Створюємо функцію для отримання повного URL
 def get_full_url(path):
     if app.debug:
@@ -60,6 +162,31 @@ def get_full_url(path):
 def utility_processor():
     return dict(get_full_url=get_full_url)
 
+if request_profile.ENABLED:
+    # Зареєстровано першими: before_request виконується першим, after_request - останнім
+    @app.before_request
+    def start_request_profile():
+        request_profile.start_request()
+
+    @app.after_request
+    def finish_request_profile(response):
+        request_profile.finish_request(request.endpoint, request.method, response)
+        return response
+
+# Одразу після профілювання: час запиту для /metrics включає решту обробників і стиснення
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        endpoint = request.endpoint or '<unmatched>'
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - started, request.method, endpoint)
+        metrics.REQUESTS.inc(request.method, endpoint, str(response.status_code))
+    return response
+
 @app.before_request
 def check_session_timeout():
     if 'logged_in' in session:
@@ -76,6 +203,12 @@ def check_session_timeout():
         # Оновлюємо час останньої активності
         session['last_activity'] = now.isoformat()
 
+@app.after_request
+def compress_dynamic_response(response):
+    """gzip/brotli для HTML і JSON, більших за COMPRESS_MIN_SIZE"""
+    with request_profile.timer('compress'):
+        return compress_response(response, request.accept_encodings)
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -108,53 +241,184 @@ def login():
         
     return render_template('login.html')
 
+# Готові картки територій: перерендерюються лише ті, що змінились
+card_cache = FragmentCache()
+
+def collect_cache_metrics():
+    """Лічильники кешів уже є в об'єктах - для /metrics лише копіюємо їх"""
+    metrics.CACHE_HITS.set_total(card_cache.hits, 'cards')
+    metrics.CACHE_MISSES.set_total(card_cache.misses, 'cards')
+    metrics.CACHE_SIZE.set(card_cache.stats()['size'], 'cards')
+    metrics.CACHE_HITS.set_total(db.snapshot_hits, 'territories')
+    metrics.CACHE_MISSES.set_total(db.snapshot_misses, 'territories')
+
+metrics.register_collector(collect_cache_metrics)
+
+def territory_card(territory, is_admin, card_macro=None):
+    """HTML картки території; ключ кешу - (id, row_version, роль)"""
+    card_macro = card_macro or app.jinja_env.get_template('macros.html').module.territory_card
+    role = 'admin' if is_admin else 'viewer'
+    url_root = request.url_root
+    image_url = image_index.image_url(territory['id'])
+    
+    territory_tuple = (
+        territory['id'],
+        territory['name'] or f"Територія {territory['id']}",
+        territory['status'],
+        territory['taken_by'],
+        territory['date_taken'],
+        territory['date_due'],
+        territory['notes'],
+        image_url is not None,  # has_image
+        image_url
+    )
+    # Чи наближається дата здачі - обчислено в SQL (date_due_iso)
+    is_overdue = territory['status'] == 'Взято' and territory['is_due_soon']
+
+    def render():
+        with request_profile.timer('tpl'):
+            return card_macro(territory_tuple, is_overdue, is_admin, url_root)
+
+    return card_cache.get_or_render(
+        (territory['id'], territory['row_version'], role),
+        (territory_tuple, is_overdue, url_root),
+        render
+    )
+
+def territory_cards(territories, is_admin):
+    """HTML карток ([взяті], [вільні])"""
+    card_macro = app.jinja_env.get_template('macros.html').module.territory_card
+    taken = []
+    free = []
+    
+    for territory in territories:
+        card = territory_card(territory, is_admin, card_macro)
+        
+        # Розділяємо території на взяті та вільні
+        if territory['status'] == 'Взято':
+            taken.append(card)
+        else:
+            free.append(card)
+    return taken, free
+
 @app.route('/')
 def index():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
 
     try:
-        territories = db.get_all_territories()
-        
-        # Розділяємо території на взяті та вільні
-        taken = []
-        free = []
-        
-        for territory in territories:
-            # Check if image exists for this territory
-            image_path = os.path.join(app.static_folder, 'uploads', 'territories', f"{territory['id']}.jpg")
-            has_image = os.path.exists(image_path)
-            
-            territory_tuple = (
-                territory['id'],
-                territory['name'] or f"Територія {territory['id']}",
-                territory['status'],
-                territory['taken_by'],
-                territory['date_taken'],
-                territory['date_due'],
-                territory['notes'],
-                has_image  # Add has_image as the last element of tuple
-            )
-            
-            if territory['status'] == 'Взято':
-                # Перевіряємо чи наближається дата здачі
-                due_date = datetime.strptime(territory['date_due'], '%d.%m.%Y') if territory['date_due'] else None
-                is_due_soon = False
-                if due_date:
-                    days_left = (due_date - datetime.now()).days
-                    is_due_soon = days_left <= 10
-                taken.append((territory_tuple, is_due_soon))
-            else:
-                free.append(territory_tuple)
-        
+        is_admin = session.get('role') == 'admin'
+        # id останньої події читаємо до територій: зміни між цими запитами
+        # прийдуть через /events ще раз, а не загубляться
+        last_event_id = db.last_event_id()
+        taken, free = territory_cards(db.get_all_territories(), is_admin)
         return render_template('index.html', 
                             taken=taken, 
                             free=free, 
-                            is_admin=(session.get('role') == 'admin'))
+                            is_admin=is_admin,
+                            last_event_id=last_event_id)
     except Exception as e:
         logger.error(f"Помилка при отриманні даних: {str(e)}")
         return "Помилка при отриманні даних", 500
 
+# Живе оновлення головної сторінки (Server-Sent Events)
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', '3000'))
+# Як часто перевіряти зміни інших процесів (у своєму процесі очікування будиться одразу)
+SSE_POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', '2'))
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', '15'))
+SSE_BATCH = 200
+
+def sse_message(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+def territory_events(last_id):
+    """
+    Потік подій після last_id: спочатку пропущені (з журналу territory_events),
+    далі нові. Якщо пропущені вже видалено з журналу - подія reset, після якої
+    клієнт перезавантажує всі картки через /cards.
+    """
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    seq = db.events_seq()
+    idle = 0.0
+    while True:
+        events = db.get_events_after(last_id, SSE_BATCH)
+        if events is None:
+            last_id = db.last_event_id()
+            yield sse_message({'last_event_id': last_id}, 'reset', last_id)
+            continue
+        for event in events:
+            last_id = event['id']
+            yield sse_message(event['data'], event['event'], event['id'])
+        if len(events) == SSE_BATCH:
+            continue
+        if events:
+            idle = 0.0
+        new_seq = db.wait_for_events(seq, SSE_POLL_SECONDS)
+        if new_seq == seq:
+            idle += SSE_POLL_SECONDS
+            if idle >= SSE_KEEPALIVE_SECONDS:
+                # Коментар не дає проксі закрити неактивне з'єднання
+                idle = 0.0
+                yield ": keepalive\n\n"
+        seq = new_seq
+
+@app.route('/events')
+def events():
+    """
+    Події змін територій (SSE): event territory - {id, status, taken_by, date_taken, date_due},
+    event history - історію території очищено. Після обриву EventSource
+    перепідключається із заголовком Last-Event-ID і отримує пропущене.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Потрібна авторизація'}), 401
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id not in (None, '') else db.last_event_id()
+    except ValueError:
+        return jsonify({'error': 'Неправильний Last-Event-ID'}), 400
+    return Response(
+        stream_with_context(territory_events(last_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/cards')
+def cards():
+    """
+    Готові картки для оновлення сторінки без перезавантаження: ?ids=1,2,3 -
+    вказані території (відсутні - у missing), без ids - усі.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Потрібна авторизація'}), 401
+    try:
+        ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'Неправильний список id'}), 400
+    try:
+        is_admin = session.get('role') == 'admin'
+        territories = db.get_territories(ids) if ids else db.get_all_territories()
+        card_macro = app.jinja_env.get_template('macros.html').module.territory_card
+        items = [{
+            'id': territory['id'],
+            'taken': territory['status'] == 'Взято',
+            'html': str(territory_card(territory, is_admin, card_macro))
+        } for territory in territories]
+        found = {item['id'] for item in items}
+        return jsonify({
+            'items': items,
+            'missing': [territory_id for territory_id in ids if territory_id not in found],
+            'complete': not ids
+        })
+    except Exception as e:
+        logger.error(f"Помилка при отриманні карток: {str(e)}")
+        return jsonify({'error': 'Помилка при отриманні карток'}), 500
+
 @app.route('/update/<territory_id>', methods=['GET', 'POST'])
 def update_territory(territory_id):
     if not session.get('logged_in'):
@@ -174,16 +438,13 @@ def update_territory(territory_id):
             taken_by = request.form['taken_by'].strip()
             notes = request.form['notes'].strip()
             
+            photo = request.files.get('photo')
+            if photo and photo.filename:
+                if not save_territory_photo(territory_id, photo):
+                    return "Підтримуються лише фото у форматі JPG", 400
+            
             if taken_by:
-                # Використовуємо поточну дату або передану дату
-                now = datetime.now()
-                if 'date_taken' in request.form and request.form['date_taken']:
-                    date_taken = datetime.strptime(request.form['date_taken'], '%Y-%m-%d').strftime('%d.%m.%Y')
-                else:
-                    date_taken = now.strftime('%d.%m.%Y')
-
-                # Для планової дати повернення
-                date_due = (datetime.strptime(date_taken, '%d.%m.%Y') + timedelta(days=120)).strftime('%d.%m.%Y')
+                date_taken, date_due = assignment_dates(request.form.get('date_taken'))
 
                 # Оновлюємо дані території
                 db.update_territory(territory_id, {
@@ -213,6 +474,9 @@ def update_territory(territory_id):
         territory = db.get_territory(territory_id)
         if not territory:
             return "Територію не знайдено", 404
+        image = image_index.get(territory_id)
+        territory['image_url'] = image_index.versioned_url(image)
+        territory['picture'] = derivatives.picture(image)
 
         history = db.get_territory_history(territory_id)
         
@@ -227,6 +491,33 @@ def update_territory(territory_id):
         logger.error(f"Помилка при отриманні даних території {territory_id}: {str(e)}")
         return f"Помилка при отриманні даних території: {str(e)}", 500
 
+def assignment_dates(date_taken=None):
+    """Дата видачі (передана у форматі YYYY-MM-DD або поточна) і планова дата повернення, dd.mm.YYYY"""
+    # Використовуємо поточну дату або передану дату
+    taken = datetime.strptime(date_taken, '%Y-%m-%d') if date_taken else datetime.now()
+    # Для планової дати повернення
+    due = taken + timedelta(days=120)
+    return taken.strftime('%d.%m.%Y'), due.strftime('%d.%m.%Y')
+
+def save_territory_photo(territory_id, photo):
+    """Зберігає завантажене фото території у Volume та оновлює індекс фото"""
+    ext = os.path.splitext(photo.filename)[1].lower()
+    if ext not in ('.jpg', '.jpeg') or not is_jpeg(photo.stream):
+        return False
+    # Через тимчасовий файл: перерване завантаження не зіпсує наявне фото
+    path = os.path.join(app.config['UPLOAD_FOLDER'], f"{territory_id}.jpg")
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        photo.save(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    image_index.refresh()
+    derivatives.build([image_index.get(territory_id)])
+    logger.info(f"Завантажено нове фото для території {territory_id}")
+    return True
+
 @app.route('/release/<territory_id>', methods=['POST'])
 def release_territory(territory_id):
     if not session.get('logged_in') or session.get('role') != 'admin':
@@ -258,6 +549,57 @@ def release_territory(territory_id):
         logger.error(f"Помилка при звільненні території {territory_id}: {str(e)}")
         return "Помилка при звільненні території", 500
 
+@app.route('/bulk_update', methods=['POST'])
+def bulk_update():
+    """
+    Видає або звільняє багато територій одним запитом (одна транзакція і один пакет для Google Sheets).
+    JSON: {"action": "assign", "territory_ids": [...], "taken_by": "...", "date_taken": "YYYY-MM-DD", "notes": "..."}
+    або {"action": "release", "territory_ids": [...]}; для змішаних змін - {"changes": [{"territory_id", "action", ...}, ...]}.
+    """
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({'error': 'Немає прав для цієї дії'}), 403
+
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('changes')
+    if items is None:
+        items = [dict(payload, territory_id=territory_id) for territory_id in payload.get('territory_ids', [])]
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Не передано жодної території'}), 400
+
+    try:
+        changes = []
+        for item in items:
+            territory_id = int(item['territory_id'])
+            action = item.get('action')
+            if action == 'assign':
+                taken_by = (item.get('taken_by') or '').strip()
+                if not taken_by:
+                    return jsonify({'error': f'Не вказано, хто бере територію {territory_id}'}), 400
+                date_taken, date_due = assignment_dates(item.get('date_taken'))
+                change = {
+                    'territory_id': territory_id,
+                    'status': 'Взято',
+                    'taken_by': taken_by,
+                    'date_taken': date_taken,
+                    'date_due': date_due
+                }
+            elif action == 'release':
+                # Вже вільні території пропускає bulk_update_territories (у відповіді - skipped)
+                change = {'territory_id': territory_id, 'status': 'Вільна'}
+            else:
+                return jsonify({'error': f'Невідома дія: {action}'}), 400
+            if 'notes' in item:
+                change['notes'] = (item['notes'] or '').strip()
+            changes.append(change)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Неправильні дані запиту: {str(e)}'}), 400
+
+    try:
+        return jsonify(db.bulk_update_territories(changes))
+    except Exception as e:
+        logger.error(f"Помилка при пакетному оновленні територій: {str(e)}")
+        return jsonify({'error': 'Помилка при пакетному оновленні територій'}), 500
+
 @app.route('/clear_history/<territory_id>', methods=['POST'])
 def clear_history(territory_id):
     if not session.get('logged_in') or session.get('role') != 'admin':
@@ -277,15 +619,136 @@ def clear_history(territory_id):
 
 @app.route('/backup', methods=['POST'])
 def create_backup():
-    """Створює резервну копію важливих даних."""
-    backup_important_data()
-    return jsonify({'message': 'Резервну копію створено успішно'})
+    """Запускає резервне копіювання у фоні і повертає ідентифікатор завдання."""
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({'error': 'Немає прав для цієї дії'}), 403
+    job = backup_jobs.start(mode=request.values.get('mode'))
+    return jsonify({
+        'message': 'Резервне копіювання запущено',
+        'job': job,
+        'status_url': url_for('backup_status', job_id=job['id'])
+    }), 202
+
+@app.route('/backup/status')
+@app.route('/backup/status/<job_id>')
+def backup_status(job_id=None):
+    """Прогрес і результат завдання резервного копіювання (без job_id - останнього)."""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Потрібна авторизація'}), 401
+    job = backup_jobs.get(job_id) if job_id else backup_jobs.latest()
+    if job is None:
+        return jsonify({'error': 'Завдання не знайдено'}), 404
+    return jsonify(job)
 
 @app.route('/restore/<path:backup_file>', methods=['POST'])
 def restore_backup(backup_file):
-    """Відновлює дані з резервної копії."""
-    restore_from_backup(backup_file)
-    return jsonify({'message': 'Дані відновлено успішно'})
+    """
+    Відновлює дані з резервної копії (для ланцюжка - точку point, за замовчуванням останню).
+    backup_file - шлях у папці резервних копій, як у полі file з /backup/status.
+    """
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({'error': 'Немає прав для цієї дії'}), 403
+
+    backup_path = safe_join(get_backup_dir(), backup_file)
+    if backup_path is None or not os.path.exists(backup_path):
+        return jsonify({'error': f'Резервну копію не знайдено: {backup_file}'}), 404
+
+    point = request.values.get('point')
+    if point is not None:
+        try:
+            point = int(point)
+        except ValueError:
+            return jsonify({'error': 'Неправильний номер точки'}), 400
+
+    try:
+        restored_point = restore_from_backup(backup_path, point=point)
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Помилка при відновленні з резервної копії {backup_file}: {str(e)}")
+        return jsonify({'error': f'Помилка при відновленні даних: {str(e)}'}), 500
+    return jsonify({'message': 'Дані відновлено успішно', 'point': restored_point})
+
+@app.route('/debug/perf')
+def debug_perf():
+    """Час запитів по endpoint (p50/p95/p99), розподіл за категоріями і звіти cProfile"""
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return "Немає прав для цієї дії", 403
+    report = request_profile.report()
+    if request.args.get('format') == 'json':
+        return jsonify(report)
+    return render_template('perf.html', report=report)
+
+@app.route('/debug/perf/profile/<int:profile_id>')
+def debug_perf_profile(profile_id):
+    """Звіт cProfile одного запиту (pstats, за сукупним часом)"""
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return "Немає прав для цієї дії", 403
+    profile = request_profile.get_profile(profile_id)
+    if profile is None:
+        return "Звіт не знайдено", 404
+    header = f"{profile['endpoint']} - {profile['duration_ms']} мс, {profile['captured_at']}\n\n"
+    return app.response_class(header + profile['stats'], mimetype='text/plain')
+
+@app.route('/debug/perf/reset', methods=['POST'])
+def debug_perf_reset():
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return "Немає прав для цієї дії", 403
+    request_profile.reset()
+    return redirect(url_for('debug_perf'))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Метрики у текстовому форматі Prometheus (з усіх процесів, якщо задано
+    METRICS_MULTIPROC_DIR). З METRICS_TOKEN потрібен заголовок
+    Authorization: Bearer <токен>, без нього - сесія адміністратора.
+    """
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization', '') != f'Bearer {token}':
+            return "Немає прав для цієї дії", 403
+    elif not session.get('logged_in') or session.get('role') != 'admin':
+        return "Немає прав для цієї дії", 403
+
+    output = metrics.generate_latest()
+    try:
+        # Черга синхронізації спільна для всіх процесів, тож читається під час збору
+        status = db.get_outbox_status()
+        oldest = status['oldest_pending']
+        output += metrics.exposition({
+            'territory_sheets_outbox_items': {
+                'type': 'gauge', 'help': 'Записи черги синхронізації з Google Sheets',
+                'labelnames': ['status'], 'buckets': [],
+                'samples': {('pending',): status['pending'], ('failed',): status['failed']}
+            },
+            'territory_sheets_outbox_oldest_age_seconds': {
+                'type': 'gauge', 'help': 'Вік найстарішого запису, що очікує синхронізації',
+                'labelnames': [], 'buckets': [],
+                'samples': {(): oldest['age_seconds'] if oldest else 0}
+            }
+        })
+    except Exception as e:
+        logger.error(f"Помилка при отриманні стану черги для метрик: {str(e)}")
+    response = app.response_class(output, content_type=metrics.CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/sync/status')
+def sync_status():
+    """Стан черги синхронізації з Google Sheets."""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Потрібна авторизація'}), 401
+    try:
+        from google_integration import sheets
+        status = db.get_outbox_status()
+        status['sheets'] = sheets.health()
+        return jsonify(status)
+    except Exception as e:
+        logger.error(f"Помилка при отриманні стану синхронізації: {str(e)}")
+        return jsonify({'error': 'Помилка при отриманні стану синхронізації'}), 500
 
 @app.route('/courier')
 def courier_home():
@@ -299,43 +762,147 @@ def courier_home():
         free = []
         for territory in territories:
             if territory['status'] != 'Взято':
-                # Перевіряємо наявність фото
-                image_path = os.path.join(app.static_folder, 'uploads', 'territories', f"{territory['id']}.jpg")
-                has_image = os.path.exists(image_path)
+                image = image_index.get(territory['id'])
                 
                 territory_tuple = (
                     territory['id'],
                     territory['name'] or f"Територія {territory['id']}",
                     territory['status'],
                     territory['notes'],
-                    has_image
+                    image is not None,  # has_image
+                    image_index.versioned_url(image),
+                    derivatives.picture(image)
                 )
                 free.append(territory_tuple)
         
-        return render_template('courier.html', territories=free)
+        return render_template('courier.html', territories=free,
+                               pack_version=courier_pack(territories)['version'])
     except Exception as e:
         logger.error(f"Помилка при отриманні даних: {str(e)}")
         return "Помилка при отриманні даних", 500
 
+def courier_pack(territories=None):
+    """Офлайн-пакет вільних територій (версії записів - row_version і URL мініатюри)"""
+    if territories is None:
+        territories = db.get_all_territories()
+    return build_pack(territories, lambda territory_id: derivatives.thumbnail(image_index.get(territory_id)))
+
+@app.route('/courier/pack', methods=['GET', 'POST'])
+def courier_pack_data():
+    """
+    GET - увесь пакет (ETag - версія пакета, тож незмінений повертає 304).
+    POST {"version", "have": {id: версія запису}} - лише змінені записи і видалені id.
+    """
+    if not session.get('logged_in') or session.get('role') != 'courier':
+        return jsonify({'error': 'Потрібна авторизація'}), 401
+
+    try:
+        pack = courier_pack()
+    except Exception as e:
+        logger.error(f"Помилка при формуванні пакета територій: {str(e)}")
+        return jsonify({'error': 'Помилка при формуванні пакета територій'}), 500
+
+    if request.method == 'GET':
+        response = jsonify(pack)
+        response.set_etag(pack['version'])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    payload = request.get_json(silent=True) or {}
+    have = payload.get('have') or {}
+    if not isinstance(have, dict):
+        return jsonify({'error': 'have має бути об\'єктом {id: версія}'}), 400
+    try:
+        diff = pack_diff(pack, have)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Неправильні дані запиту: {str(e)}'}), 400
+    response = jsonify(diff)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/courier/manifest.webmanifest')
+def courier_manifest():
+    """Маніфест PWA: кур'єрський режим можна встановити на головний екран"""
+    manifest = {
+        'name': 'Вільні території | Вісник',
+        'short_name': 'Території',
+        'start_url': url_for('courier_home'),
+        'scope': url_for('courier_home'),
+        'display': 'standalone',
+        'background_color': '#f5f5f5',
+        'theme_color': '#4CAF50',
+        'icons': [{
+            'src': url_for('static', filename='icons/courier.svg'),
+            'sizes': 'any',
+            'type': 'image/svg+xml'
+        }]
+    }
+    response = app.response_class(json.dumps(manifest, ensure_ascii=False),
+                                  mimetype='application/manifest+json')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/courier-sw.js')
+def courier_service_worker():
+    """
+    Service worker кур'єрського режиму. Віддається з кореня сайту, бо з /static
+    його область дії обмежилася б /static; без кешування, щоб оновлення
+    воркера доходили одразу.
+    """
+    response = send_precompressed(app.static_folder, 'courier-sw.js', request.accept_encodings,
+                                  mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # Створюємо функцію для отримання повного URL
 def get_image_url(territory_id):
     """Повертає URL фотографії території"""
-    # Перевіряємо наявність фото в Volume
-    volume_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{territory_id}.jpg")
-    if os.path.exists(volume_path):
-        return f"/uploads/{territory_id}.jpg"
-    
-    # Якщо немає в Volume, перевіряємо в static
-    static_path = os.path.join('static/uploads/territories', f"{territory_id}.jpg")
-    if os.path.exists(static_path):
-        return f"/static/uploads/territories/{territory_id}.jpg"
-    
-    return None
+    return image_index.image_url(territory_id)
+
+# Фото з хешем у URL не змінюються - браузер може кешувати їх назавжди
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def send_photo(directory, filename):
+    """
+    Віддає фото території з ETag на основі хешу вмісту. send_file сам обробляє
+    If-None-Match (304) та Range (206). Запит з актуальною версією (?v=хеш)
+    кешується назавжди, без версії - браузер щоразу перевіряє ETag.
+    """
+    digest = None
+    with request_profile.timer('fs'):
+        path = safe_join(directory, filename)
+        if path and os.path.isfile(path):
+            stat = os.stat(path)
+            digest = image_index.digest({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+
+        response = send_from_directory(directory, filename, etag=digest or True, conditional=True)
+    if digest and request.args.get('v') == digest:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
     """Повертає файл з Volume"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_photo(app.config['UPLOAD_FOLDER'], filename)
+
+@app.route('/static/uploads/territories/<path:filename>')
+def static_territory_photo(filename):
+    """Повертає фото території зі static (перекриває загальний static-маршрут)"""
+    return send_photo(static_territories, filename)
+
+@app.route('/img/<digest>/<filename>')
+def territory_image_variant(digest, filename):
+    """Повертає зменшену копію фото території"""
+    path = derivatives.path_for(digest, filename)
+    if not path:
+        return "Файл не знайдено", 404
+    # Хеш вмісту вже є в шляху, тому ETag сталий, а кешувати можна назавжди
+    response = send_from_directory(os.path.dirname(path), filename,
+                                   etag=f"{digest}-{filename}", conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
 
 @app.route('/territory/<int:territory_id>')
 def territory(territory_id):
@@ -345,17 +912,9 @@ def territory(territory_id):
     try:
         territory_data = db.get_territory(territory_id)
         if territory_data:
-            # Перевіряємо фото в Volume
-            volume_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{territory_id}.jpg")
-            if os.path.exists(volume_path):
-                territory_data['image_url'] = f"/uploads/{territory_id}.jpg"
-            else:
-                # Перевіряємо фото в static
-                static_path = os.path.join('static', 'uploads', 'territories', f"{territory_id}.jpg")
-                if os.path.exists(static_path):
-                    territory_data['image_url'] = url_for('static', filename=f'uploads/territories/{territory_id}.jpg')
-                else:
-                    territory_data['image_url'] = None
+            image = image_index.get(territory_id)
+            territory_data['image_url'] = image_index.versioned_url(image)
+            territory_data['picture'] = derivatives.picture(image)
             
             history = db.get_territory_history(territory_id)
             return render_template('update.html', 
@@ -369,35 +928,156 @@ def territory(territory_id):
 
 @app.route('/territories')
 def territories():
+    # Шаблону territories.html немає - список територій віддає JSON API
+    return redirect(url_for('api_territories', **request.args))
+
+# Поля API: колонки бази (крім застарілого image_url) і дані про фото з індексу
+API_IMAGE_FIELDS = ('image_url', 'has_image')
+API_FIELDS = [field for field in TERRITORY_FIELDS if field != 'image_url'] + list(API_IMAGE_FIELDS)
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 200
+
+def api_error(message, status):
+    return jsonify({'error': message}), status
+
+def api_fields():
+    """Поля з параметра fields= (None - усі); ValueError для невідомих"""
+    requested = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in requested if field not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"Невідомі поля: {', '.join(unknown)}")
+    return requested or None
+
+def api_territory(territory, fields):
+    """Додає дані про фото (якщо запитані) і лишає лише запитані поля"""
+    wanted = fields or API_FIELDS
+    if 'image_url' in wanted or 'has_image' in wanted:
+        image_url = image_index.image_url(territory['id'])
+        territory['image_url'] = image_url
+        territory['has_image'] = image_url is not None
+    return {field: territory[field] for field in ['id'] + [f for f in wanted if f != 'id']}
+
+def api_response(data):
+    """JSON з ETag: клієнт з If-None-Match отримає 304 без тіла"""
+    response = jsonify(data)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/v1/territories')
+def api_territories():
+    """
+    Список територій: ?status=&taken_by=&due_before=YYYY-MM-DD&q=&after=<id>&limit=&fields=id,name,...
+    Сторінки за id: next_after з відповіді передається як after= для наступної сторінки.
+    """
     if not session.get('logged_in'):
-        return redirect(url_for('login'))
-    
+        return api_error('Потрібна авторизація', 401)
     try:
-        territories_data = db.get_all_territories()
-        
-        # Оновлюємо URL фотографій для кожної території
-        for territory in territories_data:
-            territory_id = territory['id']
-            # Перевіряємо фото в Volume
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{territory_id}.jpg")
-            if os.path.exists(image_path):
-                territory['image_url'] = f"/uploads/{territory_id}.jpg"
-            else:
-                # Перевіряємо фото в static
-                static_path = f"uploads/territories/{territory_id}.jpg"
-                if os.path.exists(os.path.join('static', static_path)):
-                    territory['image_url'] = f"/static/{static_path}"
-                else:
-                    territory['image_url'] = None
-        
-        return render_template('territories.html', 
-                             territories=territories_data,
-                             user_role=session.get('role', ''))
+        fields = api_fields()
+        limit = min(max(request.args.get('limit', API_DEFAULT_LIMIT, type=int), 1), API_MAX_LIMIT)
+        after = request.args.get('after', type=int)
+        due_before = request.args.get('due_before')
+        if due_before:
+            datetime.strptime(due_before, '%Y-%m-%d')
+    except ValueError as e:
+        return api_error(f'Неправильні параметри запиту: {str(e)}', 400)
+
+    try:
+        db_fields = ['id'] + [field for field in fields or API_FIELDS if field not in API_IMAGE_FIELDS]
+        # Беремо на один рядок більше, щоб знати, чи є наступна сторінка
+        territories = db.query_territories(
+            status=request.args.get('status'),
+            taken_by=request.args.get('taken_by'),
+            due_before=due_before,
+            search=request.args.get('q'),
+            after_id=after,
+            limit=limit + 1,
+            fields=db_fields
+        )
+        has_more = len(territories) > limit
+        items = [api_territory(territory, fields) for territory in territories[:limit]]
+        return api_response({
+            'items': items,
+            'next_after': items[-1]['id'] if has_more else None,
+            'limit': limit
+        })
     except Exception as e:
-        print(f"Помилка при отриманні списку територій: {str(e)}")
-        return "Помилка при отриманні даних", 500
+        logger.error(f"Помилка API списку територій: {str(e)}")
+        return api_error('Помилка при отриманні даних', 500)
+
+@app.route('/api/v1/territories/search')
+def api_search_territories():
+    """
+    Повнотекстовий пошук за адресою, примітками та іменем: ?q=&limit=&offset=
+    (результати за релевантністю). next_offset з відповіді - offset= наступної сторінки.
+    """
+    if not session.get('logged_in'):
+        return api_error('Потрібна авторизація', 401)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), API_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    try:
+        # Беремо на один рядок більше, щоб знати, чи є наступна сторінка
+        items = db.search_territories(request.args.get('q', ''), limit=limit + 1, offset=offset)
+        has_more = len(items) > limit
+        return api_response({
+            'items': items[:limit],
+            'next_offset': offset + limit if has_more else None,
+            'limit': limit
+        })
+    except Exception as e:
+        logger.error(f"Помилка пошуку територій: {str(e)}")
+        return api_error('Помилка пошуку', 500)
+
+@app.route('/api/v1/territories/by-address')
+def api_territories_by_address():
+    """Території за адресою: ?q=вул. 24 Серпня 3, кв. 50 (вулиця, будинок, під'їзд чи квартира)"""
+    if not session.get('logged_in'):
+        return api_error('Потрібна авторизація', 401)
+    try:
+        fields = api_fields()
+    except ValueError as e:
+        return api_error(str(e), 400)
+    try:
+        result = db.find_by_address(request.args.get('q', ''), limit=API_MAX_LIMIT)
+        return api_response({
+            'address': result['address'],
+            'items': [api_territory(territory, fields) for territory in result['items']]
+        })
+    except Exception as e:
+        logger.error(f"Помилка пошуку територій за адресою: {str(e)}")
+        return api_error('Помилка пошуку', 500)
+
+@app.route('/api/v1/streets')
+def api_streets():
+    """Вулиці з кількістю територій; території вулиці - /api/v1/territories/by-address?q=<вулиця>"""
+    if not session.get('logged_in'):
+        return api_error('Потрібна авторизація', 401)
+    try:
+        return api_response({'items': db.get_streets()})
+    except Exception as e:
+        logger.error(f"Помилка API списку вулиць: {str(e)}")
+        return api_error('Помилка при отриманні даних', 500)
+
+@app.route('/api/v1/territories/<int:territory_id>')
+def api_territory_detail(territory_id):
+    """Одна територія (підтримує fields=)"""
+    if not session.get('logged_in'):
+        return api_error('Потрібна авторизація', 401)
+    try:
+        fields = api_fields()
+    except ValueError as e:
+        return api_error(str(e), 400)
+    try:
+        territory = db.get_territory(territory_id)
+        if not territory:
+            return api_error('Територію не знайдено', 404)
+        return api_response(api_territory(territory, fields))
+    except Exception as e:
+        logger.error(f"Помилка API території {territory_id}: {str(e)}")
+        return api_error('Помилка при отриманні даних', 500)
+
+startup_profile.report('Імпорт app')
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
-    debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    app.run(host='0.0.0.0', port=port, debug=FLASK_DEBUG)
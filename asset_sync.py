@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+# Налаштування логування
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.asset_manifest.json'
+ASSET_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+SYNC_WORKERS = int(os.environ.get('ASSET_SYNC_WORKERS', '8'))
+STATIC_TERRITORIES = os.path.join('static', 'uploads', 'territories')
+
+
+def get_upload_folder():
+    """Повертає шлях до папки з фото у Volume."""
+    return os.path.join(os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', 'data'), 'uploads')
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(dst_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(dst_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(dst_dir: str, manifest: Dict) -> None:
+    path = os.path.join(dst_dir, MANIFEST_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def is_up_to_date(src_dir: str, dst_dir: str) -> bool:
+    """Швидка перевірка при старті: лише манифест і mtime папки-джерела"""
+    if not os.path.isdir(src_dir):
+        return True
+    manifest = load_manifest(dst_dir)
+    return bool(manifest) and manifest.get('source_mtime') == os.stat(src_dir).st_mtime
+
+
+def _sync_file(name: str, src_dir: str, dst_dir: str, previous: Optional[Dict]) -> Dict:
+    """Синхронізує один файл; повертає запис манифесту та виконану дію"""
+    src = os.path.join(src_dir, name)
+    dst = os.path.join(dst_dir, name)
+    src_stat = os.stat(src)
+
+    # Хеш джерела перераховуємо лише якщо змінився розмір або mtime
+    if previous and previous['size'] == src_stat.st_size and previous['mtime'] == src_stat.st_mtime:
+        src_hash = previous['sha256']
+    else:
+        src_hash = sha256_file(src)
+
+    try:
+        dst_stat = os.stat(dst)
+    except OSError:
+        dst_stat = None
+
+    action = 'unchanged'
+    if dst_stat is None:
+        action = 'copied'
+    elif previous and previous.get('dst_size') == dst_stat.st_size and previous.get('dst_mtime') == dst_stat.st_mtime:
+        # Файл у Volume не змінювався після попередньої синхронізації
+        if 'dst_sha256' in previous:
+            action = 'kept'
+        elif previous['sha256'] != src_hash:
+            action = 'updated'
+    elif sha256_file(dst) == src_hash:
+        # Файл уже існує (наприклад, скопійований старою версією застосунку)
+        action = 'adopted'
+    else:
+        # Фото у Volume замінене через завантаження - не перезаписуємо його
+        action = 'kept'
+
+    if action in ('copied', 'updated'):
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+        dst_stat = os.stat(dst)
+
+    entry = {
+        'sha256': src_hash,
+        'size': src_stat.st_size,
+        'mtime': src_stat.st_mtime,
+        'dst_size': dst_stat.st_size,
+        'dst_mtime': dst_stat.st_mtime,
+    }
+    if action == 'kept':
+        entry['dst_sha256'] = None
+    return {'name': name, 'action': action, 'entry': entry}
+
+
+def sync_assets(src_dir: str = STATIC_TERRITORIES, dst_dir: Optional[str] = None,
+                workers: int = SYNC_WORKERS) -> Dict[str, int]:
+    """
+    Ідемпотентно копіює фото зі static у Volume паралельними потоками.
+    Незмінені файли пропускаються за манифестом хешів, а фото, замінені
+    у Volume через завантаження, не перезаписуються.
+    """
+    dst_dir = dst_dir or get_upload_folder()
+    os.makedirs(dst_dir, exist_ok=True)
+    if not os.path.isdir(src_dir):
+        logger.warning(f"Папку з фото не знайдено: {src_dir}")
+        return {}
+
+    source_mtime = os.stat(src_dir).st_mtime
+    manifest = load_manifest(dst_dir) or {}
+    previous_files = manifest.get('files', {})
+
+    names = sorted(
+        entry.name for entry in os.scandir(src_dir)
+        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in ASSET_EXTENSIONS
+    )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda name: _sync_file(name, src_dir, dst_dir, previous_files.get(name)), names
+        ))
+
+    stats = {}
+    files = {}
+    for result in results:
+        stats[result['action']] = stats.get(result['action'], 0) + 1
+        files[result['name']] = result['entry']
+
+    save_manifest(dst_dir, {'source_dir': src_dir, 'source_mtime': source_mtime, 'files': files})
+    logger.info(f"Синхронізацію фото завершено: {stats}")
+    return stats
+
+
+def manifest_digests(dst_dir: Optional[str] = None):
+    """
+    Хеші фото у Volume з манифесту: [(шлях, розмір, mtime, sha256), ...].
+    Дозволяє не перераховувати хеші після перезапуску.
+    """
+    dst_dir = dst_dir or get_upload_folder()
+    manifest = load_manifest(dst_dir) or {}
+    digests = []
+    for name, entry in manifest.get('files', {}).items():
+        if entry.get('dst_sha256', entry['sha256']):
+            digests.append((os.path.join(dst_dir, name), entry['dst_size'], entry['dst_mtime'], entry['sha256']))
+    return digests
+
+
+if __name__ == '__main__':
+    if '--check' in sys.argv:
+        up_to_date = is_up_to_date(STATIC_TERRITORIES, get_upload_folder())
+        print("Фото синхронізовано" if up_to_date else "Потрібна синхронізація фото")
+        sys.exit(0 if up_to_date else 1)
+    sync_assets()
@@ -0,0 +1,309 @@
+"""
+Інкрементальні резервні копії бази: ланцюжки змінених сторінок.
+
+Ланцюжок - це папка backups/chains/<chain_id>/ з манифестом manifest.json і
+стисненими файлами сторінок. Перша точка ланцюжка містить усі сторінки бази,
+кожна наступна - лише сторінки, хеш яких змінився з попередньої точки.
+Будь-яку точку можна зібрати назад у файл бази (rebuild_point) з перевіркою
+хешів і PRAGMA integrity_check.
+"""
+import os
+import json
+import gzip
+import time
+import shutil
+import struct
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Блокування файлу між процесами: flock на POSIX, msvcrt.locking на Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+CHAINS_DIR = 'chains'
+MANIFEST_NAME = 'manifest.json'
+HASHES_NAME = 'page_hashes.bin'
+LOCK_NAME = '.lock'
+CHUNK_MAGIC = b'TBKPAGES1'
+PAGE_HASH_SIZE = 16
+# Скільки точок у ланцюжку до початку нового (з повною копією) і скільки ланцюжків зберігати
+BACKUP_CHAIN_LENGTH = int(os.environ.get('BACKUP_CHAIN_LENGTH', '96'))
+BACKUP_KEEP_CHAINS = int(os.environ.get('BACKUP_KEEP_CHAINS', '3'))
+BACKUP_COMPRESS_LEVEL = int(os.environ.get('BACKUP_COMPRESS_LEVEL', '6'))
+
+
+class ChainVerificationError(Exception):
+    """Ланцюжок пошкоджений: хеші, сторінки або integrity_check не збігаються"""
+
+
+def _page_hash(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _page_size(path: str) -> int:
+    """Розмір сторінки з заголовка файлу SQLite (1 означає 65536)"""
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    if len(header) < 100 or not header.startswith(b'SQLite format 3\x00'):
+        raise ValueError(f"Файл не є базою SQLite: {path}")
+    size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def chains_root(backup_dir: str) -> str:
+    return os.path.join(backup_dir, CHAINS_DIR)
+
+
+# Потоки одного процесу серіалізуються і без файлового блокування
+_process_lock = threading.Lock()
+
+
+def _lock_file(lock_file) -> None:
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    # LK_NBLCK не чекає, тож повторюємо, поки інший процес не відпустить
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def _unlock_file(lock_file) -> None:
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def _chains_lock(backup_dir: str):
+    """
+    Виключне блокування ланцюжків: номер точки береться з манифесту, тож дві
+    копії водночас (фонове завдання і запуск з командного рядка) не мають
+    читати й переписувати його одночасно.
+    """
+    root = chains_root(backup_dir)
+    os.makedirs(root, exist_ok=True)
+    with _process_lock, open(os.path.join(root, LOCK_NAME), 'a+') as lock_file:
+        lock_file.seek(0)
+        _lock_file(lock_file)
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
+
+def load_manifest(chain_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(chain_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_chains(backup_dir: str) -> List[Dict]:
+    """Усі ланцюжки (від найстарішого) з їх манифестами"""
+    root = chains_root(backup_dir)
+    if not os.path.isdir(root):
+        return []
+    chains = []
+    for name in sorted(os.listdir(root)):
+        if name == LOCK_NAME:
+            continue
+        manifest = load_manifest(os.path.join(root, name))
+        if manifest and manifest.get('points'):
+            chains.append(manifest)
+    return chains
+
+
+def _load_hashes(chain_dir: str) -> List[bytes]:
+    try:
+        with open(os.path.join(chain_dir, HASHES_NAME), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return []
+    return [data[i:i + PAGE_HASH_SIZE] for i in range(0, len(data), PAGE_HASH_SIZE)]
+
+
+def _select_chain(backup_dir: str, page_size: int) -> Optional[str]:
+    """Останній ланцюжок, у який ще можна дописати точку, або None"""
+    chains = list_chains(backup_dir)
+    if not chains:
+        return None
+    manifest = chains[-1]
+    if manifest['page_size'] != page_size or len(manifest['points']) >= BACKUP_CHAIN_LENGTH:
+        return None
+    return os.path.join(chains_root(backup_dir), manifest['chain_id'])
+
+
+def add_snapshot(backup_dir: str, snapshot_path: str) -> Dict:
+    """
+    Додає точку до ланцюжка з узгодженої копії бази snapshot_path
+    (її має зробити викликач, наприклад через SQLite backup API).
+    Повертає запис точки з манифесту.
+    """
+    with _chains_lock(backup_dir):
+        return _add_snapshot(backup_dir, snapshot_path)
+
+
+def _add_snapshot(backup_dir: str, snapshot_path: str) -> Dict:
+    page_size = _page_size(snapshot_path)
+    chain_dir = _select_chain(backup_dir, page_size)
+    if chain_dir is None:
+        # Мікросекунди - щоб назви ланцюжків завжди сортувались у порядку створення
+        chain_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        chain_dir = os.path.join(chains_root(backup_dir), chain_id)
+        os.makedirs(chain_dir)
+        manifest = {'chain_id': chain_id, 'page_size': page_size, 'points': []}
+        previous_hashes = []
+    else:
+        manifest = load_manifest(chain_dir)
+        # Хеші пишуться після манифесту, тож вони не новіші за останню точку:
+        # у гіршому разі в точку потрапить більше сторінок, ніж потрібно
+        previous_hashes = _load_hashes(chain_dir)
+
+    seq = len(manifest['points'])
+    chunk_name = f"{seq:06d}.pages.gz"
+    chunk_path = os.path.join(chain_dir, chunk_name)
+    tmp_chunk = f"{chunk_path}.{os.getpid()}.tmp"
+
+    hashes = []
+    changed = 0
+    with open(snapshot_path, 'rb') as source, \
+            gzip.open(tmp_chunk, 'wb', compresslevel=BACKUP_COMPRESS_LEVEL) as chunk:
+        chunk.write(CHUNK_MAGIC + struct.pack('>I', page_size))
+        page_no = 0
+        for page in iter(lambda: source.read(page_size), b''):
+            page_hash = _page_hash(page)
+            hashes.append(page_hash)
+            if page_no >= len(previous_hashes) or previous_hashes[page_no] != page_hash:
+                chunk.write(struct.pack('>I', page_no) + page)
+                changed += 1
+            page_no += 1
+    os.replace(tmp_chunk, chunk_path)
+
+    point = {
+        'seq': seq,
+        'file': chunk_name,
+        'created_at': datetime.now().strftime("%Y%m%d_%H%M%S"),
+        'page_count': len(hashes),
+        'changed_pages': changed,
+        'chunk_size': os.path.getsize(chunk_path),
+        'chunk_sha256': _sha256_file(chunk_path),
+        'db_sha256': _sha256_file(snapshot_path),
+    }
+    manifest['points'].append(point)
+    _write_atomic(os.path.join(chain_dir, MANIFEST_NAME), json.dumps(manifest, indent=1).encode('utf-8'))
+    _write_atomic(os.path.join(chain_dir, HASHES_NAME), b''.join(hashes))
+    point['chain_id'] = manifest['chain_id']
+    return point
+
+
+def _read_chunk(path: str, page_size: int):
+    with gzip.open(path, 'rb') as chunk:
+        header = chunk.read(len(CHUNK_MAGIC) + 4)
+        if header[:len(CHUNK_MAGIC)] != CHUNK_MAGIC or struct.unpack('>I', header[len(CHUNK_MAGIC):])[0] != page_size:
+            raise ChainVerificationError(f"Пошкоджений файл сторінок: {path}")
+        while True:
+            record = chunk.read(4 + page_size)
+            if not record:
+                return
+            if len(record) != 4 + page_size:
+                raise ChainVerificationError(f"Обрізаний файл сторінок: {path}")
+            yield struct.unpack('>I', record[:4])[0], record[4:]
+
+
+def rebuild_point(chain_dir: str, out_path: str, point: Optional[int] = None) -> Dict:
+    """
+    Збирає базу на момент точки point (за замовчуванням - останньої) у out_path.
+    Точки читаються від потрібної назад, поки не знайдено всі сторінки, тож
+    свіжі точки відновлюються без читання всього ланцюжка. Перевіряє хеш
+    кожного файлу сторінок, хеш зібраної бази і PRAGMA integrity_check.
+    """
+    manifest = load_manifest(chain_dir)
+    if not manifest or not manifest.get('points'):
+        raise FileNotFoundError(f"Манифест ланцюжка не знайдено: {chain_dir}")
+    points = manifest['points']
+    seq = len(points) - 1 if point is None else int(point)
+    if not 0 <= seq < len(points):
+        raise ValueError(f"Точки {point} немає в ланцюжку {manifest['chain_id']}")
+
+    page_size = manifest['page_size']
+    target = points[seq]
+    page_count = target['page_count']
+    missing = set(range(page_count))
+
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as out:
+            out.truncate(page_count * page_size)
+            for entry in reversed(points[:seq + 1]):
+                if not missing:
+                    break
+                chunk_path = os.path.join(chain_dir, entry['file'])
+                if not os.path.exists(chunk_path):
+                    raise ChainVerificationError(f"Файл сторінок не знайдено: {entry['file']}")
+                if _sha256_file(chunk_path) != entry['chunk_sha256']:
+                    raise ChainVerificationError(f"Хеш файлу сторінок не збігається: {entry['file']}")
+                for page_no, page in _read_chunk(chunk_path, page_size):
+                    if page_no in missing:
+                        out.seek(page_no * page_size)
+                        out.write(page)
+                        missing.discard(page_no)
+        if missing:
+            raise ChainVerificationError(f"У ланцюжку бракує {len(missing)} сторінок для точки {seq}")
+        if _sha256_file(tmp) != target['db_sha256']:
+            raise ChainVerificationError(f"Хеш відновленої бази не збігається для точки {seq}")
+        conn = sqlite3.connect(tmp)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            conn.close()
+        if result != 'ok':
+            raise ChainVerificationError(f"Перевірка цілісності не пройдена: {result}")
+        os.replace(tmp, out_path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return dict(target, chain_id=manifest['chain_id'])
+
+
+def remove_old_chains(backup_dir: str, keep: int = BACKUP_KEEP_CHAINS) -> List[str]:
+    """Видаляє старі ланцюжки цілком (залишаємо тільки keep останніх)"""
+    root = chains_root(backup_dir)
+    if not os.path.isdir(root):
+        return []
+    removed = []
+    with _chains_lock(backup_dir):
+        names = sorted(name for name in os.listdir(root) if name != LOCK_NAME)
+        for name in names[:-keep] if len(names) > keep else []:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed.append(name)
+    return removed
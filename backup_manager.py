@@ -1,66 +1,287 @@
 import sqlite3
 import os
+import time
+import uuid
+import threading
 from datetime import datetime
-import shutil
+import backup_chain
+import metrics
+
+# Скільки сторінок копіювати за один крок і пауза між кроками (секунди).
+# Між кроками блокування з бази знімається, тож читання і запис не чекають на бекап.
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', '0.01'))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '5'))
+# full - повна копія бази, incremental - точка в ланцюжку змінених сторінок (backup_chain)
+BACKUP_MODE = os.environ.get('BACKUP_MODE', 'full').lower()
+BACKUP_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+# Скільки завершених завдань пам'ятати для ендпоінта статусу
+BACKUP_JOBS_HISTORY = 20
 
 def get_db_path():
     """Повертає шлях до файлу бази даних."""
     data_dir = os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', 'data')
     return os.path.join(data_dir, 'territories.db')
 
-def backup_important_data():
-    """Створює резервну копію важливих даних з бази даних."""
+def get_backup_dir():
+    """Повертає шлях до папки з резервними копіями."""
+    return os.path.join(os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', 'data'), 'backups')
+
+def online_backup(source_path, target_path, progress=None):
+    """
+    Копіює базу через SQLite backup API порціями по BACKUP_PAGES_PER_STEP сторінок.
+    На відміну від копіювання файлу, копія завжди узгоджена (з урахуванням WAL),
+    навіть якщо під час бекапу в базу пишуть. Копія спочатку пишеться у тимчасовий
+    файл і з'являється під остаточною назвою лише після завершення.
+    progress(remaining, total) викликається після кожного кроку.
+    """
+    tmp_path = os.path.join(os.path.dirname(target_path) or '.',
+                            f".{os.path.basename(target_path)}.{os.getpid()}.tmp")
+    source = sqlite3.connect(source_path, timeout=BACKUP_TIMEOUT_MS / 1000)
+    try:
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(
+                target,
+                pages=BACKUP_PAGES_PER_STEP,
+                progress=(lambda status, remaining, total: progress(remaining, total)) if progress else None,
+                sleep=BACKUP_STEP_SLEEP
+            )
+            # Копія - самодостатній файл, без -wal/-shm поруч
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+        os.replace(tmp_path, target_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+
+def remove_old_backups(backup_dir, keep=BACKUP_KEEP):
+    """Видаляє старі бекапи (залишаємо тільки keep останніх)."""
+    backups = sorted([f for f in os.listdir(backup_dir) if f.startswith('backup_') and f.endswith('.db')])
+    removed = []
+    if len(backups) > keep:
+        for old_backup in backups[:-keep]:
+            os.remove(os.path.join(backup_dir, old_backup))
+            removed.append(old_backup)
+            print(f"Видалено стару резервну копію: {old_backup}")
+    return removed
+
+def create_backup(progress=None, mode=None):
+    """
+    Створює резервну копію бази даних (помилки прокидаються далі).
+    Повертає {'mode', 'file', ...}: file - шлях відносно папки бекапів.
+    """
+    mode = (mode or BACKUP_MODE).lower()
+    if mode not in ('full', 'incremental'):
+        raise ValueError(f"Невідомий режим резервного копіювання: {mode}")
+
+    started = time.perf_counter()
+    try:
+        result = _create_backup(progress, mode)
+    except Exception:
+        metrics.BACKUP_ERRORS.inc(mode)
+        raise
+    metrics.BACKUP_DURATION.observe(time.perf_counter() - started, mode)
+    metrics.BACKUP_SIZE.observe(result['size'], mode)
+    return result
+
+def _create_backup(progress, mode):
+    """Копія в режимі mode (full або incremental) - див. create_backup"""
     # Підключення до основної бази даних
     db_path = get_db_path()
     if not os.path.exists(db_path):
-        print(f"Основну базу даних не знайдено: {db_path}")
-        return
+        raise FileNotFoundError(f"Основну базу даних не знайдено: {db_path}")
 
     # Створюємо папку для резервних копій
-    backup_dir = os.path.join(os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', 'data'), 'backups')
+    backup_dir = get_backup_dir()
     if not os.path.exists(backup_dir):
         os.makedirs(backup_dir)
-    
+
     # Створюємо нову резервну копію
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if mode == 'incremental':
+        # Узгоджений знімок робимо тим самим backup API, а в ланцюжок
+        # потрапляють лише сторінки, що змінилися з попередньої точки
+        snapshot = os.path.join(backup_dir, f'.snapshot_{timestamp}_{os.getpid()}_{threading.get_ident()}.db')
+        try:
+            online_backup(db_path, snapshot, progress)
+            point = backup_chain.add_snapshot(backup_dir, snapshot)
+        finally:
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+        print(f"Інкрементальну копію створено успішно: ланцюжок {point['chain_id']}, "
+              f"точка {point['seq']}, змінених сторінок {point['changed_pages']} з {point['page_count']}")
+        for chain_id in backup_chain.remove_old_chains(backup_dir):
+            print(f"Видалено старий ланцюжок резервних копій: {chain_id}")
+        return {
+            'mode': mode,
+            'file': os.path.join(backup_chain.CHAINS_DIR, point['chain_id']),
+            'point': point['seq'],
+            'changed_pages': point['changed_pages'],
+            'page_count': point['page_count'],
+            'size': point['chunk_size']
+        }
+
     backup_file = os.path.join(backup_dir, f'backup_{timestamp}.db')
-    
+    online_backup(db_path, backup_file, progress)
+    print(f"Резервну копію створено успішно: {backup_file}")
+
+    remove_old_backups(backup_dir)
+    return {'mode': mode, 'file': os.path.basename(backup_file), 'size': os.path.getsize(backup_file)}
+
+def backup_important_data(mode=None):
+    """Створює резервну копію важливих даних з бази даних."""
     try:
-        # Копіюємо файл бази даних
-        shutil.copy2(db_path, backup_file)
-        print(f"Резервну копію створено успішно: {backup_file}")
-        
-        # Видаляємо старі бекапи (залишаємо тільки 5 останніх)
-        backups = sorted([f for f in os.listdir(backup_dir) if f.startswith('backup_')])
-        if len(backups) > 5:
-            for old_backup in backups[:-5]:
-                os.remove(os.path.join(backup_dir, old_backup))
-                print(f"Видалено стару резервну копію: {old_backup}")
-        
+        return create_backup(mode=mode)
+    except FileNotFoundError as e:
+        print(str(e))
     except Exception as e:
         print(f"Помилка при створенні резервної копії: {str(e)}")
+    return None
+
+class BackupJobs:
+    """
+    Фонові завдання резервного копіювання з ідентифікатором і прогресом.
+    Одночасно виконується не більше одного бекапу - повторний запуск
+    повертає вже активне завдання.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = None
 
-def restore_from_backup(backup_file):
-    """Відновлює дані з резервної копії."""
+    def start(self, mode=None):
+        """Запускає бекап у фоновому потоці і повертає стан завдання"""
+        with self._lock:
+            if self._active is not None:
+                return dict(self._jobs[self._active])
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                'id': job_id,
+                'mode': (mode or BACKUP_MODE).lower(),
+                'status': 'running',
+                'started_at': time.time(),
+                'finished_at': None,
+                'pages_total': None,
+                'pages_done': 0,
+                'progress': 0.0,
+                'file': None,
+                'result': None,
+                'error': None
+            }
+            self._active = job_id
+            self._trim()
+        threading.Thread(target=self._run, args=(job_id, mode), name=f'backup-{job_id}', daemon=True).start()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def latest(self):
+        with self._lock:
+            if not self._jobs:
+                return None
+            return dict(max(self._jobs.values(), key=lambda job: job['started_at']))
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, mode):
+        def progress(remaining, total):
+            done = total - remaining
+            self._update(job_id, pages_total=total, pages_done=done,
+                         progress=round(done / total * 100, 1) if total else 100.0)
+
+        try:
+            result = create_backup(progress=progress, mode=mode)
+            self._update(job_id, status='done', progress=100.0, file=result['file'], result=result)
+        except Exception as e:
+            print(f"Помилка при створенні резервної копії: {str(e)}")
+            self._update(job_id, status='error', error=str(e))
+        finally:
+            with self._lock:
+                self._jobs[job_id]['finished_at'] = time.time()
+                self._active = None
+
+    def _trim(self):
+        finished = sorted(
+            (job for job in self._jobs.values() if job['status'] != 'running'),
+            key=lambda job: job['started_at']
+        )
+        for job in finished[:max(len(self._jobs) - BACKUP_JOBS_HISTORY, 0)]:
+            del self._jobs[job['id']]
+
+backup_jobs = BackupJobs()
+
+def _restore_database(source_file, db_path):
+    """Переписує базу вмістом source_file через backup API"""
+    # Не копіюванням файлу: так не лишається застарілого WAL, а відкриті з'єднання бачать нові дані
+    source = sqlite3.connect(source_file)
+    try:
+        target = sqlite3.connect(db_path, timeout=BACKUP_TIMEOUT_MS / 1000)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+def restore_from_backup(backup_file, point=None):
+    """
+    Відновлює дані з резервної копії. backup_file - файл повної копії або
+    папка ланцюжка інкрементальних копій; для ланцюжка point - номер точки
+    (за замовчуванням остання). Повертає відновлену точку ланцюжка (для
+    повної копії - None).
+
+    FileNotFoundError - копії немає, ValueError - неправильна точка,
+    backup_chain.ChainVerificationError - ланцюжок не пройшов перевірку.
+    """
     if not os.path.exists(backup_file):
-        print(f"Файл резервної копії не знайдено: {backup_file}")
-        return
-    
+        raise FileNotFoundError(f"Файл резервної копії не знайдено: {backup_file}")
+    if point is not None and not os.path.isdir(backup_file):
+        raise ValueError("Точку можна вказати лише для ланцюжка інкрементальних копій")
+
     db_path = get_db_path()
+    rebuilt = None
+    restored_point = None
     try:
+        if os.path.isdir(backup_file):
+            # Збираємо точку ланцюжка в окремий файл з перевіркою цілісності
+            rebuilt = os.path.join(os.path.dirname(os.path.abspath(db_path)), f'.restore_point_{os.getpid()}.db')
+            restored_point = backup_chain.rebuild_point(backup_file, rebuilt, point)
+            print(f"Зібрано точку {restored_point['seq']} ланцюжка {restored_point['chain_id']} "
+                  f"({restored_point['created_at']})")
+            source_file = rebuilt
+        else:
+            source_file = backup_file
+
         # Створюємо резервну копію поточної бази перед відновленням
         if os.path.exists(db_path):
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             current_backup = f"{db_path}.before_restore_{timestamp}"
-            shutil.copy2(db_path, current_backup)
+            online_backup(db_path, current_backup)
             print(f"Створено резервну копію поточної бази: {current_backup}")
-        
+
         # Відновлюємо базу з бекапу
-        shutil.copy2(backup_file, db_path)
+        _restore_database(source_file, db_path)
         print("Дані успішно відновлено з резервної копії")
-        
+        return restored_point
+
     except Exception as e:
         print(f"Помилка при відновленні даних: {str(e)}")
+        raise
+    finally:
+        if rebuilt and os.path.exists(rebuilt):
+            os.remove(rebuilt)
 
 if __name__ == "__main__":
-    backup_important_data() 
\ No newline at end of file
+    import sys
+    backup_important_data('incremental' if '--incremental' in sys.argv else None)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Порівняння рендеру головної сторінки з кешем карток і без нього.
+
+Для 190 і 2000 тестових територій рендерить index.html трьома способами:
+усі картки заново (кеш очищується перед кожним рендером), усі картки з кешу,
+і з кешу, коли 1% територій змінився (нова row_version). Застосунок запускається
+в тимчасовій папці (без робочої бази і фото), тож фонова ініціалізація не
+заважає вимірюванню.
+
+Запуск: python bench_card_cache.py [кількість повторів]
+"""
+import os
+import sys
+import shutil
+import tempfile
+import statistics
+import threading
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='bench_cards_')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(TMP_DIR)
+os.environ['RAILWAY_VOLUME_MOUNT_PATH'] = os.path.join(TMP_DIR, 'data')
+os.environ.setdefault('SHEETS_SYNC_ENABLED', 'False')
+os.environ.setdefault('STARTUP_BACKUP', 'False')
+os.environ.setdefault('SQLITE_OPTIMIZE_INTERVAL', '0')
+
+import app as territory_app  # noqa: E402
+
+SIZES = (190, 2000)
+
+
+def make_territories(count: int):
+    territories = []
+    for i in range(1, count + 1):
+        taken = i % 3 == 0
+        territories.append({
+            'id': i,
+            'name': f"вул. Тестова {i // 4 + 1} - {i % 4 + 1} під. кв. {i % 4 * 30 + 1}-{i % 4 * 30 + 30}",
+            'status': 'Взято' if taken else 'Вільна',
+            'taken_by': 'Іван Петренко' if taken else '',
+            'date_taken': '01.09.2026' if taken else '',
+            'date_due': '01.01.2027' if taken else '',
+            'notes': 'Домофон, код 123' if i % 5 == 0 else '',
+            'is_due_soon': taken and i % 2 == 0,
+            'row_version': 0,
+        })
+    return territories
+
+
+def render_page(territories, is_admin=True) -> str:
+    taken, free = territory_app.territory_cards(territories, is_admin)
+    return territory_app.render_template('index.html', taken=taken, free=free, is_admin=is_admin)
+
+
+def measure(render, repeats: int) -> float:
+    """Медіана часу рендеру, мс"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> int:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    cache = territory_app.card_cache
+    for thread in threading.enumerate():
+        if thread.name == 'background-init':
+            thread.join()
+    try:
+        with territory_app.app.test_request_context('/'):
+            for count in SIZES:
+                territories = make_territories(count)
+                cache.maxsize = max(cache.maxsize, count * 2)
+
+                def full():
+                    cache.clear()
+                    return render_page(territories)
+
+                dirty_step = max(count // 100, 1)
+
+                def dirty():
+                    for territory in territories[::dirty_step]:
+                        territory['row_version'] += 1
+                    return render_page(territories)
+
+                # Однаковий HTML з кешем і без нього
+                cache.clear()
+                assert render_page(territories) == render_page(territories)
+
+                full_ms = measure(full, repeats)
+                render_page(territories)
+                cached_ms = measure(lambda: render_page(territories), repeats)
+                dirty_ms = measure(dirty, repeats)
+                print(f"{count} територій: без кешу {full_ms:.1f} мс, з кешу {cached_ms:.1f} мс "
+                      f"(x{full_ms / cached_ms:.1f}), змінено 1% - {dirty_ms:.1f} мс")
+        print(f"Кеш: {cache.stats()}")
+        return 0
+    finally:
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
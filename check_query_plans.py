@@ -0,0 +1,151 @@
+"""
+Перевірка планів запитів SQLiteDB.
+
+Створює тимчасову базу з тестовими даними, викликає кожен метод SQLiteDB,
+перехоплює виконані ним SQL-запити (set_trace_callback) і для кожного
+SELECT/UPDATE/DELETE перевіряє EXPLAIN QUERY PLAN: таблиця не повинна
+скануватися повністю, а сортування не повинно потребувати тимчасового B-дерева.
+Повний перегляд дозволено лише там, де він потрібен за змістом (ALLOWED_SCANS).
+
+Запуск: python check_query_plans.py (код виходу 1, якщо є регресії)
+"""
+import os
+import re
+import sys
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlite_db import SQLiteDB
+
+# Методи, яким потрібна вся таблиця
+ALLOWED_SCANS = {
+    'get_all_territories': {'territories'},
+}
+# Методи, де сортування неминуче (ранжування збігів за bm25)
+ALLOWED_SORTS = {'search_territories'}
+
+TERRITORIES = 500
+HISTORY_PER_TERRITORY = 20
+OUTBOX_ITEMS = 200
+STREETS = ['Тестова', 'Садова', 'Лісова', '24 Серпня', 'Симоненка']
+
+
+def seed(db: SQLiteDB) -> None:
+    conn = db._connect()
+    today = datetime.now()
+    conn.executemany(
+        "INSERT INTO territories (id, name, custom_name, status, taken_by, date_taken, date_due) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(
+            i, f"Територія {i}", f"вул. {STREETS[i % len(STREETS)]} {i // 20 + 1} - {i % 4 + 1} під. кв. {i % 4 * 30 + 1}-{i % 4 * 30 + 30}",
+            'Взято' if i % 3 == 0 else 'Вільна',
+            'Тест' if i % 3 == 0 else '',
+            (today - timedelta(days=i % 200)).strftime('%d.%m.%Y') if i % 3 == 0 else '',
+            (today + timedelta(days=120 - i % 200)).strftime('%d.%m.%Y') if i % 3 == 0 else ''
+        ) for i in range(1, TERRITORIES + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO history (territory_id, taken_by, date_taken, date_returned) VALUES (?, ?, ?, ?)",
+        [(i % TERRITORIES + 1, 'Тест', '01.01.2020', '01.05.2020') for i in range(TERRITORIES * HISTORY_PER_TERRITORY)]
+    )
+    conn.executemany(
+        "INSERT INTO sheets_outbox (territory_id, payload, status, created_at) VALUES (?, '{}', ?, 0)",
+        [(i % TERRITORIES + 1, 'failed' if i % 10 == 0 else 'pending') for i in range(OUTBOX_ITEMS)]
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def exercise(db: SQLiteDB):
+    """Викликає кожен метод SQLiteDB; повертає [(метод, [sql, ...]), ...]"""
+    conn = db._connect()
+    calls = [
+        ('get_territory', lambda: db.get_territory(42)),
+        ('get_all_territories', lambda: db.get_all_territories()),
+        ('get_due_within', lambda: db.get_due_within(10)),
+        ('get_overdue', lambda: db.get_overdue()),
+        ('query_territories', lambda: db.query_territories(after_id=100, limit=20, fields=['name'])),
+        ('query_territories', lambda: db.query_territories(status='Взято', due_before='2030-01-01', limit=20)),
+        ('query_territories', lambda: db.query_territories(search='Тестова 4', limit=20)),
+        ('search_territories', lambda: db.search_territories('тест 4')),
+        ('find_by_address', lambda: db.find_by_address('вул. Тестова 3, кв. 50')),
+        ('find_by_address', lambda: db.find_by_address('Симоненка 2 - 3 під.')),
+        ('find_by_address', lambda: db.find_by_address('Садова')),
+        ('get_streets', lambda: db.get_streets()),
+        ('update_territory', lambda: db.update_territory(42, {
+            'status': 'Взято', 'taken_by': 'Тест', 'date_taken': '01.01.2024', 'date_due': '01.05.2024'
+        })),
+        ('update_territory', lambda: db.update_territory(42, {'status': 'Вільна'})),
+        # Звільнення вільних пропускається, тож спершу видаємо ті самі території
+        ('bulk_update_territories', lambda: db.bulk_update_territories(
+            [{'territory_id': i, 'status': 'Взято', 'taken_by': 'Тест'} for i in range(3, 60, 3)]
+            + [{'territory_id': i, 'status': 'Вільна'} for i in range(3, 60, 3)]
+        )),
+        ('add_history_record', lambda: db.add_history_record(7, {'taken_by': 'Тест'})),
+        ('get_territory_history', lambda: db.get_territory_history(7)),
+        ('clear_territory_history', lambda: db.clear_territory_history(7)),
+        ('claim_outbox_items', lambda: db.claim_outbox_items(limit=20)),
+        ('complete_outbox_items', lambda: db.complete_outbox_items([1, 2, 3])),
+        ('fail_outbox_item', lambda: db.fail_outbox_item(4, 'test', None)),
+        ('get_outbox_status', lambda: db.get_outbox_status()),
+        ('get_territories', lambda: db.get_territories([3, 42, 7])),
+        ('last_event_id', lambda: db.last_event_id()),
+        ('get_events_after', lambda: db.get_events_after(1)),
+    ]
+    results = []
+    for name, call in calls:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        results.append((name, statements))
+    return results
+
+
+def check_plan(conn, sql: str, allowed_tables, allow_sort=False):
+    """Повертає (план, [проблеми]) для одного запиту"""
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    plan = [row[3] for row in rows]
+    problems = []
+    for detail in plan:
+        # "SCAN ... VIRTUAL TABLE INDEX" (FTS5) - пошук за індексом, а не перегляд таблиці
+        if detail.startswith('SCAN ') and ' INDEX' not in detail:
+            table = detail.split()[1]
+            if table not in allowed_tables:
+                problems.append(detail)
+        elif 'USE TEMP B-TREE' in detail and not allow_sort:
+            problems.append(detail)
+    return plan, problems
+
+
+def main() -> int:
+    tmp_dir = tempfile.mkdtemp(prefix='query_plans_')
+    try:
+        db = SQLiteDB(os.path.join(tmp_dir, 'territories.db'))
+        seed(db)
+        conn = db._connect()
+        failures = 0
+        for name, statements in exercise(db):
+            # Тригери та executemany повторюють ті самі запити з іншими значеннями
+            unique = {re.sub(r"\b\d+(\.\d+)?\b", '?', sql): sql for sql in statements}
+            for sql in unique.values():
+                if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                    continue
+                plan, problems = check_plan(conn, sql, ALLOWED_SCANS.get(name, set()), name in ALLOWED_SORTS)
+                status = 'OK ' if not problems else 'FAIL'
+                print(f"[{status}] {name}: {' '.join(sql.split())[:100]}")
+                for detail in plan:
+                    print(f"         {detail}")
+                failures += bool(problems)
+        db.close()
+        print(f"\nЗапитів з регресіями плану: {failures}")
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
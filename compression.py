@@ -0,0 +1,174 @@
+"""
+Стиснення відповідей: gzip/brotli для динамічних сторінок і заздалегідь
+стиснуті статичні файли.
+
+Динамічні відповіді (HTML, JSON) стискаються в after_request, якщо вони
+більші за COMPRESS_MIN_SIZE. Статичні текстові файли стискаються один раз під
+час збірки (python compression.py [папка]) - поруч з файлом з'являються .br і
+.gz, і під час запиту віддається готовий варіант за Accept-Encoding.
+
+Brotli необов'язковий: без пакета brotli працює лише gzip.
+"""
+import os
+import sys
+import gzip
+import mimetypes
+import importlib.util
+from typing import Iterable, Optional, Tuple
+
+from flask import send_from_directory
+from werkzeug.security import safe_join
+
+BROTLI_AVAILABLE = importlib.util.find_spec('brotli') is not None
+if BROTLI_AVAILABLE:
+    import brotli
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+# Рівні для стиснення під час запиту: швидкі, бо виконуються на кожну відповідь
+GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+    'application/json', 'application/manifest+json', 'image/svg+xml'
+)
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.webmanifest', '.html', '.txt')
+# Кодування в порядку переваги сервера і розширення готових файлів
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    return ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)
+
+
+def choose_encoding(accept_encodings, offered: Iterable[str]) -> Optional[str]:
+    """Найкраще кодування з offered за Accept-Encoding (werkzeug Accept) або None"""
+    offered = list(offered)
+    if not offered:
+        return None
+    return accept_encodings.best_match(offered)
+
+
+def compress(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """Стискає data; static=True - максимальний рівень (для збірки, а не запиту)"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 - однаковий вміст дає однаковий файл (і ETag)
+        return gzip.compress(data, compresslevel=9 if static else GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Невідоме кодування: {encoding}")
+
+
+def compress_response(response, accept_encodings):
+    """
+    after_request: стискає відповідь, якщо її тип текстовий, розмір не менший
+    за COMPRESS_MIN_SIZE і клієнт приймає gzip або br. Потокові відповіді (SSE)
+    та файли (send_file) не чіпаємо.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings, supported_encodings())
+    if not encoding:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Стиснуте тіло інше побайтово, тож ETag лише слабкий (If-None-Match порівнює слабко)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def precompressed_variant(directory: str, filename: str, accept_encodings) -> Tuple[str, Optional[str]]:
+    """
+    (ім'я файлу, кодування) для віддачі: готовий .br/.gz, якщо він є, не старіший
+    за оригінал і клієнт його приймає, інакше оригінал без кодування.
+    """
+    if not filename.endswith(PRECOMPRESS_EXTENSIONS):
+        return filename, None
+    path = safe_join(directory, filename)
+    try:
+        source_mtime = os.stat(path).st_mtime if path else None
+    except OSError:
+        source_mtime = None
+    if source_mtime is None:
+        return filename, None
+
+    offered = []
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        try:
+            if os.stat(path + suffix).st_mtime >= source_mtime:
+                offered.append(encoding)
+        except OSError:
+            continue
+    encoding = choose_encoding(accept_encodings, offered)
+    if not encoding:
+        return filename, None
+    return filename + ENCODING_SUFFIXES[encoding], encoding
+
+
+def send_precompressed(directory: str, filename: str, accept_encodings, **kwargs):
+    """send_from_directory з готовим .br/.gz варіантом файлу, якщо він підходить"""
+    served, encoding = precompressed_variant(directory, filename, accept_encodings)
+    if encoding is None:
+        response = send_from_directory(directory, filename, **kwargs)
+        if filename.endswith(PRECOMPRESS_EXTENSIONS):
+            response.vary.add('Accept-Encoding')
+        return response
+
+    # Тип вмісту - від оригіналу, а не від .gz/.br
+    if 'mimetype' not in kwargs:
+        kwargs['mimetype'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(directory, served, **kwargs)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def precompress_directory(root: str, force: bool = False) -> Tuple[int, int]:
+    """
+    Створює .br/.gz поруч з текстовими файлами в root (рекурсивно), якщо їх ще
+    немає або оригінал новіший. Варіант, не менший за оригінал, не зберігається.
+    Повертає (створено, пропущено актуальних).
+    """
+    created = skipped = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            source_mtime = os.stat(path).st_mtime
+            data = None
+            for encoding in supported_encodings():
+                target = path + ENCODING_SUFFIXES[encoding]
+                if not force and os.path.exists(target) and os.stat(target).st_mtime >= source_mtime:
+                    skipped += 1
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress(data, encoding, static=True)
+                if len(compressed) >= len(data):
+                    if os.path.exists(target):
+                        os.remove(target)
+                    continue
+                tmp = f"{target}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp, target)
+                created += 1
+    return created, skipped
+
+
+if __name__ == '__main__':
+    root = next((arg for arg in sys.argv[1:] if not arg.startswith('--')), 'static')
+    created, skipped = precompress_directory(root, force='--force' in sys.argv)
+    print(f"Стиснуті копії в {root}: створено {created}, актуальних {skipped}"
+          f"{'' if BROTLI_AVAILABLE else ' (brotli не встановлено - лише gzip)'}")
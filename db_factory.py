@@ -1,16 +1,42 @@
 import os
 import shutil
+import threading
 from typing import Union
 from sqlite_db import SQLiteDB
 import time
 
+class LazyDB:
+    """
+    Відкладене створення бази: звірка/копіювання файлу бази та створення схеми
+    виконуються при першому зверненні (або у фоні через resolve()), а не при імпорті.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._db = None
+        self._lock = threading.Lock()
+
+    def resolve(self) -> SQLiteDB:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._factory()
+        return self._db
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
 class DBFactory:
     @staticmethod
-    def get_db() -> SQLiteDB:
+    def get_db(lazy: bool = False) -> Union[SQLiteDB, LazyDB]:
         """
         Повертає об'єкт для роботи з базою даних.
         За замовчуванням використовує SQLite.
+        З lazy=True база відкривається лише при першому використанні.
         """
+        if lazy:
+            return LazyDB(DBFactory.get_db)
+
         # Визначаємо шлях до папки з даними
         data_dir = os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', 'data')
         
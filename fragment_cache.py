@@ -0,0 +1,59 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+# Скільки фрагментів тримати (картки всіх територій для кожної ролі)
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '4096'))
+
+
+class FragmentCache:
+    """
+    LRU-кеш готових HTML-фрагментів (картки територій на головній сторінці).
+    Ключ визначає, що це за фрагмент (наприклад, id, row_version і роль), а
+    fingerprint - дані, з яких його зібрано: якщо вони інші, фрагмент
+    рендериться заново, тож застарілий HTML не повернеться навіть тоді, коли
+    ключ повторився (версії рядків після відновлення бази з копії).
+    """
+
+    def __init__(self, maxsize: int = FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, fingerprint: Hashable = None) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != fingerprint:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, fingerprint: Hashable, fragment: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = (fingerprint, fragment)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_render(self, key: Hashable, fingerprint: Hashable, render: Callable[[], str]) -> str:
+        """Фрагмент з кешу або render() (результат кешується)"""
+        fragment = self.get(key, fingerprint)
+        if fragment is None:
+            fragment = render()
+            self.put(key, fingerprint, fragment)
+        return fragment
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -1,9 +1,13 @@
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
+from oauth2client.client import AccessTokenRefreshError
 import logging
 import os
 import json
+import threading
 from datetime import datetime, timedelta
+import request_profile
+import metrics
 
 # Налаштування логування
 logging.basicConfig(
@@ -12,13 +16,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Глобальні змінні
-client = None
 SPREADSHEET_ID = os.environ.get('SPREADSHEET_ID')
 if not SPREADSHEET_ID:
     logger.warning("SPREADSHEET_ID не знайдено в змінних середовища. Використовуємо значення за замовчуванням.")
     SPREADSHEET_ID = "17bGUa7uyxFFJhCTp2UdDuydbFW1UyEN7WoqJ6VlbCig"
 
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
 def get_credentials():
     """Отримання credentials з змінної середовища або файлу"""
     try:
@@ -38,54 +46,110 @@ def get_credentials():
         logger.error(f"Помилка отримання credentials: {str(e)}")
         raise
 
-def init_google_sheets():
-    global client
-    try:
+def is_auth_error(error):
+    """Чи свідчить помилка про недійсну/прострочену авторизацію"""
+    if isinstance(error, AccessTokenRefreshError):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        response = getattr(error, 'response', None)
+        return getattr(response, 'status_code', None) == 401
+    return False
+
+class SheetsClientManager:
+    """
+    Лінива авторизація в Google Sheets з кешуванням Spreadsheet/Worksheet.
+    Підключення створюється при першому використанні і оновлюється лише
+    після помилок авторизації. Зберігає стан здоров'я підключення.
+    """
+
+    def __init__(self, spreadsheet_id):
+        self.spreadsheet_id = spreadsheet_id
+        self._lock = threading.RLock()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheet = None
+        self.last_success = None
+        self.last_error = None
+        self.last_error_at = None
+        self.consecutive_failures = 0
+
+    def _authorize(self):
         logger.info("Ініціалізація підключення до Google Sheets...")
-        creds_dict = get_credentials()
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(get_credentials(), SCOPE)
         client = gspread.authorize(creds)
-        logger.info("Авторизація успішна")
-        # Перевіряємо доступ до таблиці
-        try:
-            sheet = client.open_by_key(SPREADSHEET_ID).sheet1
-            logger.info(f"Успішно підключено до таблиці {SPREADSHEET_ID}")
-            return client
-        except gspread.exceptions.APIError as e:
-            logger.error(f"Помилка API Google Sheets: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Помилка доступу до таблиці: {str(e)}")
-            raise
+        spreadsheet = client.open_by_key(self.spreadsheet_id)
+        worksheet = spreadsheet.sheet1
+        self._client, self._spreadsheet, self._worksheet = client, spreadsheet, worksheet
+        logger.info(f"Успішно підключено до таблиці {self.spreadsheet_id}")
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._authorize()
+            return self._client
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                self._authorize()
+            return self._spreadsheet
+
+    def worksheet(self):
+        with self._lock:
+            if self._worksheet is None:
+                self._authorize()
+            return self._worksheet
+
+    def invalidate(self):
+        """Скидає кешоване підключення - наступний виклик авторизується заново"""
+        with self._lock:
+            self._client = None
+            self._spreadsheet = None
+            self._worksheet = None
+
+    def record_success(self):
+        self.last_success = datetime.now()
+        self.consecutive_failures = 0
+
+    def record_failure(self, error):
+        self.last_error = str(error)
+        self.last_error_at = datetime.now()
+        self.consecutive_failures += 1
+        if is_auth_error(error):
+            self.invalidate()
+
+    def health(self):
+        return {
+            'connected': self._worksheet is not None,
+            'last_success': self.last_success.isoformat(timespec='seconds') if self.last_success else None,
+            'last_error': self.last_error,
+            'last_error_at': self.last_error_at.isoformat(timespec='seconds') if self.last_error_at else None,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+sheets = SheetsClientManager(SPREADSHEET_ID)
+
+def init_google_sheets():
+    """Примусово авторизується заново і повертає клієнт gspread"""
+    sheets.invalidate()
+    try:
+        return sheets.client()
     except Exception as e:
         logger.error(f"Помилка ініціалізації Google Sheets: {str(e)}")
-        client = None
+        sheets.record_failure(e)
         raise
 
 def ensure_client():
-    """Ensure we have a valid client, reinitialize if necessary"""
-    global client
-    if client is None:
-        client = init_google_sheets()
-    try:
-        # Test the connection
-        client.open_by_key(SPREADSHEET_ID).sheet1
-    except Exception:
-        # If any error occurs, try to reinitialize
-        client = init_google_sheets()
-    return client
+    """Повертає авторизований клієнт, авторизуючись при першому використанні"""
+    return sheets.client()
 
+@request_profile.timed('sheets')
+@metrics.observed(metrics.SHEETS_DURATION, metrics.SHEETS_ERRORS)
 def get_territories_from_sheet():
     """Отримання списку всіх територій з Google Sheets"""
     try:
         logger.info("Починаємо отримання територій з Google Sheets...")
-        ensure_client()
-        sheet = client.open_by_key(SPREADSHEET_ID).sheet1
+        sheet = sheets.worksheet()
         values = sheet.get_values('A6:A200')  # Отримуємо значення з колонки A
         territories = []
         
@@ -104,114 +168,97 @@ def get_territories_from_sheet():
                 continue
                 
         territories.sort()  # Сортуємо території за номером
+        sheets.record_success()
         logger.info(f"Успішно отримано {len(territories)} територій з Google Sheets")
         return territories
     except Exception as e:
+        sheets.record_failure(e)
         logger.error(f"Помилка при отриманні списку територій: {str(e)}")
         logger.exception("Детальна інформація про помилку:")
         raise
 
+SHEET_COLUMNS = 10  # C..L: 5 блоків по 2 колонки (ім'я/дата видачі, дата повернення)
+SHEET_BLOCKS = SHEET_COLUMNS // 2
+
+def territory_rows(territory_id):
+    """Повертає (рядок_видачі, рядок_дати) території в таблиці"""
+    row_base = 6 + (int(territory_id) - 1)*2
+    return row_base, row_base + 1
+
+def territory_range(territory_id):
+    vis_row, date_row = territory_rows(territory_id)
+    return f'C{vis_row}:L{date_row}'
+
+def normalize_layout(current_data):
+    """Доповнює отримані з таблиці дані до двох рядків по 10 колонок"""
+    current_data = [list(row) for row in (current_data or [])][:2]
+    while len(current_data) < 2:
+        current_data.append([])
+    return [(row + [''] * SHEET_COLUMNS)[:SHEET_COLUMNS] for row in current_data]
+
+def apply_sheet_change(layout, taken_by, date_taken, date_due, returned=False):
+    """
+    Застосовує одну зміну до розкладки C:L території в пам'яті.
+    Повертає нову розкладку (2 рядки по 10 колонок).
+    """
+    layout = [list(row) for row in normalize_layout(layout)]
+
+    if returned:
+        # Шукаємо перший непорожній блок без дати повернення
+        for block in range(SHEET_BLOCKS):
+            i = block * 2
+            if layout[0][i] and not layout[1][i+1]:
+                layout[0][i+1] = ''
+                layout[1][i+1] = date_due  # Додаємо дату повернення
+                break
+        return layout
+
+    # Для нового призначення шукаємо перший порожній блок
+    empty_block = -1
+    for block in range(SHEET_BLOCKS):
+        if not layout[0][block*2]:
+            empty_block = block
+            break
+
+    if empty_block == -1:
+        # Немає місця - зсуваємо всі записи на один блок вліво
+        layout = [row[2:] + ['', ''] for row in layout]
+        empty_block = SHEET_BLOCKS - 1
+
+    i = empty_block * 2
+    layout[0][i], layout[0][i+1] = taken_by, ''
+    layout[1][i], layout[1][i+1] = date_taken, ''
+    return layout
+
+@request_profile.timed('sheets')
+@metrics.observed(metrics.SHEETS_DURATION, metrics.SHEETS_ERRORS)
 def update_google_sheet(territory_id, taken_by, date_taken, date_due, returned=False):
-    logger.info(f"[DEBUG] Starting update_google_sheet with parameters:")
-    logger.info(f"[DEBUG] territory_id: {territory_id}")
-    logger.info(f"[DEBUG] taken_by: {taken_by}")
-    logger.info(f"[DEBUG] date_taken: {date_taken}")
-    logger.info(f"[DEBUG] date_due: {date_due}")
-    logger.info(f"[DEBUG] returned: {returned}")
+    logger.debug(f"update_google_sheet: territory_id={territory_id}, taken_by={taken_by}, "
+                 f"date_taken={date_taken}, date_due={date_due}, returned={returned}")
     
     try:
-        logger.info(f"[DEBUG] Ensuring client connection...")
-        ensure_client()
-        logger.info(f"[DEBUG] Client connection successful")
+        sheet = sheets.worksheet()
         
-        sheet = client.open_by_key(SPREADSHEET_ID).sheet1
-        logger.info(f"[DEBUG] Successfully opened sheet")
-        
-        logger.info(f"[ВІДЛАГОДЖЕННЯ] Оновлення даних для території {territory_id}")
-        logger.info(f"Починаємо оновлення Google Sheet для території {territory_id}")
-        logger.info(f"Параметри: взяв={taken_by}, дата_взяття={date_taken}, повернуто={returned}")
+        logger.debug(f"Починаємо оновлення Google Sheet для території {territory_id}")
         
         # Конвертуємо в ціле число для розрахунку рядка
         try:
             territory_id = int(territory_id)
-            row_base = 6 + (territory_id - 1)*2
-            vis_row, date_row = row_base, row_base + 1
+            range_name = territory_range(territory_id)
         except ValueError as e:
             logger.error(f"Помилка конвертації territory_id: {e}")
             raise
         
-        logger.info(f"Рядки для оновлення: рядок_видачі={vis_row}, рядок_дати={date_row}")
-        
         try:
             # Отримуємо поточні дані
-            range_name = f'C{vis_row}:L{date_row}'
-            current_data = sheet.get_values(range_name)
-            
-            logger.info(f"Отримані поточні дані: {current_data}")
+            current_data = normalize_layout(sheet.get_values(range_name))
+            logger.debug(f"Отримані поточні дані {range_name}: {current_data}")
             
-            # Ініціалізуємо дані якщо вони порожні
-            if not current_data:
-                current_data = [[''] * 10, [''] * 10]
-            elif len(current_data) < 2:
-                current_data.append([''] * 10)
-            
-            # Переконуємося що у нас достатньо стовпців
-            current_data[0] = (current_data[0] + [''] * 10)[:10]
-            current_data[1] = (current_data[1] + [''] * 10)[:10]
-            
-            if returned:
-                logger.info("Додавання дати повернення")
-                # Шукаємо останній непорожній блок без дати повернення
-                last_block = -1
-                for i in range(0, 10, 2):
-                    if i < len(current_data[0]) and current_data[0][i] and (i+1 >= len(current_data[1]) or not current_data[1][i+1]):
-                        last_block = i // 2
-                        break
-                
-                if last_block != -1:
-                    # Додаємо дату повернення у відповідну колонку
-                    col_start = chr(ord('C') + last_block*2)
-                    col_end = chr(ord('C') + last_block*2 + 1)
-                    range_name = f'{col_start}{vis_row}:{col_end}{date_row}'
-                    values = [
-                        [current_data[0][last_block*2], ''],  # Зберігаємо ім'я
-                        [current_data[1][last_block*2], date_due]  # Додаємо дату повернення
-                    ]
-                    sheet.update(range_name, values, raw=False)
-                    logger.info(f"Додано дату повернення в діапазон {range_name}")
-                return
-
-            # Для нового призначення території
-            # Шукаємо перший порожній блок
-            empty_block = -1
-            for i in range(0, 10, 2):
-                if i >= len(current_data[0]) or not current_data[0][i]:
-                    empty_block = i // 2
-                    break
-
-            if empty_block == -1 or empty_block >= 5:  # Якщо немає місця або досягли останнього блоку
-                logger.info("Зсуваємо історію вліво")
-                # Зсуваємо всі записи на один блок вліво
-                new_data = [[''] * 10, [''] * 10]
-                for i in range(2, 10, 2):  # Копіюємо з другого блоку до кінця
-                    if i < len(current_data[0]):
-                        new_data[0][i-2] = current_data[0][i]  # Копіюємо ім'я
-                        new_data[0][i-1] = current_data[0][i+1] if i+1 < len(current_data[0]) else ''
-                        new_data[1][i-2] = current_data[1][i]  # Копіюємо дату взяття
-                        new_data[1][i-1] = current_data[1][i+1] if i+1 < len(current_data[1]) else ''
-                
-                # Оновлюємо весь діапазон
+            new_data = apply_sheet_change(current_data, taken_by, date_taken, date_due, returned)
+            if new_data != current_data:
                 sheet.update(range_name, new_data, raw=False)
-                empty_block = 4  # Використовуємо останній блок
-                logger.info("Історію зсунуто вліво")
-
-            # Оновлюємо порожній блок
-            col_start = chr(ord('C') + empty_block*2)
-            col_end = chr(ord('C') + empty_block*2 + 1)
-            update_range = f'{col_start}{vis_row}:{col_end}{date_row}'
-            values = [[taken_by, ''], [date_taken, '']]
-            sheet.update(update_range, values, raw=False)
-            logger.info(f"Додано новий запис в діапазон {update_range}")
+                logger.info(f"Оновлено діапазон {range_name}")
+            sheets.record_success()
 
         except gspread.exceptions.APIError as e:
             logger.error(f"Помилка API Google Sheets: {str(e)}")
@@ -221,16 +268,72 @@ def update_google_sheet(territory_id, taken_by, date_taken, date_due, returned=F
             raise
             
     except Exception as e:
+        sheets.record_failure(e)
         logger.error(f"Помилка при оновленні Google Sheet для території {territory_id}: {str(e)}")
         logger.exception("Детальна інформація про помилку:")
         raise
 
+@request_profile.timed('sheets')
+@metrics.observed(metrics.SHEETS_DURATION, metrics.SHEETS_ERRORS)
+def sync_sheet_changes(changes):
+    """
+    Пакетна синхронізація: змінам тієї ж території застосовуються по черзі в пам'яті,
+    усі діапазони читаються одним batch_get і записуються одним batch_update.
+    changes - список словників з параметрами update_google_sheet у порядку їх появи.
+    Повертає кількість оновлених територій.
+    """
+    if not changes:
+        return 0
+
+    # Групуємо зміни за територіями, зберігаючи порядок
+    by_territory = {}
+    for change in changes:
+        by_territory.setdefault(int(change['territory_id']), []).append(change)
+
+    territory_ids = sorted(by_territory)
+    ranges = [territory_range(territory_id) for territory_id in territory_ids]
+    logger.info(f"Пакетна синхронізація {len(changes)} змін для {len(territory_ids)} територій")
+
+    try:
+        sheet = sheets.worksheet()
+
+        current = sheet.batch_get(ranges)
+        updates = []
+        for territory_id, range_name, values in zip(territory_ids, ranges, current):
+            layout = normalize_layout(values)
+            new_layout = layout
+            for change in by_territory[territory_id]:
+                new_layout = apply_sheet_change(
+                    new_layout,
+                    taken_by=change.get('taken_by', ''),
+                    date_taken=change.get('date_taken', ''),
+                    date_due=change.get('date_due', ''),
+                    returned=change.get('returned', False)
+                )
+            if new_layout != layout:
+                updates.append({'range': range_name, 'values': new_layout})
+
+        if updates:
+            sheet.batch_update(updates, value_input_option='USER_ENTERED')
+        sheets.record_success()
+        logger.info(f"Пакетно оновлено {len(updates)} діапазонів")
+        return len(updates)
+    except gspread.exceptions.APIError as e:
+        sheets.record_failure(e)
+        logger.error(f"Помилка API Google Sheets при пакетній синхронізації: {str(e)}")
+        raise
+    except Exception as e:
+        sheets.record_failure(e)
+        logger.error(f"Помилка пакетної синхронізації Google Sheets: {str(e)}")
+        raise
+
+@request_profile.timed('sheets')
+@metrics.observed(metrics.SHEETS_DURATION, metrics.SHEETS_ERRORS)
 def clear_google_sheet(territory_id):
-    logger.info(f"[ВІДЛАГОДЖЕННЯ] Починаємо очищення всіх даних для території {territory_id}")
+    logger.debug(f"Починаємо очищення всіх даних для території {territory_id}")
     try:
-        ensure_client()
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        sheet = spreadsheet.sheet1
+        spreadsheet = sheets.spreadsheet()
+        sheet = sheets.worksheet()
         
         # Конвертуємо в ціле число для розрахунку діапазону
         territory_id = int(territory_id)
@@ -239,7 +342,7 @@ def clear_google_sheet(territory_id):
         
         # Очищаємо весь діапазон від C до L
         range_name = f'C{vis_row}:L{date_row}'
-        logger.info(f"Спроба очистити діапазон {range_name}")
+        logger.debug(f"Спроба очистити діапазон {range_name}")
         
         try:
             # Створюємо порожній діапазон значень
@@ -250,16 +353,16 @@ def clear_google_sheet(territory_id):
             
             # Спочатку спробуємо прямий метод оновлення
             sheet.update(range_name, empty_values, value_input_option='RAW')
-            logger.info("Застосовано прямий метод очищення")
+            logger.debug("Застосовано прямий метод очищення")
             
             # Перевіряємо, чи очистилось
             values = sheet.get_values(range_name)
             if values and any(any(cell for cell in row) for row in values):
-                logger.info("Спроба альтернативного методу очищення...")
+                logger.debug("Спроба альтернативного методу очищення...")
                 
                 # Спробуємо метод batch_clear
                 sheet.batch_clear([range_name])
-                logger.info("Застосовано batch_clear")
+                logger.debug("Застосовано batch_clear")
                 
                 # Перевіряємо ще раз
                 values = sheet.get_values(range_name)
@@ -268,8 +371,9 @@ def clear_google_sheet(territory_id):
                     sheet_name = sheet.title
                     full_range = f"'{sheet_name}'!{range_name}"
                     spreadsheet.values_clear(full_range)
-                    logger.info("Застосовано values_clear")
+                    logger.debug("Застосовано values_clear")
             
+            sheets.record_success()
             logger.info(f"Успішно очищено всі дані для території {territory_id}")
             return True
             
@@ -278,13 +382,7 @@ def clear_google_sheet(territory_id):
             raise
             
     except Exception as e:
+        sheets.record_failure(e)
         logger.error(f"Критична помилка при очищенні даних території {territory_id}: {str(e)}")
         logger.exception("Детальна інформація про помилку:")
         raise
-
-# Ініціалізуємо клієнт при імпорті модуля
-try:
-    client = init_google_sheets()
-except Exception as e:
-    logger.error(f"Не вдалося ініціалізувати Google Sheets: {e}")
-    client = None  # Встановлюємо client як None, спробуємо ініціалізувати при першому використанні
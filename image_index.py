@@ -0,0 +1,137 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Налаштування логування
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Як часто (в секундах) перевіряти mtime папок з фото
+IMAGE_INDEX_TTL = float(os.environ.get('IMAGE_INDEX_TTL', '30'))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+def file_digest(path: str) -> str:
+    """Хеш вмісту файлу (перші 16 символів sha256)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class ImageIndex:
+    """
+    Індекс фотографій територій: один прохід по папках замість os.path.exists
+    для кожної території. Папки перевіряються в порядку пріоритету (спочатку Volume,
+    потім static), індекс перебудовується після завантаження фото або коли
+    змінюється mtime папки (не частіше ніж раз на ttl секунд).
+    """
+
+    def __init__(self, locations: List[Tuple[str, str]], ttl: float = IMAGE_INDEX_TTL):
+        # locations: [(папка, url-префікс), ...] у порядку пріоритету
+        self.locations = locations
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._images: Dict[int, Dict] = {}
+        self._dir_mtimes: Dict[str, Optional[float]] = {}
+        self._checked_at = 0.0
+        self._scanned = False
+        # (шлях, розмір, mtime) -> хеш вмісту
+        self._digests: Dict[tuple, str] = {}
+
+    def _dir_mtime(self, directory: str) -> Optional[float]:
+        try:
+            return os.stat(directory).st_mtime
+        except OSError:
+            return None
+
+    def _scan(self) -> None:
+        images = {}
+        dir_mtimes = {}
+        # Йдемо від найнижчого пріоритету, щоб вищий перезаписував нижчий
+        for directory, url_prefix in reversed(self.locations):
+            dir_mtimes[directory] = self._dir_mtime(directory)
+            if dir_mtimes[directory] is None:
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    stem, ext = os.path.splitext(entry.name)
+                    if ext.lower() not in IMAGE_EXTENSIONS or not stem.isdigit():
+                        continue
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    images[int(stem)] = {
+                        'path': entry.path,
+                        'url': f"{url_prefix.rstrip('/')}/{entry.name}",
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime,
+                    }
+        self._images = images
+        self._dir_mtimes = dir_mtimes
+        self._scanned = True
+        logger.info(f"Індекс фото оновлено: {len(images)} файлів")
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._scanned and now - self._checked_at < self.ttl:
+            return
+        with self._lock:
+            if self._scanned and now - self._checked_at < self.ttl:
+                return
+            changed = not self._scanned or any(
+                self._dir_mtime(directory) != mtime for directory, mtime in self._dir_mtimes.items()
+            )
+            if changed:
+                self._scan()
+            self._checked_at = now
+
+    def refresh(self) -> None:
+        """Примусово перебудовує індекс (наприклад, після завантаження фото)"""
+        with self._lock:
+            self._scan()
+            self._checked_at = time.monotonic()
+
+    def get(self, territory_id: int) -> Optional[Dict]:
+        """Повертає {'path', 'url', 'size', 'mtime'} фото території або None"""
+        self._ensure_fresh()
+        return self._images.get(int(territory_id))
+
+    def images(self) -> List[Dict]:
+        """Усі знайдені фото"""
+        self._ensure_fresh()
+        return list(self._images.values())
+
+    def digest(self, image: Dict, compute: bool = True) -> Optional[str]:
+        """
+        Хеш вмісту фото (кешується за шляхом, розміром і mtime).
+        З compute=False повертає лише вже відомий хеш, не читаючи файл.
+        """
+        key = (image['path'], image['size'], image['mtime'])
+        digest = self._digests.get(key)
+        if digest is None and compute:
+            digest = file_digest(image['path'])
+            self._digests[key] = digest
+        return digest
+
+    def preload_digests(self, entries) -> None:
+        """Завантажує відомі хеші [(шлях, розмір, mtime, sha256), ...], щоб не читати файли"""
+        for path, size, mtime, sha256 in entries:
+            self._digests[(path, size, mtime)] = sha256[:16]
+
+    def versioned_url(self, image: Optional[Dict]) -> Optional[str]:
+        """URL фото з хешем вмісту (?v=...), якщо хеш уже відомий - такий URL кешується назавжди"""
+        if not image:
+            return None
+        digest = self.digest(image, compute=False)
+        return f"{image['url']}?v={digest}" if digest else image['url']
+
+    def image_url(self, territory_id: int) -> Optional[str]:
+        return self.versioned_url(self.get(territory_id))
+
+    def has_image(self, territory_id: int) -> bool:
+        return self.get(territory_id) is not None
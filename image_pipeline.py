@@ -0,0 +1,204 @@
+import os
+import json
+import logging
+import threading
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+# Pillow імпортується лише у процесах пулу і для перевірки завантажень;
+# без нього показуємо оригінальні фото
+PILLOW_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# Налаштування логування
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Варіанти розмірів (ширина в пікселях) і формати похідних зображень
+VARIANTS = {'thumb': 320, 'card': 640, 'full': 1280}
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 75, 'method': 4},
+    'JPEG': {'quality': 80, 'optimize': True, 'progressive': True},
+}
+META_FILE = 'meta.json'
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+
+
+def is_jpeg(stream) -> bool:
+    """
+    Чи є вміст stream справжнім JPEG: Image.verify() і формат JPEG, без Pillow -
+    сигнатура файлу. Після перевірки stream повертається на початок.
+    """
+    try:
+        if not PILLOW_AVAILABLE:
+            return stream.read(3) == b'\xff\xd8\xff'
+        from PIL import Image
+        with Image.open(stream) as image:
+            image.verify()
+            return image.format == 'JPEG'
+    except Exception:
+        return False
+    finally:
+        stream.seek(0)
+
+
+def build_derivatives(source_path: str, digest: str, out_root: str) -> Dict:
+    """
+    Створює всі варіанти зображення в out_root/<digest>/ і повертає їх метадані.
+    Виконується в окремому процесі, тому функція модульного рівня.
+    """
+    out_dir = os.path.join(out_root, digest)
+    meta_path = os.path.join(out_dir, META_FILE)
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+
+    from PIL import Image, ImageOps
+
+    os.makedirs(out_dir, exist_ok=True)
+    meta = {}
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source).convert('RGB')
+        for variant, width in VARIANTS.items():
+            resized = image.copy()
+            # thumbnail не збільшує зображення, тому фактичну ширину записуємо в meta
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            for ext, image_format in FORMATS.items():
+                target = os.path.join(out_dir, f"{variant}.{ext}")
+                tmp = f"{target}.{os.getpid()}.tmp"
+                resized.save(tmp, image_format, **SAVE_OPTIONS[image_format])
+                os.replace(tmp, target)
+            meta[variant] = list(resized.size)
+
+    # meta.json пишемо останнім - його наявність означає, що всі варіанти готові
+    tmp = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+    return meta
+
+
+class DerivativeStore:
+    """
+    Кеш зменшених копій фото територій (thumb/card/full у WebP та JPEG),
+    ключ - хеш вмісту оригіналу. Копії створюються пулом процесів під час
+    старту або завантаження фото, а не під час запиту.
+    """
+
+    def __init__(self, root: str, digest_for: Callable[..., Optional[str]],
+                 url_prefix: str = '/img', workers: int = IMAGE_WORKERS):
+        self.root = root
+        # digest_for(image, compute=True) - хеш вмісту оригіналу (ImageIndex.digest)
+        self.digest_for = digest_for
+        self.url_prefix = url_prefix.rstrip('/')
+        self.workers = workers
+        self.enabled = PILLOW_AVAILABLE
+        self._lock = threading.Lock()
+        # хеш -> meta готових варіантів
+        self._ready: Dict[str, Dict] = {}
+        self._executor = None
+        if not self.enabled:
+            logger.warning("Pillow не встановлено - зменшені копії фото не створюються")
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _load_ready(self) -> None:
+        """Підхоплює вже створені на диску варіанти"""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            meta_path = os.path.join(self.root, name, META_FILE)
+            if name not in self._ready and os.path.exists(meta_path):
+                with open(meta_path, 'r') as f:
+                    self._ready[name] = json.load(f)
+
+    def build(self, images: Iterable[Dict], wait: bool = False) -> None:
+        """Ставить у пул створення варіантів для фото, яких ще немає в кеші"""
+        if not self.enabled:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self._load_ready()
+
+        futures = []
+        for image in images:
+            digest = self.digest_for(image)
+            if digest in self._ready:
+                continue
+            try:
+                future = self._get_executor().submit(build_derivatives, image['path'], digest, self.root)
+            except RuntimeError:
+                # Пул уже зупинено (процес завершується)
+                break
+            future.add_done_callback(lambda f, digest=digest: self._on_built(digest, f))
+            futures.append(future)
+
+        if futures:
+            logger.info(f"Створюємо зменшені копії для {len(futures)} фото")
+        if wait:
+            for future in futures:
+                future.exception()
+
+    def _on_built(self, digest: str, future) -> None:
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Помилка створення зменшених копій {digest}: {str(error)}")
+            return
+        self._ready[digest] = future.result()
+
+    def picture(self, image: Optional[Dict]) -> Optional[Dict]:
+        """
+        Дані для <picture>: src, srcset для WebP/JPEG, ширина і висота.
+        Якщо копії ще не готові - повертає лише оригінальний URL.
+        """
+        if not image:
+            return None
+        # Хеш рахується під час побудови копій, а не в запиті
+        digest = self.digest_for(image, compute=False)
+        meta = self._ready.get(digest) if digest else None
+        if not meta:
+            src = f"{image['url']}?v={digest}" if digest else image['url']
+            return {'src': src, 'srcset_webp': '', 'srcset_jpg': '', 'width': None, 'height': None}
+
+        base = f"{self.url_prefix}/{digest}"
+        srcsets = {}
+        for ext in FORMATS:
+            # Однакові фактичні ширини (мале оригінальне фото) не дублюємо
+            seen = {}
+            for variant, size in meta.items():
+                seen.setdefault(size[0], f"{base}/{variant}.{ext} {size[0]}w")
+            srcsets[ext] = ', '.join(seen[width] for width in sorted(seen))
+        card_width, card_height = meta['card']
+        return {
+            'src': f"{base}/card.jpg",
+            'srcset_webp': srcsets['webp'],
+            'srcset_jpg': srcsets['jpg'],
+            'width': card_width,
+            'height': card_height
+        }
+
+    def thumbnail(self, image: Optional[Dict]) -> Optional[Dict]:
+        """
+        Найменша копія для офлайн-пакета: {'url', 'digest', 'width', 'height'}.
+        Поки копії не готові - оригінал (з ?v=хеш, якщо хеш уже відомий).
+        """
+        if not image:
+            return None
+        digest = self.digest_for(image, compute=False)
+        meta = self._ready.get(digest) if digest else None
+        if not meta:
+            url = f"{image['url']}?v={digest}" if digest else image['url']
+            return {'url': url, 'digest': digest, 'width': None, 'height': None}
+        width, height = meta['thumb']
+        return {'url': f"{self.url_prefix}/{digest}/thumb.jpg", 'digest': digest, 'width': width, 'height': height}
+
+    def path_for(self, digest: str, filename: str) -> Optional[str]:
+        """Шлях до файлу варіанта, якщо назва коректна"""
+        name, ext = os.path.splitext(filename)
+        if name not in VARIANTS or ext.lstrip('.') not in FORMATS or not digest.isalnum():
+            return None
+        return os.path.join(self.root, digest, filename)
@@ -1,6 +1,6 @@
 import sqlite3
-import pandas as pd
-import os
+from address_parser import ADDRESS_COLUMNS
+from territory_import import import_territories
 
 def init_db():
     # Підключаємося до бази даних
@@ -18,10 +18,29 @@ def init_db():
         date_taken TEXT DEFAULT '',
         date_due TEXT DEFAULT '',
         notes TEXT DEFAULT '',
-        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+        street TEXT,
+        street_key TEXT,
+        building TEXT,
+        entrance INTEGER,
+        apt_from INTEGER,
+        apt_to INTEGER
     )
     ''')
     
+    # База, створена до появи колонок адреси
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(territories)')}
+    for column in ADDRESS_COLUMNS:
+        if column not in columns:
+            column_type = 'INTEGER' if column in ('entrance', 'apt_from', 'apt_to') else 'TEXT'
+            cursor.execute(f'ALTER TABLE territories ADD COLUMN {column} {column_type}')
+    
+    # Пошук території за вулицею, будинком і квартирою
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_territories_address
+    ON territories (street_key, building, apt_from, apt_to)
+    ''')
+    
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS territory_history (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -34,34 +53,17 @@ def init_db():
     )
     ''')
     
-    # Читаємо дані з CSV файлу
+    # Зберігаємо таблиці до імпорту: territory_import пише у власній транзакції
+    conn.commit()
+    conn.close()
+    
+    # Читаємо дані з CSV файлу (частинами, запис однією транзакцією)
     try:
-        # Використовуємо кому як роздільник
-        df = pd.read_csv('облік територій.csv')
-        
-        # Підготовка даних для імпорту
-        territories = []
-        for index, row in df.iterrows():
-            territory_id = row['id']
-            custom_name = row['custom_name'].strip() if pd.notna(row['custom_name']) else ''
-            name = f"Територія {territory_id}"
-            
-            territories.append((territory_id, name, custom_name, 'Вільна'))
-        
-        # Додаємо території
-        cursor.executemany('''
-        INSERT OR REPLACE INTO territories (id, name, custom_name, status)
-        VALUES (?, ?, ?, ?)
-        ''', territories)
-        
-        # Зберігаємо зміни
-        conn.commit()
-        print(f"База даних успішно ініціалізована! Додано {len(territories)} територій.")
-        
+        report = import_territories('облік територій.csv', 'territories.db', remove_missing=False)
+        print(f"База даних успішно ініціалізована! Додано {len(report['added'])} територій, "
+              f"оновлено назв {len(report['changed'])}.")
     except Exception as e:
         print(f"Помилка при читанні файлу CSV: {str(e)}")
-    finally:
-        conn.close()
 
 if __name__ == '__main__':
     init_db() 
\ No newline at end of file
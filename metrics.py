@@ -0,0 +1,402 @@
+"""
+Метрики у форматі Prometheus (text exposition 0.0.4) для /metrics.
+
+Значення зберігаються в пам'яті процесу: запис метрики - це кілька операцій
+зі словником під блокуванням, без файлів і мережі. Лічильники, які вже є в
+інших класах (FragmentCache.hits), не дублюються - колектор копіює їх під час
+збору.
+
+Кілька процесів (gunicorn з кількома workers): якщо задано METRICS_MULTIPROC_DIR
+(або PROMETHEUS_MULTIPROC_DIR), кожен процес раз на METRICS_FLUSH_INTERVAL
+секунд і при завершенні записує свої значення у файл metrics_<pid>.json цієї
+папки, а /metrics підсумовує файли всіх процесів (значення інших workers
+можуть відставати на інтервал запису). Лічильники завершених процесів
+лишаються в сумі, gauge - лише живих процесів. Папку варто очищати перед
+стартом сервера (clear_directory), інакше враховуються процеси попередніх запусків.
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+import functools
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Налаштування логування
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Межі кошиків тривалості, секунди
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2)
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, object] = {}
+        (registry or REGISTRY).register(self)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def samples(self) -> List:
+        """[[значення міток], значення] - формат файлу процесу"""
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """Лічильник, що лише зростає; labels передаються позиційно: inc('GET', 'index')"""
+    type = 'counter'
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, value: float, *labels) -> None:
+        """Для лічильників, що вже рахуються деінде: значення копіюється під час збору"""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(_Metric):
+    """
+    Поточне значення. multiprocess_mode: livesum - сума живих процесів,
+    liveall - окремий ряд для кожного живого процесу (мітка pid), max - найбільше.
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 multiprocess_mode: str = 'livesum', registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Розподіл значень за кошиками (тривалість, розмір); observe(0.12, 'GET', 'index')"""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = DURATION_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [лічильники кошиків (останній - +Inf), сума]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self) -> List:
+        with self._lock:
+            return [[list(labels), [list(counts), total]] for labels, (counts, total) in self._values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], None]) -> None:
+        """collector() викликається перед кожним збором і оновлює значення метрик"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        """Значення всіх метрик процесу: {name: {type, help, labelnames, buckets, mode, samples}}"""
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Помилка колектора метрик: {str(e)}")
+        families = {}
+        for metric in list(self._metrics):
+            families[metric.name] = {
+                'type': metric.type,
+                'help': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', ())),
+                'mode': getattr(metric, 'multiprocess_mode', None),
+                'samples': metric.samples()
+            }
+        return families
+
+    def reset(self) -> None:
+        for metric in list(self._metrics):
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+
+def register_collector(collector: Callable[[], None]) -> None:
+    REGISTRY.register_collector(collector)
+
+
+# --- Файли процесів (режим кількох workers) ---
+
+def _process_file(directory: str, pid: int) -> str:
+    return os.path.join(directory, f'metrics_{pid}.json')
+
+
+def flush(registry: Registry = REGISTRY, directory: Optional[str] = METRICS_DIR) -> None:
+    """Записує значення поточного процесу у файл папки метрик"""
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = _process_file(directory, os.getpid())
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _is_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clear_directory(directory: Optional[str] = METRICS_DIR) -> None:
+    """Видаляє файли процесів попередніх запусків (викликати до старту workers)"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith('metrics_') and name.endswith('.json'):
+            os.remove(os.path.join(directory, name))
+
+
+def _load_processes(registry: Registry, directory: Optional[str]) -> List[Tuple[int, Dict]]:
+    """[(pid, snapshot)]: поточний процес - живі значення, інші - з файлів"""
+    processes = [(os.getpid(), registry.snapshot())]
+    if not directory or not os.path.isdir(directory):
+        return processes
+    for name in os.listdir(directory):
+        if not (name.startswith('metrics_') and name.endswith('.json')):
+            continue
+        try:
+            pid = int(name[len('metrics_'):-len('.json')])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        try:
+            with open(os.path.join(directory, name), 'r') as f:
+                processes.append((pid, json.load(f)))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не вдалося прочитати метрики процесу {pid}: {str(e)}")
+    return processes
+
+
+def _merge(processes: List[Tuple[int, Dict]]) -> Dict:
+    """Підсумовує значення процесів за правилами типу метрики"""
+    merged = {}
+    for pid, families in processes:
+        alive = None
+        for name, family in families.items():
+            target = merged.setdefault(name, dict(family, samples={}))
+            samples = target['samples']
+            if family['type'] == 'gauge':
+                if alive is None:
+                    alive = _is_alive(pid)
+                if not alive:
+                    continue
+            for labels, value in family['samples']:
+                if family['type'] == 'gauge' and family['mode'] == 'liveall':
+                    labels = labels + [str(pid)]
+                key = tuple(labels)
+                if family['type'] == 'histogram':
+                    counts, total = samples.get(key, [[0] * len(value[0]), 0.0])
+                    samples[key] = [[a + b for a, b in zip(counts, value[0])], total + value[1]]
+                elif family['type'] == 'gauge' and family['mode'] == 'max':
+                    samples[key] = max(samples.get(key, value), value)
+                else:
+                    samples[key] = samples.get(key, 0) + value
+    for family in merged.values():
+        if family['type'] == 'gauge' and family['mode'] == 'liveall':
+            family['labelnames'] = family['labelnames'] + ['pid']
+    return merged
+
+
+# --- Текстовий формат ---
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: List[str], values: Iterable, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def exposition(families: Dict) -> str:
+    lines = []
+    for name, family in sorted(families.items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        labelnames = family['labelnames']
+        for labels, value in sorted(family['samples'].items()):
+            if family['type'] == 'histogram':
+                counts, total = value
+                cumulative = 0
+                for edge, count in zip(family['buckets'] + ['+Inf'], counts):
+                    cumulative += count
+                    le = edge if edge == '+Inf' else _format_number(float(edge))
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_number(total)}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def generate_latest(registry: Registry = REGISTRY, directory: Optional[str] = METRICS_DIR) -> str:
+    """Текст для /metrics (з усіх процесів, якщо задано папку метрик)"""
+    processes = _load_processes(registry, directory)
+    if len(processes) == 1:
+        families = {name: dict(family, samples={tuple(labels): value for labels, value in family['samples']})
+                    for name, family in processes[0][1].items()}
+    else:
+        families = _merge(processes)
+    return exposition(families)
+
+
+def _flush_loop(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Помилка запису метрик процесу: {str(e)}")
+
+
+def _start_flusher() -> None:
+    if not METRICS_DIR or METRICS_FLUSH_INTERVAL <= 0:
+        return
+    threading.Thread(target=_flush_loop, args=(METRICS_FLUSH_INTERVAL,), name='metrics-flush', daemon=True).start()
+
+
+def _after_fork() -> None:
+    # Значення, записані до fork (gunicorn --preload), належать батьківському процесу
+    REGISTRY.reset()
+    _start_flusher()
+
+
+def _flush_at_exit() -> None:
+    try:
+        flush()
+    except Exception as e:
+        logger.error(f"Помилка запису метрик при завершенні: {str(e)}")
+
+
+if METRICS_DIR:
+    _start_flusher()
+    atexit.register(_flush_at_exit)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_after_fork)
+
+
+# --- Допоміжні функції для коду застосунку ---
+
+def observed(histogram: Histogram, errors: Optional[Counter] = None, name: Optional[str] = None):
+    """Декоратор: тривалість виклику в histogram і помилки в errors (мітка - назва функції)"""
+    def decorator(func: Callable) -> Callable:
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(label)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, label)
+        return wrapper
+    return decorator
+
+
+def instrument(cls: type, histogram: Histogram, errors: Optional[Counter] = None,
+               exclude: Iterable[str] = ()) -> None:
+    """Обгортає публічні методи класу в observed(histogram, errors)"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or name in exclude or not callable(attr) \
+                or isinstance(attr, (staticmethod, classmethod, type)):
+            continue
+        setattr(cls, name, observed(histogram, errors, name)(attr))
+
+
+# --- Метрики застосунку ---
+
+REQUEST_DURATION = Histogram(
+    'territory_http_request_duration_seconds', 'Тривалість обробки HTTP-запитів',
+    ('method', 'endpoint')
+)
+REQUESTS = Counter(
+    'territory_http_requests_total', 'HTTP-запити за кодом відповіді',
+    ('method', 'endpoint', 'status')
+)
+DB_DURATION = Histogram(
+    'territory_db_query_duration_seconds', 'Тривалість викликів SQLiteDB (_count - кількість викликів)',
+    ('method',)
+)
+DB_ERRORS = Counter('territory_db_errors_total', 'Помилки викликів SQLiteDB', ('method',))
+SHEETS_DURATION = Histogram(
+    'territory_sheets_request_duration_seconds', 'Тривалість операцій з Google Sheets API',
+    ('operation',), buckets=SLOW_BUCKETS
+)
+SHEETS_ERRORS = Counter('territory_sheets_errors_total', 'Помилки операцій з Google Sheets API', ('operation',))
+BACKUP_DURATION = Histogram(
+    'territory_backup_duration_seconds', 'Тривалість резервного копіювання',
+    ('mode',), buckets=SLOW_BUCKETS
+)
+BACKUP_SIZE = Histogram(
+    'territory_backup_size_bytes', 'Розмір створених резервних копій',
+    ('mode',), buckets=SIZE_BUCKETS
+)
+BACKUP_ERRORS = Counter('territory_backup_errors_total', 'Невдалі резервні копіювання', ('mode',))
+CACHE_HITS = Counter('territory_cache_hits_total', 'Влучання в кеш', ('cache',))
+CACHE_MISSES = Counter('territory_cache_misses_total', 'Промахи кешу', ('cache',))
+CACHE_SIZE = Gauge('territory_cache_entries', 'Кількість записів у кеші', ('cache',), multiprocess_mode='liveall')
@@ -0,0 +1,258 @@
+"""
+Профілювання запитів.
+
+З REQUEST_PROFILE=true кожен запит вимірюється: загальний час і час у базі
+(методи SQLiteDB), Google Sheets, рендері шаблонів і перевірках файлів.
+Підсумок додається до відповіді заголовком Server-Timing (видно у вкладці
+Network браузера), а час останніх REQUEST_PROFILE_WINDOW запитів кожного
+endpoint зберігається для перцентилів p50/p95/p99 на сторінці /debug/perf.
+З REQUEST_PROFILE_SAMPLE > 0 така частка запитів додатково знімається
+cProfile (звіти останніх REQUEST_PROFILE_KEEP запитів там само).
+
+Виклики поза запитом (обробник черги Google Sheets) рахуються окремо за
+назвою функції.
+"""
+import io
+import os
+import time
+import pstats
+import random
+import cProfile
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+ENABLED = os.environ.get('REQUEST_PROFILE', 'False').lower() == 'true'
+PROFILE_WINDOW = int(os.environ.get('REQUEST_PROFILE_WINDOW', '500'))
+PROFILE_SAMPLE = float(os.environ.get('REQUEST_PROFILE_SAMPLE', '0'))
+PROFILE_KEEP = int(os.environ.get('REQUEST_PROFILE_KEEP', '20'))
+# Скільки рядків pstats зберігати у звіті cProfile
+PROFILE_STATS_LINES = 40
+
+# Категорії часу: ключ для Server-Timing і опис
+CATEGORIES = {
+    'db': 'SQLite',
+    'sheets': 'Google Sheets',
+    'tpl': 'Шаблони',
+    'fs': 'Файли',
+    'compress': 'Стиснення',
+}
+# Межі кошиків гістограми, мс
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_local = threading.local()
+_lock = threading.Lock()
+# endpoint -> deque[(загальний час, {категорія: час})], секунди
+_requests: Dict[str, deque] = {}
+_background: Dict[str, deque] = {}
+_profiles: deque = deque(maxlen=PROFILE_KEEP)
+_profile_ids = 0
+# cProfile знімається лише з одного запиту водночас
+_profiler_lock = threading.Lock()
+
+
+def _record_timing(category: str, name: str, duration: float) -> None:
+    state = getattr(_local, 'request', None)
+    if state is not None:
+        totals = state['timings'].setdefault(category, [0.0, 0])
+        totals[0] += duration
+        totals[1] += 1
+        return
+    with _lock:
+        _background.setdefault(f"{category}: {name}", deque(maxlen=PROFILE_WINDOW)).append(duration)
+
+
+@contextmanager
+def timer(category: str, name: str = ''):
+    """
+    Вимірює блок коду як час категорії поточного запиту. Вкладені виміри тієї
+    ж категорії (метод бази, що викликає інший метод бази) не рахуються двічі.
+    """
+    if not ENABLED:
+        yield
+        return
+    depth = getattr(_local, 'depth', None)
+    if depth is None:
+        depth = _local.depth = {}
+    if depth.get(category):
+        yield
+        return
+    depth[category] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        depth[category] = 0
+        _record_timing(category, name, time.perf_counter() - started)
+
+
+def timed(category: str):
+    """Декоратор для timer(); без REQUEST_PROFILE функція повертається як є"""
+    def decorator(func: Callable) -> Callable:
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(category, func.__qualname__):
+                return func(*args, **kwargs)
+        wrapper.__profiled__ = True
+        return wrapper
+    return decorator
+
+
+def instrument(cls: type, category: str, names: Optional[Iterable[str]] = None,
+               exclude: Iterable[str] = ()) -> None:
+    """Обгортає публічні методи класу (або вказані names) у timed(category)"""
+    if not ENABLED:
+        return
+    for name in list(names or vars(cls)):
+        if (not names and name.startswith('_')) or name in exclude:
+            continue
+        attr = vars(cls).get(name)
+        if callable(attr) and not isinstance(attr, (staticmethod, classmethod, type)) \
+                and not getattr(attr, '__profiled__', False):
+            setattr(cls, name, timed(category)(attr))
+
+
+def instrument_templates(jinja_env) -> None:
+    """Рендер шаблонів (render_template) рахується в категорії tpl"""
+    if not ENABLED:
+        return
+    base = jinja_env.template_class
+    jinja_env.template_class = type('ProfiledTemplate', (base,), {'render': timed('tpl')(base.render)})
+
+
+def start_request() -> None:
+    """before_request: починає вимірювання (і cProfile для вибраних запитів)"""
+    if not ENABLED:
+        return
+    profiler = None
+    if PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE and _profiler_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    _local.depth = {}
+    _local.request = {'started': time.perf_counter(), 'timings': {}, 'profiler': profiler}
+
+
+def _server_timing(total: float, timings: Dict) -> str:
+    parts = []
+    for category, (duration, count) in timings.items():
+        parts.append(f'{category};dur={duration * 1000:.1f};desc="{CATEGORIES.get(category, category)} ({count})"')
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def finish_request(endpoint: Optional[str], method: str, response) -> None:
+    """after_request: записує час запиту і додає заголовок Server-Timing"""
+    state = getattr(_local, 'request', None)
+    if state is None:
+        return
+    _local.request = None
+    total = time.perf_counter() - state['started']
+    profiler = state['profiler']
+    key = f"{method} {endpoint or '<404>'}"
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+        _save_profile(profiler, key, total)
+
+    timings = state['timings']
+    response.headers['Server-Timing'] = _server_timing(total, timings)
+    with _lock:
+        _requests.setdefault(key, deque(maxlen=PROFILE_WINDOW)).append(
+            (total, {category: duration for category, (duration, _) in timings.items()})
+        )
+
+
+def _save_profile(profiler: cProfile.Profile, key: str, total: float) -> None:
+    global _profile_ids
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_STATS_LINES)
+    with _lock:
+        _profile_ids += 1
+        _profiles.appendleft({
+            'id': _profile_ids,
+            'endpoint': key,
+            'duration_ms': round(total * 1000, 1),
+            'captured_at': time.strftime('%d.%m.%Y %H:%M:%S'),
+            'stats': output.getvalue()
+        })
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Перцентиль (найближчий ранг) для відсортованого списку"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _summary(durations: List[float]) -> Dict:
+    values = sorted(durations)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+        'max_ms': round(values[-1] * 1000, 1) if values else 0.0
+    }
+
+
+def _histogram(durations: List[float]) -> List[int]:
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for duration in durations:
+        ms = duration * 1000
+        index = next((i for i, edge in enumerate(HISTOGRAM_BUCKETS) if ms <= edge), len(HISTOGRAM_BUCKETS))
+        counts[index] += 1
+    return counts
+
+
+def report() -> Dict:
+    """
+    Звіт для /debug/perf: {'enabled', 'window', 'buckets', 'endpoints': [...],
+    'background': [...], 'profiles': [...]}. Endpoints - від найповільнішого p95.
+    """
+    with _lock:
+        requests = {key: list(samples) for key, samples in _requests.items()}
+        background = {key: list(samples) for key, samples in _background.items()}
+        profiles = [{key: value for key, value in profile.items() if key != 'stats'} for profile in _profiles]
+
+    endpoints = []
+    for key, samples in requests.items():
+        totals = [total for total, _ in samples]
+        row = {'endpoint': key, **_summary(totals), 'histogram': _histogram(totals)}
+        # Середній час категорій на запит
+        row['categories'] = {
+            category: round(sum(timings.get(category, 0.0) for _, timings in samples) / len(samples) * 1000, 1)
+            for category in CATEGORIES
+        }
+        endpoints.append(row)
+    endpoints.sort(key=lambda row: row['p95_ms'], reverse=True)
+
+    background_rows = [{'name': key, **_summary(samples)} for key, samples in background.items()]
+    background_rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return {
+        'enabled': ENABLED,
+        'window': PROFILE_WINDOW,
+        'sample': PROFILE_SAMPLE,
+        'categories': CATEGORIES,
+        'buckets': list(HISTOGRAM_BUCKETS),
+        'endpoints': endpoints,
+        'background': background_rows,
+        'profiles': profiles
+    }
+
+
+def get_profile(profile_id: int) -> Optional[Dict]:
+    with _lock:
+        return next((dict(profile) for profile in _profiles if profile['id'] == profile_id), None)
+
+
+def reset() -> None:
+    with _lock:
+        _requests.clear()
+        _background.clear()
+        _profiles.clear()
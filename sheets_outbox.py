@@ -0,0 +1,133 @@
+import os
+import time
+import random
+import logging
+import threading
+
+# Налаштування логування
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Параметри повторних спроб (можна перевизначити змінними середовища)
+OUTBOX_POLL_INTERVAL = float(os.environ.get('SHEETS_OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('SHEETS_OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE = float(os.environ.get('SHEETS_OUTBOX_BACKOFF_BASE', '5'))
+OUTBOX_BACKOFF_MAX = float(os.environ.get('SHEETS_OUTBOX_BACKOFF_MAX', '600'))
+OUTBOX_LEASE_SECONDS = float(os.environ.get('SHEETS_OUTBOX_LEASE_SECONDS', '120'))
+# batch - усі зміни за вікно збираються в один batch_get/batch_update, single - по одній
+SHEETS_SYNC_MODE = os.environ.get('SHEETS_SYNC_MODE', 'batch').lower()
+SHEETS_BATCH_WINDOW = float(os.environ.get('SHEETS_BATCH_WINDOW', '3'))
+
+
+def retry_delay(attempts: int) -> float:
+    """Експоненційна затримка з невеликим розкидом для attempts-ї невдалої спроби"""
+    delay = min(OUTBOX_BACKOFF_BASE * (2 ** max(attempts - 1, 0)), OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def send_to_sheet(payload):
+    """Відправляє одну зміну в Google таблицю"""
+    from google_integration import update_google_sheet
+    update_google_sheet(**payload)
+
+
+def send_batch_to_sheet(payloads):
+    """Відправляє набір змін в Google таблицю одним пакетом"""
+    from google_integration import sync_sheet_changes
+    sync_sheet_changes(payloads)
+
+
+class OutboxWorker:
+    """Фоновий потік, який розбирає чергу sheets_outbox і відправляє зміни в Google Sheets"""
+
+    def __init__(self, db, sender=send_to_sheet, batch_sender=send_batch_to_sheet,
+                 mode: str = SHEETS_SYNC_MODE, batch_window: float = SHEETS_BATCH_WINDOW,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.db = db
+        self.sender = sender
+        self.batch_sender = batch_sender
+        self.mode = mode
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listening = False
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        if not self._listening:
+            self.db.add_outbox_listener(self.notify)
+            self._listening = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sheets-outbox', daemon=True)
+        self._thread.start()
+        logger.info("Запущено обробник черги синхронізації Google Sheets")
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def notify(self) -> None:
+        """Будить обробник після появи нових записів у черзі"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                processed = self.process_pending()
+            except Exception as e:
+                logger.error(f"Помилка обробника черги синхронізації: {str(e)}")
+                processed = 0
+            # Якщо щось оброблено - одразу перевіряємо чергу ще раз
+            if processed:
+                continue
+            woken = self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if woken and self.mode == 'batch' and self.batch_window > 0:
+                # Даємо змінам накопичитись, щоб відправити їх одним пакетом
+                self._stop.wait(self.batch_window)
+
+    def process_pending(self) -> int:
+        """Обробляє всі готові записи черги, повертає кількість оброблених"""
+        items = self.db.claim_outbox_items(lease_seconds=OUTBOX_LEASE_SECONDS)
+        if not items:
+            return 0
+        if self.mode == 'batch':
+            self._process_batch(items)
+        else:
+            for item in items:
+                self._process_item(item)
+        return len(items)
+
+    def _process_batch(self, items) -> None:
+        try:
+            self.batch_sender([item['payload'] for item in items])
+        except Exception as e:
+            for item in items:
+                self._record_failure(item, e)
+            return
+        self.db.complete_outbox_items([item['id'] for item in items])
+
+    def _process_item(self, item) -> None:
+        try:
+            self.sender(item['payload'])
+        except Exception as e:
+            self._record_failure(item, e)
+            return
+        self.db.complete_outbox_item(item['id'])
+
+    def _record_failure(self, item, error) -> None:
+        attempts = item['attempts'] + 1
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Синхронізацію території {item['territory_id']} не вдалося виконати "
+                         f"після {attempts} спроб: {str(error)}")
+            self.db.fail_outbox_item(item['id'], str(error), None)
+        else:
+            delay = retry_delay(attempts)
+            logger.warning(f"Помилка синхронізації території {item['territory_id']} "
+                           f"(спроба {attempts}), повтор через {delay:.0f} с: {str(error)}")
+            self.db.fail_outbox_item(item['id'], str(error), time.time() + delay)
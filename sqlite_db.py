@@ -1,22 +1,255 @@
 import sqlite3
+import os
+import json
+import time
+import threading
 from typing import List, Dict, Optional
+import re
 import logging
+from contextlib import contextmanager
 from datetime import datetime
-from google_integration import update_google_sheet
+from address_parser import ADDRESS_COLUMNS, address_values, parse_address
 
 # Налаштування логування
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Налаштування з'єднань (можна перевизначити змінними середовища)
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '8192'))
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', '8'))
+# Скільки рядків індексу читає ANALYZE (обмежує час PRAGMA optimize на великих таблицях)
+SQLITE_ANALYSIS_LIMIT = int(os.environ.get('SQLITE_ANALYSIS_LIMIT', '1000'))
+# Скільки id передавати в одному IN (...) (обмеження кількості параметрів SQLite)
+BULK_QUERY_CHUNK = 500
+# За скільки днів до дати здачі територія вважається "скоро здавати"
+DUE_SOON_DAYS = int(os.environ.get('DUE_SOON_DAYS', '10'))
+# Скільки останніх подій змін зберігати для повторної доставки (Last-Event-ID)
+EVENTS_KEEP = int(os.environ.get('EVENTS_KEEP', '1000'))
+
+def _iso_date_sql(column: str) -> str:
+    """SQL-вираз, що перетворює дату dd.mm.YYYY на ISO YYYY-MM-DD (інакше NULL)"""
+    return (f"CASE WHEN {column} GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]' "
+            f"THEN substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2) END")
+
+# Повнотекстовий пошук: unicode61 (регістр і діакритика не важливі). Апострофи (', ’, ʼ)
+# з тексту прибираються і в індексі, і в запиті, тож "Мар'янівка", "Мар’янівка"
+# і "Марянівка" - одне слово
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+FTS_APOSTROPHES = "'’ʼ"
+FTS_WORD = re.compile(r"\w+")
+
+def _fts_text_sql(value: str) -> str:
+    """SQL-вираз, що готує текст для індексу FTS (без апострофів)"""
+    for apostrophe in FTS_APOSTROPHES:
+        literal = apostrophe.replace("'", "''")
+        value = f"replace({value}, '{literal}', '')"
+    return f"coalesce({value}, '')"
+
+def fts_query(text: str) -> Optional[str]:
+    """Запит FTS5 з тексту користувача: кожне слово як префікс, усі слова обов'язкові"""
+    for apostrophe in FTS_APOSTROPHES:
+        text = (text or '').replace(apostrophe, '')
+    words = FTS_WORD.findall(text)
+    if not words:
+        return None
+    return ' AND '.join(f'"{word}"*' for word in words)
+
+# Поля території: назва поля -> SQL-вираз (дні до здачі та "скоро здавати" рахуються в SQL)
+TERRITORY_FIELDS = {
+    'id': 'id',
+    'name': 'custom_name',
+    'status': 'status',
+    'taken_by': 'taken_by',
+    'date_taken': 'date_taken',
+    'date_due': 'date_due',
+    'notes': 'notes',
+    'image_url': 'image_url',
+    'date_taken_iso': 'date_taken_iso',
+    'date_due_iso': 'date_due_iso',
+    'street': 'street',
+    'building': 'building',
+    'entrance': 'entrance',
+    'apt_from': 'apt_from',
+    'apt_to': 'apt_to',
+    'row_version': 'row_version',
+    'days_left': "CAST(julianday(date_due_iso) - julianday(date('now', 'localtime')) AS INTEGER)",
+    'is_due_soon': "(status = 'Взято' AND date_due_iso <= date('now', 'localtime', :due_soon))",
+}
+BOOLEAN_FIELDS = {'is_due_soon'}
+
+class _ConnectionLease:
+    """З'єднання з пулу, закріплене за потоком; повертається в пул, коли потік завершується"""
+
+    def __init__(self, db, conn: sqlite3.Connection, data_version: Optional[int], generation: int):
+        self.db = db
+        self.conn = conn
+        self.pid = os.getpid()
+        # Останнє побачене значення PRAGMA data_version цього з'єднання
+        self.data_version = data_version
+        self.generation = generation
+
+    def __del__(self):
+        try:
+            self.db._release(self)
+        except Exception:
+            pass
+
 class SQLiteDB:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+                 pool_size: int = SQLITE_POOL_SIZE):
         self.db_name = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.pool_size = pool_size
+        # Кожен потік отримує з'єднання з пулу і тримає його, доки не завершиться
+        self._local = threading.local()
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._pool_pid = os.getpid()
+        self._generation = 0
+        # Кеш списку територій: версія збільшується при кожному записі
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = None
+        self._snapshot_day = None
+        # Скільки разів список територій віддано зі знімка і скільки перебудовано (для метрик)
+        self.snapshot_hits = 0
+        self.snapshot_misses = 0
+        self._snapshot_lock = threading.Lock()
+        # Колбеки, які викликаються після появи нових записів у черзі синхронізації
+        self._outbox_listeners = []
+        # Очікування нових подій змін (SSE): лічильник збільшується після кожного коміту з подіями
+        self._events_condition = threading.Condition()
+        self._events_seq = 0
+        # Чи є в SQLite модуль FTS5 (визначається при створенні схеми)
+        self.fts_enabled = False
         self._ensure_db_exists()
 
+    def _open_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        # WAL: читачі не блокуються записом адміністратора
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {int(SQLITE_MMAP_SIZE)}')
+        conn.execute(f'PRAGMA cache_size = -{int(SQLITE_CACHE_SIZE_KB)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        # Вбудовані lower()/LIKE у SQLite не змінюють регістр кирилиці
+        conn.create_function('casefold', 1, lambda value: value.casefold() if isinstance(value, str) else value,
+                             deterministic=True)
+        return conn
+
+    def _lease(self) -> _ConnectionLease:
+        lease = getattr(self._local, 'lease', None)
+        # Після fork (gunicorn --preload) успадковане з'єднання використовувати не можна
+        if lease is not None and lease.pid == os.getpid() and lease.generation == self._generation:
+            return lease
+
+        conn, data_version = None, None
+        with self._pool_lock:
+            if self._pool_pid != os.getpid():
+                self._idle = []
+                self._pool_pid = os.getpid()
+            if self._idle:
+                conn, data_version = self._idle.pop()
+            generation = self._generation
+        if conn is None:
+            conn = self._open_connection()
+
+        lease = _ConnectionLease(self, conn, data_version, generation)
+        self._local.lease = lease
+        return lease
+
+    def _release(self, lease: _ConnectionLease) -> None:
+        """Повертає з'єднання в пул (або закриває, якщо пул заповнений)"""
+        if lease.pid != os.getpid():
+            return
+        conn = lease.conn
+        if conn.in_transaction:
+            conn.rollback()
+        with self._pool_lock:
+            if lease.generation == self._generation and len(self._idle) < self.pool_size:
+                self._idle.append((conn, lease.data_version))
+                return
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Повертає з'єднання поточного потоку"""
+        return self._lease().conn
+
+    def _rollback(self) -> None:
+        """Відкочує незавершену транзакцію, щоб з'єднання можна було використовувати далі"""
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None and lease.conn.in_transaction:
+            lease.conn.rollback()
+
+    def close(self) -> None:
+        """Закриває всі з'єднання пулу; з'єднання інших потоків закриються при поверненні"""
+        with self._pool_lock:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._optimize(conn)
+            conn.close()
+        lease = getattr(self._local, 'lease', None)
+        self._local = threading.local()
+        if lease is not None:
+            lease.conn.close()
+
+    def _optimize(self, conn: sqlite3.Connection) -> None:
+        """PRAGMA optimize: оновлює статистику лише для таблиць, де вона застаріла"""
+        try:
+            conn.execute(f'PRAGMA analysis_limit = {SQLITE_ANALYSIS_LIMIT}')
+            conn.execute('PRAGMA optimize')
+        except sqlite3.Error as e:
+            logger.warning(f"Не вдалося виконати PRAGMA optimize: {str(e)}")
+
+    def optimize(self) -> None:
+        """Оновлює статистику планувальника (для довгоживучих процесів - періодично)"""
+        self._optimize(self._connect())
+        self._connect().commit()
+
+    def _query_territories(self, where: str = '', params: Optional[Dict] = None, order_by: str = 'id',
+                           conn: Optional[sqlite3.Connection] = None, fields: Optional[List[str]] = None,
+                           limit: Optional[int] = None) -> List[Dict]:
+        """SELECT лише потрібних полів (fields - ключі TERRITORY_FIELDS, за замовчуванням усі)"""
+        fields = list(fields or TERRITORY_FIELDS)
+        columns = ', '.join(f"{TERRITORY_FIELDS[field]} AS {field}" for field in fields)
+        query = f"SELECT {columns} FROM territories {where} ORDER BY {order_by}"
+        params = dict(params or {}, due_soon=f'+{DUE_SOON_DAYS} days')
+        if limit is not None:
+            query += ' LIMIT :limit'
+            params['limit'] = int(limit)
+        cursor = (conn or self._connect()).execute(query, params)
+        territories = []
+        for row in cursor.fetchall():
+            territory = dict(zip(fields, row))
+            for field in BOOLEAN_FIELDS.intersection(territory):
+                territory[field] = bool(territory[field])
+            territories.append(territory)
+        return territories
+
+    def _bump_version(self) -> None:
+        """Позначає кеш територій застарілим після запису"""
+        with self._snapshot_lock:
+            self._version += 1
+
+    def _check_external_changes(self, lease: _ConnectionLease) -> None:
+        """
+        PRAGMA data_version змінюється, якщо дані закомітило інше з'єднання
+        (інший потік чи інший процес gunicorn) - тоді кеш треба перебудувати.
+        """
+        data_version = lease.conn.execute('PRAGMA data_version').fetchone()[0]
+        if lease.data_version != data_version:
+            lease.data_version = data_version
+            self._bump_version()
+
     def _ensure_db_exists(self):
         """Перевіряє чи існує база даних, якщо ні - створює її"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._connect()
             cursor = conn.cursor()
             
             # Створюємо таблицю territories якщо не існує
@@ -46,153 +279,609 @@ class SQLiteDB:
             )
             ''')
             
+            # Черга змін для Google Sheets (outbox), заповнюється в одній транзакції зі змінами
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sheets_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                territory_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at REAL DEFAULT 0,
+                locked_until REAL DEFAULT 0,
+                last_error TEXT DEFAULT '',
+                created_at REAL
+            )
+            ''')
+            # Записи черги вибираються за статусом у порядку id; для перевірки порядку змін
+            # території потрібен пошук попередніх записів тієї ж території
+            cursor.execute('DROP INDEX IF EXISTS idx_sheets_outbox_status')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sheets_outbox_pending
+            ON sheets_outbox (status, id)
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sheets_outbox_territory
+            ON sheets_outbox (territory_id, id)
+            ''')
+            
+            # Журнал змін для живого оновлення сторінок (SSE): id - це id події,
+            # за яким клієнт після перепідключення отримує пропущене
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS territory_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                territory_id INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL
+            )
+            ''')
+            
+            self._migrate_date_columns(cursor)
+            self._migrate_search_index(cursor)
+            self._migrate_address_columns(cursor)
+            self._migrate_row_version(cursor)
+            
+            # Фільтр за статусом зі сторінками за id (API)
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_territories_status
+            ON territories (status, id)
+            ''')
+            
+            # Історія читається й видаляється за territory_id від найновіших записів;
+            # решта колонок у кінці індексу, щоб get_territory_history не читав саму таблицю
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_history_territory
+            ON history (territory_id, id DESC, taken_by, date_taken, date_returned)
+            ''')
+            
+            conn.commit()
+            
+            # Статистика для планувальника: повний ANALYZE лише для нової бази, далі PRAGMA optimize
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+                conn.execute(f'PRAGMA analysis_limit = {SQLITE_ANALYSIS_LIMIT}')
+                conn.execute('ANALYZE')
+            else:
+                self._optimize(conn)
             conn.commit()
-            conn.close()
         except Exception as e:
+            self._rollback()
             logger.error(f"Помилка при створенні бази даних: {str(e)}")
             raise
 
+    def _migrate_search_index(self, cursor: sqlite3.Cursor) -> None:
+        """
+        Індекс FTS5 за назвою, примітками та іменем того, хто взяв територію.
+        Таблиця без вмісту (content='') зберігає лише індекс нормалізованого тексту,
+        тригери підтримують його актуальним. Без FTS5 пошук працює через LIKE.
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'territories_fts'"
+        ).fetchone()
+        columns = ', '.join(_fts_text_sql(f'{{row}}.{column}') for column in ('custom_name', 'notes', 'taken_by'))
+        if not exists:
+            try:
+                cursor.execute(f'''
+                CREATE VIRTUAL TABLE territories_fts USING fts5(
+                    custom_name, notes, taken_by,
+                    content='', tokenize="{FTS_TOKENIZER}"
+                )
+                ''')
+            except sqlite3.OperationalError as e:
+                logger.warning(f"FTS5 недоступний, пошук працюватиме без індексу: {str(e)}")
+                self.fts_enabled = False
+                return
+            cursor.execute(f'''
+            INSERT INTO territories_fts (rowid, custom_name, notes, taken_by)
+            SELECT id, {columns.format(row='territories')} FROM territories
+            ''')
+            logger.info("Створено повнотекстовий індекс територій")
+        self.fts_enabled = True
+        
+        # Для таблиці без вмісту видалення - це команда 'delete' з тими самими значеннями
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS territories_fts_insert AFTER INSERT ON territories
+        BEGIN
+            INSERT INTO territories_fts (rowid, custom_name, notes, taken_by)
+            VALUES (NEW.id, {columns.format(row='NEW')});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS territories_fts_delete AFTER DELETE ON territories
+        BEGIN
+            INSERT INTO territories_fts (territories_fts, rowid, custom_name, notes, taken_by)
+            VALUES ('delete', OLD.id, {columns.format(row='OLD')});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS territories_fts_update AFTER UPDATE OF custom_name, notes, taken_by ON territories
+        BEGIN
+            INSERT INTO territories_fts (territories_fts, rowid, custom_name, notes, taken_by)
+            VALUES ('delete', OLD.id, {columns.format(row='OLD')});
+            INSERT INTO territories_fts (rowid, custom_name, notes, taken_by)
+            VALUES (NEW.id, {columns.format(row='NEW')});
+        END
+        ''')
+
+    def _migrate_date_columns(self, cursor: sqlite3.Cursor) -> None:
+        """
+        Дати в territories зберігаються як dd.mm.YYYY, тому за ними не можна сортувати
+        чи фільтрувати. Додаємо колонки date_taken_iso/date_due_iso (YYYY-MM-DD),
+        заповнюємо їх для наявних рядків, а тригери підтримують їх актуальними
+        при будь-якому записі (застосунок, імпорт, скрипти).
+        """
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(territories)')}
+        backfill = False
+        for column in ('date_taken_iso', 'date_due_iso'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE territories ADD COLUMN {column} TEXT')
+                backfill = True
+        
+        set_iso = f'''
+            date_taken_iso = {_iso_date_sql('date_taken')},
+            date_due_iso = {_iso_date_sql('date_due')}
+        '''
+        if backfill:
+            cursor.execute(f'UPDATE territories SET {set_iso}')
+            logger.info("Додано ISO-колонки дат територій")
+        
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS territories_dates_insert AFTER INSERT ON territories
+        BEGIN
+            UPDATE territories SET {set_iso} WHERE id = NEW.id;
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS territories_dates_update AFTER UPDATE OF date_taken, date_due ON territories
+        BEGIN
+            UPDATE territories SET {set_iso} WHERE id = NEW.id;
+        END
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_territories_due
+        ON territories (status, date_due_iso)
+        ''')
+
+    def _migrate_address_columns(self, cursor: sqlite3.Cursor) -> None:
+        """
+        Частини адреси з custom_name (address_parser): вулиця, будинок, під'їзд,
+        діапазон квартир. Розбір робиться в Python, тож тригер лише скидає
+        street_key у NULL при зміні назви будь-ким (застосунок, скрипти), а такі
+        рядки розбираються заново (_parse_addresses).
+        """
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(territories)')}
+        types = {'entrance': 'INTEGER', 'apt_from': 'INTEGER', 'apt_to': 'INTEGER'}
+        for column in ADDRESS_COLUMNS:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE territories ADD COLUMN {column} {types.get(column, 'TEXT')}")
+        
+        # Тригер не чіпає рядок, якщо той самий UPDATE уже записав нову адресу (імпорт)
+        reset = ', '.join(f'{column} = NULL' for column in ADDRESS_COLUMNS)
+        unchanged = ' AND '.join(f'NEW.{column} IS OLD.{column}' for column in ADDRESS_COLUMNS)
+        cursor.execute('DROP TRIGGER IF EXISTS territories_address_update')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS territories_address_reset AFTER UPDATE OF custom_name ON territories
+        WHEN NEW.custom_name IS NOT OLD.custom_name AND {unchanged}
+        BEGIN
+            UPDATE territories SET {reset} WHERE id = NEW.id;
+        END
+        ''')
+        # Групування за вулицею і пошук квартири: вулиця -> будинок -> діапазон квартир.
+        # Діапазони в межах будинку не перетинаються (крім меж), тож apt_from <= N
+        # і apt_to >= N по цьому індексу - це пошук точки серед кількох під'їздів
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_territories_address
+        ON territories (street_key, building, apt_from, apt_to)
+        ''')
+        parsed = self._parse_addresses(cursor)
+        if parsed:
+            logger.info(f"Розібрано адреси {parsed} територій")
+
+    def _migrate_row_version(self, cursor: sqlite3.Cursor) -> None:
+        """
+        row_version збільшується при кожній зміні рядка території (будь-яким записом),
+        тож за ним видно, що саме змінилось (кеш карток на головній сторінці).
+        """
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(territories)')}
+        if 'row_version' not in columns:
+            cursor.execute('ALTER TABLE territories ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0')
+        # WHEN: запис, що сам задав row_version, не збільшується вдруге
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS territories_row_version AFTER UPDATE ON territories
+        WHEN NEW.row_version IS OLD.row_version
+        BEGIN
+            UPDATE territories SET row_version = OLD.row_version + 1 WHERE id = NEW.id;
+        END
+        ''')
+
+    def _parse_addresses(self, cursor: sqlite3.Cursor) -> int:
+        """Розбирає адреси рядків, де street_key ще NULL (без commit); повертає їх кількість"""
+        cursor.execute('SELECT id, custom_name FROM territories WHERE street_key IS NULL')
+        rows = cursor.fetchall()
+        assignments = ', '.join(f'{column} = ?' for column in ADDRESS_COLUMNS)
+        cursor.executemany(
+            f'UPDATE territories SET {assignments} WHERE id = ?',
+            [address_values(custom_name) + (territory_id,) for territory_id, custom_name in rows]
+        )
+        return len(rows)
+
+    def _refresh_addresses(self) -> None:
+        """Розбирає адреси, змінені після останнього розбору (наприклад, скриптом імпорту)"""
+        conn = self._connect()
+        if not conn.execute('SELECT 1 FROM territories WHERE street_key IS NULL LIMIT 1').fetchone():
+            return
+        with self._write_transaction() as cursor:
+            parsed = self._parse_addresses(cursor)
+        if parsed:
+            self._bump_version()
+
     def get_territory(self, territory_id: int) -> Optional[Dict]:
         """Отримання інформації про територію"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            SELECT id, custom_name as name, status, taken_by, date_taken, date_due, notes, image_url
-            FROM territories WHERE id = ?
-            ''', (territory_id,))
-            
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                return {
-                    'id': row[0],
-                    'name': row[1],
-                    'status': row[2],
-                    'taken_by': row[3],
-                    'date_taken': row[4],
-                    'date_due': row[5],
-                    'notes': row[6],
-                    'image_url': row[7]
-                }
+            territories = self._query_territories('WHERE id = :id', {'id': territory_id})
+            if territories:
+                return territories[0]
             return None
         except Exception as e:
             logger.error(f"Помилка отримання території {territory_id}: {str(e)}")
             raise
 
-    def get_all_territories(self) -> List[Dict]:
-        """Отримання списку всіх територій"""
+    def get_territories(self, territory_ids: List[int]) -> List[Dict]:
+        """Території з переданими id (відсутні пропускаються), у порядку id"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            SELECT id, custom_name as name, status, taken_by, date_taken, date_due, notes, image_url
-            FROM territories ORDER BY id
-            ''')
-            
+            ids = sorted({int(territory_id) for territory_id in territory_ids})
             territories = []
-            for row in cursor.fetchall():
-                territories.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'status': row[2],
-                    'taken_by': row[3],
-                    'date_taken': row[4],
-                    'date_due': row[5],
-                    'notes': row[6],
-                    'image_url': row[7]
-                })
-            
-            conn.close()
+            for start in range(0, len(ids), BULK_QUERY_CHUNK):
+                chunk = ids[start:start + BULK_QUERY_CHUNK]
+                params = {f'id{i}': territory_id for i, territory_id in enumerate(chunk)}
+                territories += self._query_territories(
+                    f"WHERE id IN ({', '.join(':' + name for name in params)})", params
+                )
             return territories
         except Exception as e:
-            logger.error(f"Помилка отримання списку територій: {str(e)}")
+            logger.error(f"Помилка отримання територій {territory_ids}: {str(e)}")
             raise
 
-    def update_territory(self, territory_id: int, data: Dict) -> None:
-        """Оновлення інформації про територію"""
+    def get_all_territories(self) -> List[Dict]:
+        """Отримання списку всіх територій (з кешу, якщо дані не змінювались)"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            lease = self._lease()
+            self._check_external_changes(lease)
+            with self._snapshot_lock:
+                # days_left/is_due_soon залежать від поточної дати, тож знімок дійсний лише в межах дня
+                today = datetime.now().date()
+                if (self._snapshot is not None and self._snapshot_version == self._version
+                        and self._snapshot_day == today):
+                    self.snapshot_hits += 1
+                    return [dict(territory) for territory in self._snapshot]
+                self.snapshot_misses += 1
             
-            # Отримуємо поточні дані території
-            cursor.execute('SELECT status, taken_by, date_taken FROM territories WHERE id = ?', (territory_id,))
-            current_data = cursor.fetchone()
-            
-            cursor.execute('''
-            UPDATE territories 
-            SET status = ?, taken_by = ?, date_taken = ?, date_due = ?, notes = ?
-            WHERE id = ?
-            ''', (
-                data.get('status', 'Вільна'),
-                data.get('taken_by', ''),
-                data.get('date_taken', ''),
-                data.get('date_due', ''),
-                data.get('notes', ''),
-                territory_id
-            ))
+            # Знімок перебудовується - спершу розбираємо адреси, змінені ззовні
+            self._refresh_addresses()
+            with self._snapshot_lock:
+                version = self._version
+            territories = self._query_territories(conn=lease.conn)
             
+            with self._snapshot_lock:
+                # Якщо під час читання відбувся запис - такий знімок не зберігаємо
+                if version == self._version:
+                    self._snapshot = territories
+                    self._snapshot_version = version
+                    self._snapshot_day = today
+            return [dict(territory) for territory in territories]
+        except Exception as e:
+            logger.error(f"Помилка отримання списку територій: {str(e)}")
+            raise
+
+    def get_due_within(self, days: int) -> List[Dict]:
+        """Взяті території, які треба здати протягом days днів (включно з простроченими), за датою здачі"""
+        try:
+            return self._query_territories(
+                "WHERE status = 'Взято' AND date_due_iso <= date('now', 'localtime', :within)",
+                {'within': f'+{int(days)} days'},
+                order_by='date_due_iso, id'
+            )
+        except Exception as e:
+            logger.error(f"Помилка отримання територій з датою здачі протягом {days} днів: {str(e)}")
+            raise
+
+    def get_overdue(self) -> List[Dict]:
+        """Взяті території з простроченою датою здачі, від найстарішої"""
+        try:
+            return self._query_territories(
+                "WHERE status = 'Взято' AND date_due_iso < date('now', 'localtime')",
+                order_by='date_due_iso, id'
+            )
+        except Exception as e:
+            logger.error(f"Помилка отримання прострочених територій: {str(e)}")
+            raise
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        Транзакція запису: BEGIN IMMEDIATE одразу бере блокування на запис, тож
+        читання поточного стану, зміни, історія та черга виконуються атомарно
+        й одним commit. Повертає курсор; при помилці все відкочується.
+        """
+        conn = self._connect()
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn.cursor()
             conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def query_territories(self, status: Optional[str] = None, taken_by: Optional[str] = None,
+                          due_before: Optional[str] = None, search: Optional[str] = None,
+                          after_id: Optional[int] = None, limit: int = 50,
+                          fields: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Вибірка територій для API: фільтри за статусом, тим, хто взяв, датою здачі
+        (due_before - ISO-дата, не включно) і текстом у назві/примітках/імені,
+        пагінація за id (after_id - останній id попередньої сторінки),
+        fields - лише потрібні поля (id додається завжди).
+        """
+        where, params = [], {}
+        if status:
+            where.append('status = :status')
+            params['status'] = status
+        if taken_by:
+            where.append('taken_by = :taken_by')
+            params['taken_by'] = taken_by
+        if due_before:
+            where.append('date_due_iso < :due_before')
+            params['due_before'] = due_before
+        if search:
+            conditions = []
+            if search.strip().isdigit():
+                conditions.append('id = :search_id')
+                params['search_id'] = int(search)
+            match = fts_query(search) if self.fts_enabled else None
+            if match:
+                conditions.append('id IN (SELECT rowid FROM territories_fts WHERE territories_fts MATCH :match)')
+                params['match'] = match
+            else:
+                conditions += ["casefold(custom_name) LIKE :search ESCAPE '\\'",
+                               "casefold(notes) LIKE :search ESCAPE '\\'",
+                               "casefold(taken_by) LIKE :search ESCAPE '\\'"]
+                escaped = search.casefold().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                params['search'] = f'%{escaped}%'
+            where.append(f"({' OR '.join(conditions)})")
+        if after_id is not None:
+            where.append('id > :after_id')
+            params['after_id'] = int(after_id)
+        
+        if fields:
+            fields = ['id'] + [field for field in dict.fromkeys(fields) if field != 'id']
+        try:
+            return self._query_territories(f"WHERE {' AND '.join(where)}" if where else '', params,
+                                           fields=fields, limit=limit)
+        except Exception as e:
+            logger.error(f"Помилка вибірки територій: {str(e)}")
+            raise
+
+    def search_territories(self, text: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """
+        Повнотекстовий пошук за адресою, примітками та іменем (кожне слово - префікс),
+        результати впорядковані за релевантністю bm25 (збіг у назві важить більше).
+        offset - скільки перших результатів пропустити (наступні сторінки).
+        """
+        match = fts_query(text)
+        if not match:
+            return []
+        try:
+            if not self.fts_enabled:
+                return self.query_territories(search=text, limit=offset + limit,
+                                              fields=['name', 'status', 'taken_by', 'notes'])[offset:]
+            cursor = self._connect().execute('''
+            SELECT t.id, t.custom_name, t.status, t.taken_by, t.notes, bm25(territories_fts, 10.0, 2.0, 1.0) AS rank
+            FROM territories_fts
+            JOIN territories AS t ON t.id = territories_fts.rowid
+            WHERE territories_fts MATCH ?
+            ORDER BY rank, t.id
+            LIMIT ? OFFSET ?
+            ''', (match, int(limit), int(offset)))
+            return [{
+                'id': row[0],
+                'name': row[1],
+                'status': row[2],
+                'taken_by': row[3],
+                'notes': row[4],
+                'rank': round(row[5], 4)
+            } for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Помилка пошуку територій '{text}': {str(e)}")
+            raise
+
+    def find_by_address(self, text: str, limit: int = 50) -> Dict:
+        """
+        Території за адресою: "вул. 24 Серпня 3, кв. 50" - територія, що містить
+        квартиру 50 будинку 3; "Симоненка 45" - усі під'їзди будинку; "Симоненка" -
+        уся вулиця. Повертає {'address': розібрані частини, 'items': [...]}.
+        """
+        address = parse_address(text)
+        if not address['street_key']:
+            return {'address': address, 'items': []}
+        where, params = ['street_key = :street_key'], {'street_key': address['street_key']}
+        if address['building']:
+            where.append('building = :building')
+            params['building'] = address['building']
+            if address['apt_from'] is not None:
+                where.append('apt_from <= :apartment AND apt_to >= :apartment')
+                params['apartment'] = address['apt_from']
+            elif address['entrance'] is not None:
+                where.append('entrance = :entrance')
+                params['entrance'] = address['entrance']
+        try:
+            self._refresh_addresses()
+            items = self._query_territories(f"WHERE {' AND '.join(where)}", params,
+                                            order_by='street_key, building, apt_from, apt_to, id', limit=limit)
+            return {'address': address, 'items': items}
+        except Exception as e:
+            logger.error(f"Помилка пошуку територій за адресою '{text}': {str(e)}")
+            raise
+
+    def get_streets(self) -> List[Dict]:
+        """Вулиці з кількістю територій (усього і взятих), за ключем вулиці"""
+        try:
+            self._refresh_addresses()
+            cursor = self._connect().execute('''
+            SELECT street_key, MIN(street), COUNT(*), SUM(status = 'Взято')
+            FROM territories
+            WHERE street_key > ''
+            GROUP BY street_key
+            ORDER BY street_key
+            ''')
+            return [{
+                'street_key': row[0],
+                'street': row[1],
+                'territories': row[2],
+                'taken': row[3]
+            } for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Помилка отримання списку вулиць: {str(e)}")
+            raise
+
+    def update_territory(self, territory_id: int, data: Dict) -> None:
+        """Оновлення інформації про територію (разом з історією та чергою - одна транзакція)"""
+        try:
+            with self._write_transaction() as cursor:
+                # Отримуємо поточні дані території
+                cursor.execute('SELECT status, taken_by, date_taken FROM territories WHERE id = ?', (territory_id,))
+                current_data = cursor.fetchone()
+                
+                cursor.execute('''
+                UPDATE territories 
+                SET status = ?, taken_by = ?, date_taken = ?, date_due = ?, notes = ?
+                WHERE id = ?
+                ''', (
+                    data.get('status', 'Вільна'),
+                    data.get('taken_by', ''),
+                    data.get('date_taken', ''),
+                    data.get('date_due', ''),
+                    data.get('notes', ''),
+                    territory_id
+                ))
+                
+                # Додаємо запис в історію ТІЛЬКИ коли територія звільняється
+                if current_data and current_data[0] == 'Взято' and data.get('status') == 'Вільна':
+                    self._insert_history(cursor, territory_id, {
+                        'taken_by': current_data[1],
+                        'date_taken': current_data[2],
+                        'date_returned': datetime.now().strftime('%d.%m.%Y')
+                    })
+                
+                # Ставимо зміну в чергу для Google таблиці в тій самій транзакції
+                self._enqueue_sheet_update(cursor, territory_id, data)
+                self._insert_events(cursor, [self._territory_event(territory_id, data)])
             
-            # Додаємо запис в історію ТІЛЬКИ коли територія звільняється
-            if current_data and current_data[0] == 'Взято' and data.get('status') == 'Вільна':
-                self.add_history_record(territory_id, {
-                    'taken_by': current_data[1],
-                    'date_taken': current_data[2],
-                    'date_returned': datetime.now().strftime('%d.%m.%Y')
-                })
-            
-            conn.close()
+            self._bump_version()
+            self._notify_outbox()
+            self._notify_events()
             
-            # Оновлюємо Google таблицю
-            try:
-                if data.get('status') == 'Взято':
-                    # Якщо територія взята, додаємо нову видачу
-                    update_google_sheet(
-                        territory_id=territory_id,
-                        taken_by=data.get('taken_by', ''),
-                        date_taken=data.get('date_taken', ''),
-                        date_due=data.get('date_due', ''),
-                        returned=False
-                    )
-                elif data.get('status') == 'Вільна':
-                    # Якщо територія повернута, додаємо дату повернення
-                    update_google_sheet(
-                        territory_id=territory_id,
-                        taken_by='',
-                        date_taken='',
-                        date_due=datetime.now().strftime('%d.%m.%Y'),
-                        returned=True
+        except Exception as e:
+            logger.error(f"Помилка оновлення території {territory_id}: {str(e)}")
+            raise
+
+    def bulk_update_territories(self, changes: List[Dict]) -> Dict:
+        """
+        Застосовує багато змін однією транзакцією: UPDATE, записи історії та черга
+        Google Sheets пишуться через executemany, а обробник черги отримує всі зміни
+        одним пакетом. Кожна зміна - {'territory_id', 'status', 'taken_by', 'date_taken',
+        'date_due', 'notes'}; без 'notes' примітки території не змінюються.
+        Як і /release, вже вільна територія повторно не звільняється - стан
+        перевіряється всередині транзакції, тож паралельна видача чи звільнення
+        не загубиться. Повертає {'updated', 'history', 'missing': [id, ...],
+        'skipped': [id, ...]}.
+        """
+        try:
+            ids = list(dict.fromkeys(int(change['territory_id']) for change in changes))
+            with self._write_transaction() as cursor:
+                # Поточний стан усіх територій пакета одним запитом
+                current = {}
+                for start in range(0, len(ids), BULK_QUERY_CHUNK):
+                    chunk = ids[start:start + BULK_QUERY_CHUNK]
+                    cursor.execute(
+                        f"SELECT id, status, taken_by, date_taken FROM territories "
+                        f"WHERE id IN ({', '.join('?' * len(chunk))})",
+                        chunk
                     )
-            except Exception as e:
-                logger.error(f"Помилка оновлення Google таблиці для території {territory_id}: {str(e)}")
-                # Не піднімаємо помилку, щоб не блокувати основну функціональність
+                    current.update({row[0]: row[1:] for row in cursor.fetchall()})
+                
+                updates, history, payloads, events, missing, skipped = [], [], [], [], [], []
+                returned_date = datetime.now().strftime('%d.%m.%Y')
+                for change in changes:
+                    territory_id = int(change['territory_id'])
+                    if territory_id not in current:
+                        missing.append(territory_id)
+                        continue
+                    status = change.get('status', 'Вільна')
+                    if status == 'Вільна' and current[territory_id][0] != 'Взято':
+                        skipped.append(territory_id)
+                        continue
+                    data = {
+                        'status': status,
+                        'taken_by': change.get('taken_by', ''),
+                        'date_taken': change.get('date_taken', ''),
+                        'date_due': change.get('date_due', ''),
+                    }
+                    updates.append((
+                        data['status'], data['taken_by'], data['date_taken'], data['date_due'],
+                        change.get('notes'), territory_id
+                    ))
+                    # Історія - як в update_territory: лише при звільненні взятої території
+                    previous_status, previous_taken_by, previous_date_taken = current[territory_id]
+                    if previous_status == 'Взято' and status == 'Вільна':
+                        history.append((territory_id, previous_taken_by, previous_date_taken, returned_date))
+                    # Наступна зміна тієї ж території в пакеті бачить цей стан
+                    current[territory_id] = (status, data['taken_by'], data['date_taken'])
+                    payload = self._sheet_payload(territory_id, data)
+                    if payload:
+                        payloads.append(payload)
+                    events.append(self._territory_event(territory_id, data))
+                
+                cursor.executemany('''
+                UPDATE territories
+                SET status = ?, taken_by = ?, date_taken = ?, date_due = ?, notes = COALESCE(?, notes)
+                WHERE id = ?
+                ''', updates)
+                cursor.executemany('''
+                INSERT INTO history (territory_id, taken_by, date_taken, date_returned)
+                VALUES (?, ?, ?, ?)
+                ''', history)
+                self._enqueue_sheet_updates(cursor, payloads)
+                self._insert_events(cursor, events)
             
+            if updates:
+                self._bump_version()
+                self._notify_events()
+            if payloads:
+                self._notify_outbox()
+            return {'updated': len(updates), 'history': len(history), 'missing': missing, 'skipped': skipped}
         except Exception as e:
-            logger.error(f"Помилка оновлення території {territory_id}: {str(e)}")
+            logger.error(f"Помилка пакетного оновлення територій: {str(e)}")
             raise
 
+    def _insert_history(self, cursor: sqlite3.Cursor, territory_id: int, data: Dict) -> None:
+        """Додає запис в історію (без commit)"""
+        cursor.execute('''
+        INSERT INTO history (territory_id, taken_by, date_taken, date_returned)
+        VALUES (?, ?, ?, ?)
+        ''', (
+            territory_id,
+            data.get('taken_by', ''),
+            data.get('date_taken', ''),
+            data.get('date_returned', '')
+        ))
+
     def add_history_record(self, territory_id: int, data: Dict) -> None:
         """Додавання запису в історію"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            INSERT INTO history (territory_id, taken_by, date_taken, date_returned)
-            VALUES (?, ?, ?, ?)
-            ''', (
-                territory_id,
-                data.get('taken_by', ''),
-                data.get('date_taken', ''),
-                data.get('date_returned', '')
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self._write_transaction() as cursor:
+                self._insert_history(cursor, territory_id, data)
         except Exception as e:
             logger.error(f"Помилка додавання запису в історію для території {territory_id}: {str(e)}")
             raise
@@ -200,7 +889,7 @@ class SQLiteDB:
     def get_territory_history(self, territory_id: int, limit: int = 5) -> List[Dict]:
         """Отримання історії території"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -219,8 +908,6 @@ class SQLiteDB:
                     'date_taken': row[2],
                     'date_returned': row[3]
                 })
-            
-            conn.close()
             return history
         except Exception as e:
             logger.error(f"Помилка отримання історії території {territory_id}: {str(e)}")
@@ -229,13 +916,255 @@ class SQLiteDB:
     def clear_territory_history(self, territory_id: int) -> None:
         """Очищення історії території"""
         try:
-            conn = sqlite3.connect(self.db_name)
+            with self._write_transaction() as cursor:
+                cursor.execute('DELETE FROM history WHERE territory_id = ?', (territory_id,))
+                self._insert_events(cursor, [(territory_id, 'history', {'id': territory_id})])
+            
+            self._bump_version()
+            self._notify_events()
+        except Exception as e:
+            logger.error(f"Помилка очищення історії території {territory_id}: {str(e)}")
+            raise
+
+    def _territory_event(self, territory_id: int, data: Dict) -> tuple:
+        """Подія зміни території: лише поля, що змінюються при видачі/поверненні"""
+        return (territory_id, 'territory', {
+            'id': territory_id,
+            'status': data.get('status', 'Вільна'),
+            'taken_by': data.get('taken_by', ''),
+            'date_taken': data.get('date_taken', ''),
+            'date_due': data.get('date_due', '')
+        })
+
+    def _insert_events(self, cursor: sqlite3.Cursor, events: List[tuple]) -> None:
+        """Записує події [(territory_id, event, payload), ...] і прибирає найстаріші (без commit)"""
+        if not events:
+            return
+        now = time.time()
+        cursor.executemany('''
+        INSERT INTO territory_events (territory_id, event, payload, created_at)
+        VALUES (?, ?, ?, ?)
+        ''', [(territory_id, event, json.dumps(payload, ensure_ascii=False), now)
+              for territory_id, event, payload in events])
+        cursor.execute('DELETE FROM territory_events WHERE id <= (SELECT MAX(id) FROM territory_events) - ?',
+                       (EVENTS_KEEP,))
+
+    def _notify_events(self) -> None:
+        with self._events_condition:
+            self._events_seq += 1
+            self._events_condition.notify_all()
+
+    def wait_for_events(self, seen_seq: int, timeout: float) -> int:
+        """
+        Чекає на коміт з подіями в цьому процесі (не довше timeout секунд) і повертає
+        поточний лічильник; зміни інших процесів видно лише через get_events_after.
+        """
+        with self._events_condition:
+            self._events_condition.wait_for(lambda: self._events_seq != seen_seq, timeout)
+            return self._events_seq
+
+    def events_seq(self) -> int:
+        with self._events_condition:
+            return self._events_seq
+
+    def last_event_id(self) -> int:
+        """id останньої події (0, якщо подій ще не було)"""
+        try:
+            row = self._connect().execute('SELECT MAX(id) FROM territory_events').fetchone()
+            return row[0] or 0
+        except Exception as e:
+            logger.error(f"Помилка отримання останньої події: {str(e)}")
+            raise
+
+    def get_events_after(self, last_id: int, limit: int = 200) -> Optional[List[Dict]]:
+        """
+        Події з id > last_id у порядку id. None - подій після last_id вже немає
+        (клієнт надто довго був офлайн), тож сторінку треба перезавантажити.
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.execute('''
+            SELECT id, event, payload FROM territory_events
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            ''', (int(last_id), int(limit)))
+            rows = cursor.fetchall()
+            # id подій йдуть підряд, тож пропуск означає, що частину вже видалено;
+            # id клієнта більший за останній - базу відновлено з копії
+            if rows and rows[0][0] > last_id + 1:
+                return None
+            if not rows and last_id > self.last_event_id():
+                return None
+            return [{'id': row[0], 'event': row[1], 'data': json.loads(row[2])} for row in rows]
+        except Exception as e:
+            logger.error(f"Помилка отримання подій після {last_id}: {str(e)}")
+            raise
+
+    def _sheet_payload(self, territory_id: int, data: Dict) -> Optional[Dict]:
+        """Зміна для Google таблиці за новими даними території (None - синхронізувати нічого)"""
+        if data.get('status') == 'Взято':
+            # Якщо територія взята, додаємо нову видачу
+            return {
+                'territory_id': territory_id,
+                'taken_by': data.get('taken_by', ''),
+                'date_taken': data.get('date_taken', ''),
+                'date_due': data.get('date_due', ''),
+                'returned': False
+            }
+        elif data.get('status') == 'Вільна':
+            # Якщо територія повернута, додаємо дату повернення
+            return {
+                'territory_id': territory_id,
+                'taken_by': '',
+                'date_taken': '',
+                'date_due': datetime.now().strftime('%d.%m.%Y'),
+                'returned': True
+            }
+        return None
+
+    def _enqueue_sheet_updates(self, cursor: sqlite3.Cursor, payloads: List[Dict]) -> None:
+        """Додає зміни в чергу синхронізації з Google таблицею (без commit)"""
+        now = time.time()
+        cursor.executemany('''
+        INSERT INTO sheets_outbox (territory_id, payload, created_at)
+        VALUES (?, ?, ?)
+        ''', [(payload['territory_id'], json.dumps(payload, ensure_ascii=False), now) for payload in payloads])
+
+    def _enqueue_sheet_update(self, cursor: sqlite3.Cursor, territory_id: int, data: Dict) -> None:
+        """Додає зміну території в чергу синхронізації з Google таблицею (без commit)"""
+        payload = self._sheet_payload(territory_id, data)
+        if payload:
+            self._enqueue_sheet_updates(cursor, [payload])
+
+    def add_outbox_listener(self, callback) -> None:
+        """Реєструє колбек, який викликається після додавання змін у чергу"""
+        self._outbox_listeners.append(callback)
+
+    def _notify_outbox(self) -> None:
+        for callback in self._outbox_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Помилка сповіщення обробника черги: {str(e)}")
+
+    def claim_outbox_items(self, limit: int = 200, lease_seconds: float = 60) -> List[Dict]:
+        """Забирає готові до відправки записи черги, блокуючи їх на lease_seconds"""
+        try:
+            conn = self._connect()
             cursor = conn.cursor()
+            now = time.time()
             
-            cursor.execute('DELETE FROM history WHERE territory_id = ?', (territory_id,))
+            # BEGIN IMMEDIATE, щоб кілька процесів не забрали ті самі записи
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+            SELECT id, territory_id, payload, attempts, created_at
+            FROM sheets_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ? AND locked_until <= ?
+              AND NOT EXISTS (
+                  -- Зберігаємо порядок змін території: не обганяємо попередні записи, що чекають повтору
+                  SELECT 1 FROM sheets_outbox AS earlier
+                  WHERE earlier.territory_id = sheets_outbox.territory_id
+                    AND earlier.id < sheets_outbox.id
+                    AND earlier.status = 'pending'
+                    AND (earlier.next_attempt_at > ? OR earlier.locked_until > ?)
+              )
+            ORDER BY id
+            LIMIT ?
+            ''', (now, now, now, now, limit))
+            rows = cursor.fetchall()
             
+            if rows:
+                cursor.executemany(
+                    'UPDATE sheets_outbox SET locked_until = ? WHERE id = ?',
+                    [(now + lease_seconds, row[0]) for row in rows]
+                )
             conn.commit()
-            conn.close()
+            
+            return [{
+                'id': row[0],
+                'territory_id': row[1],
+                'payload': json.loads(row[2]),
+                'attempts': row[3],
+                'created_at': row[4]
+            } for row in rows]
         except Exception as e:
-            logger.error(f"Помилка очищення історії території {territory_id}: {str(e)}")
-            raise 
\ No newline at end of file
+            self._rollback()
+            logger.error(f"Помилка отримання записів черги синхронізації: {str(e)}")
+            raise
+
+    def complete_outbox_item(self, item_id: int) -> None:
+        """Видаляє успішно відправлений запис з черги"""
+        self.complete_outbox_items([item_id])
+
+    def complete_outbox_items(self, item_ids: List[int]) -> None:
+        """Видаляє успішно відправлені записи з черги"""
+        try:
+            conn = self._connect()
+            conn.executemany('DELETE FROM sheets_outbox WHERE id = ?', [(item_id,) for item_id in item_ids])
+            conn.commit()
+        except Exception as e:
+            self._rollback()
+            logger.error(f"Помилка видалення записів черги {item_ids}: {str(e)}")
+            raise
+
+    def fail_outbox_item(self, item_id: int, error: str, retry_at: Optional[float]) -> None:
+        """Записує невдалу спробу; якщо retry_at не задано - запис позначається як failed"""
+        try:
+            conn = self._connect()
+            conn.execute('''
+            UPDATE sheets_outbox
+            SET attempts = attempts + 1, last_error = ?, locked_until = 0,
+                next_attempt_at = ?, status = ?
+            WHERE id = ?
+            ''', (
+                error[:500],
+                retry_at or 0,
+                'pending' if retry_at is not None else 'failed',
+                item_id
+            ))
+            conn.commit()
+        except Exception as e:
+            self._rollback()
+            logger.error(f"Помилка оновлення запису черги {item_id}: {str(e)}")
+            raise
+
+    def get_outbox_status(self) -> Dict:
+        """Стан черги синхронізації: глибина та найстаріший запис, що очікує"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT status, COUNT(*) FROM sheets_outbox GROUP BY status
+            ''')
+            counts = dict(cursor.fetchall())
+            
+            cursor.execute('''
+            SELECT id, territory_id, attempts, created_at, next_attempt_at, last_error
+            FROM sheets_outbox
+            WHERE status = 'pending'
+            ORDER BY id
+            LIMIT 1
+            ''')
+            row = cursor.fetchone()
+            oldest = None
+            if row:
+                oldest = {
+                    'id': row[0],
+                    'territory_id': row[1],
+                    'attempts': row[2],
+                    'created_at': datetime.fromtimestamp(row[3]).isoformat(timespec='seconds'),
+                    'age_seconds': round(time.time() - row[3], 1),
+                    'next_attempt_at': datetime.fromtimestamp(row[4]).isoformat(timespec='seconds') if row[4] else None,
+                    'last_error': row[5]
+                }
+            
+            return {
+                'pending': counts.get('pending', 0),
+                'failed': counts.get('failed', 0),
+                'oldest_pending': oldest
+            }
+        except Exception as e:
+            logger.error(f"Помилка отримання стану черги синхронізації: {str(e)}")
+            raise
@@ -0,0 +1,113 @@
+"""
+Профілювання холодного старту.
+
+З STARTUP_PROFILE=true застосунок записує час імпорту кожного модуля верхнього
+рівня і тривалість етапів ініціалізації (phase) та виводить звіт у лог.
+Запуск `python startup_profile.py` додатково показує найповільніші модулі
+за даними `python -X importtime -c "import app"`.
+"""
+import os
+import sys
+import time
+import builtins
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROCESS_START = time.perf_counter()
+ENABLED = os.environ.get('STARTUP_PROFILE', 'False').lower() == 'true'
+
+_records = []
+_lock = threading.Lock()
+_import_depth = threading.local()
+_original_import = builtins.__import__
+
+
+def _record(kind, name, duration):
+    with _lock:
+        _records.append((kind, name, duration))
+
+
+def _timed_import(name, *args, **kwargs):
+    depth = getattr(_import_depth, 'value', 0)
+    if depth or name in sys.modules:
+        _import_depth.value = depth + 1
+        try:
+            return _original_import(name, *args, **kwargs)
+        finally:
+            _import_depth.value = depth
+    # Рахуємо лише перший імпорт модулів верхнього рівня (з вкладеними імпортами)
+    _import_depth.value = 1
+    started = time.perf_counter()
+    try:
+        return _original_import(name, *args, **kwargs)
+    finally:
+        _import_depth.value = 0
+        _record('import', name, time.perf_counter() - started)
+
+
+def install_import_timer():
+    """Починає вимірювати час імпорту модулів (якщо профілювання увімкнене)"""
+    if ENABLED and builtins.__import__ is not _timed_import:
+        builtins.__import__ = _timed_import
+
+
+def uninstall_import_timer():
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+
+
+@contextmanager
+def phase(name):
+    """Вимірює етап ініціалізації"""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record('phase', name, time.perf_counter() - started)
+
+
+def report(label='Старт'):
+    """Виводить у лог звіт по імпортах та етапах, відсортований за тривалістю"""
+    if not ENABLED:
+        return
+    uninstall_import_timer()
+    with _lock:
+        records = sorted(_records, key=lambda record: record[2], reverse=True)
+    lines = [f"{label}: {(time.perf_counter() - PROCESS_START) * 1000:.1f} мс від старту процесу"]
+    for kind, name, duration in records:
+        lines.append(f"  {duration * 1000:8.1f} мс  {kind:6}  {name}")
+    logger.info("\n".join(lines))
+
+
+def importtime_report(module='app', top=25):
+    """Запускає `python -X importtime` і повертає найповільніші модулі (сукупний час, мкс)"""
+    env = dict(os.environ, STARTUP_PROFILE='true', SHEETS_SYNC_ENABLED='False')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=env
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        if not self_us.strip().isdigit():
+            continue  # заголовок
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top], result.stderr
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    rows, _ = importtime_report()
+    print("Найповільніші імпорти (сукупний час):")
+    for cumulative_us, self_us, name in rows:
+        print(f"  {cumulative_us / 1000:8.1f} мс  (власний {self_us / 1000:6.1f} мс)  {name}")
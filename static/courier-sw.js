@@ -0,0 +1,179 @@
+// Service worker кур'єрського режиму: сторінка /courier і офлайн-пакет територій.
+//
+// Пакет (вільні території з мініатюрами) зберігається в Cache Storage. Під час
+// синхронізації воркер надсилає серверу версії записів, які вже має, отримує
+// лише змінені записи і видалені id та завантажує мініатюри тільки для змінених.
+// Без мережі сторінка /courier віддається з кешу і малюється з пакета.
+
+const SHELL_CACHE = 'courier-shell-v1';
+const PACK_CACHE = 'courier-pack';
+const IMAGE_CACHE = 'courier-images';
+const PAGE_URL = '/courier';
+const PACK_URL = '/courier/pack';
+const SHELL_URLS = ['/static/css/style.css', '/courier/manifest.webmanifest', '/static/icons/courier.svg'];
+// Погана мережа в під'їзді: довше не чекаємо і показуємо збережену сторінку
+const NETWORK_TIMEOUT_MS = 4000;
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then(cache => cache.addAll(SHELL_URLS))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys
+        .filter(key => key.startsWith('courier-shell-') && key !== SHELL_CACHE)
+        .map(key => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+function fetchWithTimeout(request, options = {}) {
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), NETWORK_TIMEOUT_MS);
+  return fetch(request, {...options, signal: controller.signal}).finally(() => clearTimeout(timer));
+}
+
+async function readPack() {
+  const cache = await caches.open(PACK_CACHE);
+  const response = await cache.match(PACK_URL);
+  return response ? response.json() : {version: null, entries: []};
+}
+
+async function writePack(pack) {
+  const cache = await caches.open(PACK_CACHE);
+  await cache.put(PACK_URL, new Response(JSON.stringify(pack), {
+    headers: {'Content-Type': 'application/json'}
+  }));
+}
+
+async function downloadPack() {
+  const pack = await readPack();
+  const have = {};
+  pack.entries.forEach(entry => { if (entry.version) have[entry.id] = entry.version; });
+
+  const response = await fetchWithTimeout(PACK_URL, {
+    method: 'POST',
+    credentials: 'same-origin',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({version: pack.version, have})
+  });
+  if (!response.ok || response.redirected) {
+    throw new Error(`Пакет недоступний: ${response.status}`);
+  }
+  const diff = await response.json();
+  if (diff.version === pack.version && !diff.changed.length && !diff.removed.length) {
+    return {pack, downloaded: 0};
+  }
+
+  const images = await caches.open(IMAGE_CACHE);
+  const entries = new Map(pack.entries.map(entry => [entry.id, entry]));
+  diff.removed.forEach(id => entries.delete(id));
+  let downloaded = 0;
+  let complete = true;
+  for (const entry of diff.changed) {
+    // URL мініатюри містить хеш вмісту, тож уже збережене фото не змінилось
+    if (entry.thumb && !(await images.match(entry.thumb))) {
+      try {
+        await images.add(entry.thumb);
+        downloaded += 1;
+      } catch (err) {
+        // Без версії запис буде запитано знову під час наступної синхронізації
+        entry.version = null;
+        complete = false;
+      }
+    }
+    entries.set(entry.id, entry);
+  }
+
+  // Фото територій, яких більше немає в пакеті, видаляємо з кешу
+  const thumbs = new Set(Array.from(entries.values())
+    .filter(entry => entry.thumb)
+    .map(entry => new URL(entry.thumb, self.location.origin).href));
+  for (const request of await images.keys()) {
+    if (!thumbs.has(request.url)) await images.delete(request);
+  }
+
+  const updated = {
+    version: complete ? diff.version : null,
+    entries: Array.from(entries.values()).sort((a, b) => a.id - b.id),
+    synced_at: Date.now()
+  };
+  await writePack(updated);
+  return {pack: updated, downloaded};
+}
+
+let syncing = null;
+
+function syncPack() {
+  // Кілька вкладок просять синхронізацію одночасно - виконуємо один раз
+  if (!syncing) {
+    syncing = downloadPack().finally(() => { syncing = null; });
+  }
+  return syncing;
+}
+
+self.addEventListener('message', event => {
+  if (!event.data || event.data.type !== 'sync') return;
+  const client = event.source;
+  event.waitUntil(syncPack()
+    .then(result => client.postMessage({type: 'pack', pack: result.pack, downloaded: result.downloaded, offline: false}))
+    .catch(async () => client.postMessage({type: 'pack', pack: await readPack(), downloaded: 0, offline: true})));
+});
+
+async function courierPage(request) {
+  const cache = await caches.open(SHELL_CACHE);
+  try {
+    const response = await fetchWithTimeout(request);
+    if (response.ok && !response.redirected) {
+      await cache.put(PAGE_URL, response.clone());
+    }
+    return response;
+  } catch (err) {
+    const cached = await cache.match(PAGE_URL);
+    if (!cached) throw err;
+    // Позначка для сторінки: картки треба намалювати з пакета
+    const html = (await cached.text()).replace('<html lang="uk">', '<html lang="uk" data-offline="1">');
+    return new Response(html, {headers: cached.headers});
+  }
+}
+
+async function cacheFirst(request, cacheName) {
+  const cached = await caches.match(request, {cacheName});
+  return cached || fetch(request);
+}
+
+async function networkFirst(request, cacheName) {
+  const cache = await caches.open(cacheName);
+  try {
+    const response = await fetchWithTimeout(request);
+    if (response.ok) await cache.put(request, response.clone());
+    return response;
+  } catch (err) {
+    const cached = await cache.match(request);
+    if (!cached) throw err;
+    return cached;
+  }
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (request.method !== 'GET' || url.origin !== self.location.origin) return;
+
+  if (request.mode === 'navigate' && url.pathname === PAGE_URL) {
+    event.respondWith(courierPage(request));
+  } else if (url.pathname === PACK_URL) {
+    event.respondWith(fetchWithTimeout(request).catch(() => caches.match(PACK_URL, {cacheName: PACK_CACHE})
+      .then(cached => cached || Response.error())));
+  } else if (url.pathname.startsWith('/img/') || url.searchParams.has('v')) {
+    // Фото з хешем у URL не змінюються
+    event.respondWith(cacheFirst(request, IMAGE_CACHE));
+  } else if (SHELL_URLS.includes(url.pathname)) {
+    event.respondWith(networkFirst(request, SHELL_CACHE));
+  }
+});
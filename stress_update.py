@@ -0,0 +1,106 @@
+"""
+Навантажувальна перевірка SQLiteDB.update_territory.
+
+Багато потоків одночасно видають і повертають ту саму територію. Кожна зміна
+ставить запис у sheets_outbox у тій самій транзакції, тож порядок id у черзі -
+це порядок комітів. Відтворюючи чергу, рахуємо, якою має бути історія (запис
+з'являється лише при переході 'Взято' -> 'Вільна', з тим, хто брав), і
+порівнюємо з таблицею history.
+
+Запуск: python stress_update.py [потоків] [ітерацій]
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlite_db import SQLiteDB
+
+TERRITORY_ID = 1
+
+
+def worker(db: SQLiteDB, name: str, iterations: int, errors: list) -> None:
+    for i in range(iterations):
+        try:
+            db.update_territory(TERRITORY_ID, {
+                'status': 'Взято',
+                'taken_by': f'{name}-{i}',
+                'date_taken': '01.01.2024',
+                'date_due': '01.05.2024'
+            })
+            db.update_territory(TERRITORY_ID, {'status': 'Вільна'})
+        except Exception as e:
+            errors.append(f'{name}-{i}: {str(e)}')
+
+
+def expected_history(db: SQLiteDB):
+    """Історія, яка випливає з послідовності закомічених змін (черги)"""
+    conn = db._connect()
+    status, holder = 'Вільна', ''
+    expected = []
+    for (payload,) in conn.execute('SELECT payload FROM sheets_outbox ORDER BY id'):
+        change = json.loads(payload)
+        if change['returned']:
+            if status == 'Взято':
+                expected.append(holder)
+            status, holder = 'Вільна', ''
+        else:
+            status, holder = 'Взято', change['taken_by']
+    return expected
+
+
+def main() -> int:
+    threads_count = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    tmp_dir = tempfile.mkdtemp(prefix='stress_update_')
+    try:
+        db = SQLiteDB(os.path.join(tmp_dir, 'territories.db'))
+        conn = db._connect()
+        conn.execute("INSERT INTO territories (id, name, status) VALUES (?, 'Територія 1', 'Вільна')", (TERRITORY_ID,))
+        conn.commit()
+
+        errors = []
+        threads = [
+            threading.Thread(target=worker, args=(db, f't{n}', iterations, errors))
+            for n in range(threads_count)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        expected = expected_history(db)
+        actual = [row[0] for row in conn.execute(
+            'SELECT taken_by FROM history WHERE territory_id = ? ORDER BY id', (TERRITORY_ID,)
+        )]
+        changes = conn.execute('SELECT COUNT(*) FROM sheets_outbox').fetchone()[0]
+        final_status = db.get_territory(TERRITORY_ID)['status']
+        db.close()
+
+        print(f"Потоків: {threads_count}, змін: {changes} за {elapsed:.2f} с "
+              f"({changes / elapsed:.0f} змін/с)")
+        print(f"Помилок: {len(errors)}")
+        for error in errors[:10]:
+            print(f"  {error}")
+        print(f"Записів історії: {len(actual)}, очікувалось: {len(expected)}")
+
+        ok = (
+            not errors
+            and changes == threads_count * iterations * 2
+            and actual == expected
+            and final_status == 'Вільна'
+        )
+        print("Історія узгоджена" if ok else "ПОМИЛКА: історія не узгоджена з послідовністю змін")
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
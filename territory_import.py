@@ -0,0 +1,224 @@
+"""
+Імпорт територій з CSV/XLSX (спільний для import_from_excel, auto_migration та init_db).
+
+Файл читається частинами по IMPORT_CHUNK_SIZE рядків, кожна частина зіставляється
+з поточним станом бази одним merge pandas, а зміни пишуться через executemany
+в одній транзакції. Існуючі території зберігають статус, дати, примітки та
+історію - оновлюється лише назва (і розібрана адреса). З dry_run=True база не
+змінюється, а звіт показує, що було б додано, змінено і видалено.
+
+Запуск: python territory_import.py [файл] [--db шлях] [--dry-run] [--keep-missing]
+"""
+import os
+import sys
+import codecs
+import sqlite3
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+
+from address_parser import ADDRESS_COLUMNS, address_values
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '5000'))
+IMPORT_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+DEFAULT_SOURCE = 'облік територій.csv'
+SOURCE_COLUMNS = ('id', 'custom_name')
+# Скільки змінених назв показувати у текстовому звіті
+REPORT_SAMPLE = 20
+
+
+def _detect_encoding(path: str) -> str:
+    """utf-8-sig, якщо весь файл - коректний UTF-8, інакше cp1251 (експорт з Excel)"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                decoder.decode(block)
+            decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return 'cp1251'
+    return 'utf-8-sig'
+
+
+def _detect_separator(path: str, encoding: str) -> str:
+    with open(path, 'r', encoding=encoding) as f:
+        header = f.readline()
+    return max((';', ',', '\t'), key=header.count)
+
+
+def _read_excel_chunks(path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Аркуш XLSX частинами: openpyxl у режимі read_only не тримає весь файл у пам'яті"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(header)])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_chunks(path: str, chunksize: int = IMPORT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Частини файлу з колонками id (Int64) і custom_name (рядок без зайвих пробілів)"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        chunks = _read_excel_chunks(path, chunksize)
+    else:
+        encoding = _detect_encoding(path)
+        chunks = pd.read_csv(
+            path, sep=_detect_separator(path, encoding), encoding=encoding,
+            usecols=lambda column: column.strip() in SOURCE_COLUMNS,
+            dtype=str, keep_default_na=False, chunksize=chunksize
+        )
+    for chunk in chunks:
+        chunk = chunk.rename(columns=lambda column: str(column).strip())
+        missing = [column for column in SOURCE_COLUMNS if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"У файлі {path} немає колонок: {', '.join(missing)}")
+        ids = pd.to_numeric(chunk['id'], errors='coerce')
+        chunk = pd.DataFrame({
+            'id': ids.astype('Int64'),
+            'custom_name': chunk['custom_name'].fillna('').astype(str).str.strip()
+        })
+        # Рядки без числового id (порожні, підсумки тощо) пропускаємо
+        yield chunk[ids.notna() & (ids % 1 == 0)]
+
+
+def _read_current(conn: sqlite3.Connection) -> pd.DataFrame:
+    current = pd.read_sql_query('SELECT id, custom_name FROM territories', conn)
+    current['id'] = current['id'].astype('Int64')
+    current['custom_name'] = current['custom_name'].fillna('').astype(str)
+    return current
+
+
+def import_territories(source: str = DEFAULT_SOURCE, db_path: str = 'territories.db',
+                       dry_run: bool = False, remove_missing: bool = True,
+                       chunksize: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """
+    Імпортує території з source у базу db_path (таблиця territories має існувати).
+    remove_missing - видаляти території, яких немає у файлі (історія лишається).
+    Повертає звіт {'rows', 'added': [id], 'changed': [{'id', 'old', 'new'}],
+    'removed': [id], 'unchanged', 'duplicates', 'dry_run'}.
+    """
+    conn = sqlite3.connect(db_path, timeout=IMPORT_TIMEOUT_MS / 1000)
+    report = {'rows': 0, 'added': [], 'changed': [], 'removed': [], 'unchanged': 0,
+              'duplicates': 0, 'dry_run': dry_run}
+    try:
+        if not dry_run:
+            # Стан читаємо вже під блокуванням запису, щоб різниця відповідала тому, що пишемо
+            conn.execute('BEGIN IMMEDIATE')
+        current = _read_current(conn)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(territories)')}
+        with_address = set(ADDRESS_COLUMNS) <= columns
+        seen = set()
+
+        for chunk in read_chunks(source, chunksize):
+            report['rows'] += len(chunk)
+            # Повтори id: діє перший рядок (і в межах частини, і між частинами)
+            unique = chunk.drop_duplicates('id')
+            unique = unique[~unique['id'].isin(seen)]
+            report['duplicates'] += len(chunk) - len(unique)
+            seen.update(int(territory_id) for territory_id in unique['id'])
+
+            merged = unique.merge(current, on='id', how='left', suffixes=('', '_current'), indicator=True)
+            is_new = merged['_merge'] == 'left_only'
+            is_changed = ~is_new & (merged['custom_name'] != merged['custom_name_current'])
+            added = merged.loc[is_new, ['id', 'custom_name']]
+            changed = merged.loc[is_changed, ['id', 'custom_name', 'custom_name_current']]
+
+            report['added'] += [int(territory_id) for territory_id in added['id']]
+            report['changed'] += [
+                {'id': int(territory_id), 'old': old, 'new': new}
+                for territory_id, new, old in changed.itertuples(index=False)
+            ]
+            report['unchanged'] += len(merged) - len(added) - len(changed)
+            if dry_run:
+                continue
+
+            rows = [(int(territory_id), name) for territory_id, name in
+                    pd.concat([added, changed[['id', 'custom_name']]]).itertuples(index=False)]
+            # Нові території - вільні; в існуючих змінюється лише назва (і розібрана адреса)
+            if with_address:
+                conn.executemany(f'''
+                INSERT INTO territories (id, name, custom_name, status, {', '.join(ADDRESS_COLUMNS)})
+                VALUES (?, 'Територія ' || ?, ?, 'Вільна', {', '.join('?' * len(ADDRESS_COLUMNS))})
+                ON CONFLICT(id) DO UPDATE SET custom_name = excluded.custom_name,
+                    {', '.join(f'{column} = excluded.{column}' for column in ADDRESS_COLUMNS)}
+                ''', [(territory_id, territory_id, name) + address_values(name) for territory_id, name in rows])
+            else:
+                conn.executemany('''
+                INSERT INTO territories (id, name, custom_name, status)
+                VALUES (?, 'Територія ' || ?, ?, 'Вільна')
+                ON CONFLICT(id) DO UPDATE SET custom_name = excluded.custom_name
+                ''', [(territory_id, territory_id, name) for territory_id, name in rows])
+
+        if remove_missing:
+            removed = current.loc[~current['id'].isin(seen), 'id']
+            report['removed'] = [int(territory_id) for territory_id in removed]
+            if report['removed'] and not dry_run:
+                conn.executemany('DELETE FROM territories WHERE id = ?',
+                                 [(territory_id,) for territory_id in report['removed']])
+
+        if not dry_run:
+            conn.commit()
+        return report
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def format_report(report: Dict) -> str:
+    """Текстовий звіт про імпорт"""
+    title = "Перевірка імпорту (без змін у базі)" if report['dry_run'] else "Імпорт завершено"
+    lines = [
+        f"{title}: рядків у файлі {report['rows']}",
+        f"  додано: {len(report['added'])}, змінено: {len(report['changed'])}, "
+        f"видалено: {len(report['removed'])}, без змін: {report['unchanged']}"
+    ]
+    if report['duplicates']:
+        lines.append(f"  пропущено повторів id: {report['duplicates']}")
+    if report['added']:
+        lines.append(f"  нові id: {', '.join(map(str, report['added'][:REPORT_SAMPLE]))}"
+                     f"{' ...' if len(report['added']) > REPORT_SAMPLE else ''}")
+    for change in report['changed'][:REPORT_SAMPLE]:
+        lines.append(f"  {change['id']}: '{change['old']}' -> '{change['new']}'")
+    if len(report['changed']) > REPORT_SAMPLE:
+        lines.append(f"  ... ще {len(report['changed']) - REPORT_SAMPLE} змін")
+    if report['removed']:
+        lines.append(f"  видалені id: {', '.join(map(str, report['removed'][:REPORT_SAMPLE]))}"
+                     f"{' ...' if len(report['removed']) > REPORT_SAMPLE else ''}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = list(sys.argv[1:] if argv is None else argv)
+    db_path = 'territories.db'
+    if '--db' in args:
+        index = args.index('--db')
+        db_path = args[index + 1]
+        del args[index:index + 2]
+    dry_run = '--dry-run' in args
+    remove_missing = '--keep-missing' not in args
+    files = [arg for arg in args if not arg.startswith('--')]
+    try:
+        report = import_territories(files[0] if files else DEFAULT_SOURCE, db_path,
+                                    dry_run=dry_run, remove_missing=remove_missing)
+    except Exception as e:
+        print(f"Помилка при імпорті даних: {str(e)}")
+        return 1
+    print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Офлайн-пакет територій для кур'єрів: вільні території з мініатюрами фото.
+
+Кожен запис має версію - row_version території і хеш назви, приміток та URL
+мініатюри (у ньому хеш вмісту фото), а версія пакета - хеш версій усіх
+записів. Хеш потрібен, бо row_version після відновлення бази з копії
+повторюється з іншими даними. Service worker
+надсилає версії записів, які вже має, і отримує лише змінені та список
+видалених, тож на телефон завантажуються тільки нові дані і фото.
+"""
+import hashlib
+from typing import Callable, Dict, List, Optional
+
+
+def pack_entry(territory: Dict, thumbnail: Optional[Dict]) -> Dict:
+    """Запис пакета для однієї території (thumbnail - DerivativeStore.thumbnail)"""
+    thumb_url = thumbnail['url'] if thumbnail else None
+    name = territory['name'] or f"Територія {territory['id']}"
+    notes = territory['notes'] or ''
+    fingerprint = hashlib.sha256(
+        '\0'.join((name, notes, thumb_url or '')).encode('utf-8')
+    ).hexdigest()[:16]
+    return {
+        'id': territory['id'],
+        'name': name,
+        'notes': notes,
+        'thumb': thumb_url,
+        'width': thumbnail['width'] if thumbnail else None,
+        'height': thumbnail['height'] if thumbnail else None,
+        'version': f"{territory['row_version']}:{fingerprint}"
+    }
+
+
+def build_pack(territories: List[Dict], thumbnail_for: Callable[[int], Optional[Dict]]) -> Dict:
+    """
+    Пакет {'version', 'entries': [...]} з вільних територій у порядку id.
+    thumbnail_for(id) - мініатюра фото території або None.
+    """
+    entries = [
+        pack_entry(territory, thumbnail_for(territory['id']))
+        for territory in territories if territory['status'] != 'Взято'
+    ]
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(f"{entry['id']}={entry['version']}\n".encode('utf-8'))
+    return {'version': digest.hexdigest()[:16], 'entries': entries}
+
+
+def pack_diff(pack: Dict, have: Dict) -> Dict:
+    """
+    Різниця між пакетом і тим, що вже є в клієнта (have - {id: версія запису}):
+    {'version', 'changed': [нові та змінені записи], 'removed': [id], 'unchanged'}.
+    """
+    have = {str(territory_id): version for territory_id, version in (have or {}).items()}
+    changed = [entry for entry in pack['entries'] if have.get(str(entry['id'])) != entry['version']]
+    current = {str(entry['id']) for entry in pack['entries']}
+    removed = sorted(int(territory_id) for territory_id in have if territory_id not in current)
+    return {
+        'version': pack['version'],
+        'changed': changed,
+        'removed': removed,
+        'unchanged': len(pack['entries']) - len(changed)
+    }